@@ -0,0 +1,65 @@
+"""
+Mede a montagem das URLs de mídia de uma listagem grande com a base de URL
+em cache (core.media) e recalculada a cada imagem, usando o settings real.
+
+    python benchmark_media_urls.py --products 48 --images 6 --rounds 200
+"""
+import argparse
+import os
+import time
+
+import django
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+django.setup()
+
+from catalog.models import Product, ProductImage
+from catalog.serializers import ProductImageSerializer
+from core import media
+
+parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+parser.add_argument('--products', type=int, default=48)
+parser.add_argument('--images', type=int, default=6, help='Imagens por produto')
+parser.add_argument('--rounds', type=int, default=200)
+args = parser.parse_args()
+
+images = [
+    ProductImage(id=p * 100 + i, product=Product(id=p, name=f'Produto {p}'), image=f'products/produto-{p}-{i}.jpg')
+    for p in range(args.products)
+    for i in range(args.images)
+]
+names = [image.image.name for image in images]
+
+
+def per_round(fn):
+    started = time.perf_counter()
+    for _ in range(args.rounds):
+        fn()
+    return (time.perf_counter() - started) / args.rounds * 1000
+
+
+def uncached_urls():
+    for name in names:
+        media.media_base_url.cache_clear()
+        media.media_url(name)
+
+
+def cached_urls():
+    for name in names:
+        media.media_url(name)
+
+
+def serialize():
+    ProductImageSerializer(images, many=True).data
+
+
+print(f"Base das URLs: {media.media_base_url() or 'default_storage.url'}")
+serialize()  # aquecimento
+uncached = per_round(uncached_urls)
+cached = per_round(cached_urls)
+serializer = per_round(serialize)
+
+print(f"{len(images)} imagens, {args.rounds} rodadas (ms por listagem)")
+print(f"  URLs, base recalculada por imagem: {uncached:.3f}")
+print(f"  URLs, base em cache:               {cached:.3f}  ({uncached / cached:.1f}x)")
+print(f"  serializer, base em cache:         {serializer:.2f}")
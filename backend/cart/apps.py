@@ -1,6 +1,25 @@
+import logging
+
 from django.apps import AppConfig
 
+logger = logging.getLogger(__name__)
+
 
 class CartConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'cart'
+
+    def ready(self):
+        from django.conf import settings
+        from django.core.cache import caches
+        from django.core.cache.backends.locmem import LocMemCache
+
+        if getattr(settings, 'CART_STORAGE', 'db') != 'cache':
+            return
+        alias = getattr(settings, 'CART_CACHE_ALIAS', 'default')
+        if isinstance(caches[alias], LocMemCache):
+            # Cada worker do gunicorn teria seus próprios carrinhos e o LocMem despeja chaves sujas
+            logger.error(
+                f"CART_STORAGE='cache' with a LocMemCache ('{alias}'): carts are not shared between "
+                f"workers and evicted carts are lost before flushing. Use Redis (CART_CACHE_ALIAS)."
+            )
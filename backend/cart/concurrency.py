@@ -0,0 +1,111 @@
+"""
+Controle de concorrência do carrinho
+
+Toda escrita em um carrinho passa por locked_cart(), que abre uma transação
+e começa com um UPDATE na linha do Cart (version = version + 1). O UPDATE
+trava a linha no PostgreSQL e pega o lock de escrita no SQLite já no início
+da transação, então escritas concorrentes no mesmo carrinho — em qualquer
+worker ou host — são serializadas pelo banco, sem locks em memória e sem
+laços de retry.
+
+Conflitos:
+- operações relativas (adicionar, remover) são aplicadas uma após a outra
+  sobre o estado mais recente, então nenhuma atualização é perdida;
+- operações absolutas (definir quantidade, sincronizar o carrinho inteiro)
+  podem enviar a versão que o cliente conhece (header If-Match ou campo
+  "version"); se o carrinho mudou desde então a escrita é rejeitada com
+  409 e o cliente recebe o estado atual para refazer a operação.
+"""
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Cart
+
+
+class CartConflict(Exception):
+    """O carrinho mudou desde a versão informada pelo cliente"""
+
+    def __init__(self, cart):
+        super().__init__(f'Cart {cart.pk} is at version {cart.version}')
+        self.cart = cart
+
+
+def get_expected_version(request):
+    """
+    Versão informada pelo cliente (If-Match: "3" ou {"version": 3}).
+    None quando ausente — a escrita é aplicada sobre o estado atual.
+    """
+    raw = request.headers.get('If-Match')
+    if raw:
+        raw = raw.strip()
+        if raw.startswith('W/'):
+            raw = raw[2:]
+        raw = raw.strip('"')
+    elif isinstance(request.data, dict):
+        raw = request.data.get('version')
+    if raw in (None, '', '*'):
+        return None
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_or_create_cart(user=None, session_key=None, queryset=None):
+    """
+    Carrinho do usuário (ou da sessão de convidado). Quando duas requisições
+    criam o carrinho ao mesmo tempo, todas convergem para o de menor id e a
+    cópia vazia é descartada. queryset permite já trazer os itens
+    pré-carregados (ex.: cart.serializers.cart_items_prefetch).
+    """
+    queryset = Cart.objects.all() if queryset is None else queryset
+    if user is not None:
+        carts = queryset.filter(user=user)
+        defaults = {'user': user}
+    elif session_key:
+        carts = queryset.filter(user=None, session_key=session_key)
+        defaults = {'user': None, 'session_key': session_key}
+    else:
+        return None
+
+    cart = carts.order_by('id').first()
+    if cart is not None:
+        return cart
+
+    created = Cart.objects.create(**defaults)
+    cart = carts.order_by('id').first()
+    if cart.pk != created.pk:
+        created.delete()
+    return cart
+
+
+@contextmanager
+def locked_cart(cart, expected_version=None):
+    """
+    Abre uma transação com o carrinho travado e a versão já incrementada.
+
+        with locked_cart(cart, get_expected_version(request)) as cart:
+            ...
+
+    Levanta CartConflict (com o carrinho atual) se expected_version não for
+    a versão corrente; nesse caso nada é gravado.
+    """
+    with transaction.atomic():
+        Cart.objects.filter(pk=cart.pk).update(version=F('version') + 1, updated_at=timezone.now())
+        current = Cart.objects.get(pk=cart.pk)
+        if expected_version is not None and current.version - 1 != expected_version:
+            current.version -= 1
+            raise CartConflict(current)
+        yield current
+
+
+def discard_cart_write(cart):
+    """
+    Desfaz a transação aberta por locked_cart quando nada mudou, para que
+    a versão do carrinho só avance em escritas reais.
+    """
+    transaction.set_rollback(True)
+    cart.version -= 1
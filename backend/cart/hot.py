@@ -0,0 +1,484 @@
+"""
+Armazenamento quente do carrinho (CART_STORAGE = 'cache')
+
+Os carrinhos ativos ficam no cache (CART_CACHE_ALIAS: LocMem, Redis ou
+qualquer backend do Django), indexados pelo dono — 'u<id do usuário>' ou
+'s<session key>'. As tabelas Cart/CartItem continuam sendo o armazenamento
+durável:
+
+- na primeira leitura o carrinho é carregado do banco (se existir);
+- escritas só alteram o cache e registram o dono no índice de sujos
+  (sorted set no Redis; nos demais backends, dicionários repartidos em
+  DIRTY_SHARDS chaves, cada uma com seu lock) antes de gravar o estado;
+- carrinhos sujos são gravados no banco em segundo plano, CART_HOT_FLUSH_DELAY
+  segundos depois da primeira escrita: por padrão (CART_HOT_FLUSH = 'thread',
+  o deploy não roda worker nem beat do Celery) um threading.Timer no próprio
+  processo, rearmado enquanto sobrar carrinho sujo; com 'celery' a tarefa
+  cart.tasks.flush_hot_carts com countdown (sem broker, cai no timer). Também
+  são gravados antes da validação do checkout e do merge após o login.
+
+O cache precisa ser compartilhado entre os workers e não pode despejar
+chaves sujas: com LocMem (por processo, MAX_ENTRIES) cada worker vê outros
+carrinhos e um carrinho despejado antes do flush se perde — o app loga um
+erro na inicialização (cart.apps).
+
+Todo carrinho alterado chega ao banco cerca de CART_HOT_FLUSH_DELAY
+segundos depois, inclusive os de convidados abandonados; o cache só poupa
+as escritas intermediárias. No modo 'cache' o "id" de cada item é o id da
+variante.
+
+Escritas no mesmo carrinho são serializadas por um lock no cache
+(cache.add), com espera curta; a versão do carrinho segue as mesmas regras
+de If-Match de cart.concurrency.
+"""
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from decimal import Decimal
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.db import connection
+
+from core.celery import try_apply_async
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'cart:hot'
+DIRTY_KEY = f'{KEY_PREFIX}:dirty'
+DIRTY_SHARDS = 64
+TTL = 30 * 24 * 3600
+LOCK_TIMEOUT = 10
+LOCK_WAIT = 3
+
+FLUSH_QUEUED_KEY = f'{KEY_PREFIX}:flush-queued'
+
+# Locks em processo (pool fixo, reentrantes): evita que threads do mesmo worker disputem o lock do cache
+_LOCAL_LOCKS = [threading.RLock() for _ in range(64)]
+
+_timer_lock = threading.Lock()
+_timer = None
+
+
+class CartBusy(Exception):
+    """Não foi possível obter o lock do carrinho a tempo"""
+
+
+class HotCartConflict(Exception):
+    """O carrinho mudou desde a versão informada pelo cliente"""
+
+    def __init__(self, state):
+        super().__init__(f"Cart {state['owner']} is at version {state['version']}")
+        self.state = state
+
+
+class HotStockError(Exception):
+    def __init__(self, current, available):
+        super().__init__()
+        self.current = current
+        self.available = available
+
+
+def hot_cart_enabled():
+    return getattr(settings, 'CART_STORAGE', 'db') == 'cache'
+
+
+def hot_cart_view(hot_view):
+    """Desvia a view para hot_view quando CART_STORAGE = 'cache'"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if hot_cart_enabled():
+                return hot_view(request, *args, **kwargs)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def cart_owner(user=None, session_key=None):
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}'
+    if session_key:
+        return f's{session_key}'
+    return None
+
+
+def _owner_filter(owner):
+    if owner.startswith('u'):
+        return {'user_id': int(owner[1:])}
+    return {'user': None, 'session_key': owner[1:]}
+
+
+def _shard(key, count):
+    return int(hashlib.md5(key.encode()).hexdigest()[:8], 16) % count
+
+
+def _item_data(item, variant_id):
+    from .serializers import CartItemSerializer
+
+    data = dict(CartItemSerializer(item).data)
+    data['id'] = variant_id
+    return data
+
+
+class HotCartStore:
+    def __init__(self, cache=None):
+        self.cache = cache or caches[getattr(settings, 'CART_CACHE_ALIAS', 'default')]
+
+    @staticmethod
+    def _key(owner):
+        return f'{KEY_PREFIX}:{owner}'
+
+    @contextmanager
+    def _lock(self, key):
+        local = _LOCAL_LOCKS[_shard(key, len(_LOCAL_LOCKS))]
+        if not local.acquire(timeout=LOCK_WAIT):
+            raise CartBusy(key)
+        try:
+            lock_key = f'{key}:lock'
+            token = uuid.uuid4().hex
+            deadline = time.monotonic() + LOCK_WAIT
+            while not self.cache.add(lock_key, token, LOCK_TIMEOUT):
+                if time.monotonic() > deadline:
+                    raise CartBusy(key)
+                time.sleep(0.01)
+            try:
+                yield
+            finally:
+                if self.cache.get(lock_key) == token:
+                    self.cache.delete(lock_key)
+        finally:
+            local.release()
+
+    # ---- leitura ----
+
+    def _load(self, owner):
+        """Estado inicial a partir do banco (sem criar o carrinho)"""
+        from .models import Cart
+        from .serializers import cart_items_prefetch
+
+        cart = (
+            Cart.objects.filter(**_owner_filter(owner))
+            .prefetch_related(cart_items_prefetch())
+            .order_by('id')
+            .first()
+        )
+        items = []
+        if cart is not None:
+            items = [_item_data(item, item.variant_id) for item in cart.items.all()]
+        return {
+            'owner': owner,
+            'cart_id': cart.pk if cart else None,
+            'version': cart.version if cart else 0,
+            'items': items,
+            'dirty': False,
+        }
+
+    def get(self, owner):
+        key = self._key(owner)
+        state = self.cache.get(key)
+        if state is None:
+            state = self._load(owner)
+            if not self.cache.add(key, state, TTL):
+                state = self.cache.get(key) or state
+        return state
+
+    # ---- escrita ----
+
+    def _redis_dirty(self):
+        """Cliente Redis e chave do sorted set de sujos, ou None fora do Redis"""
+        try:
+            from django.core.cache.backends.redis import RedisCache
+        except ImportError:
+            return None
+        if not isinstance(self.cache, RedisCache):
+            return None
+        key = self.cache.make_and_validate_key(DIRTY_KEY)
+        return self.cache._cache.get_client(key, write=True), key
+
+    def _dirty_shard_key(self, owner):
+        return f'{DIRTY_KEY}:{_shard(owner, DIRTY_SHARDS)}'
+
+    def _mark_dirty(self, owner):
+        redis = self._redis_dirty()
+        if redis is not None:
+            client, key = redis
+            client.zadd(key, {owner: time.time()}, nx=True)
+            return
+        shard_key = self._dirty_shard_key(owner)
+        if owner in (self.cache.get(shard_key) or {}):
+            return
+        with self._lock(shard_key):
+            dirty = self.cache.get(shard_key) or {}
+            if owner not in dirty:
+                dirty[owner] = time.time()
+                self.cache.set(shard_key, dirty, None)
+
+    def _unmark_dirty(self, owner):
+        redis = self._redis_dirty()
+        if redis is not None:
+            client, key = redis
+            client.zrem(key, owner)
+            return
+        shard_key = self._dirty_shard_key(owner)
+        with self._lock(shard_key):
+            dirty = self.cache.get(shard_key) or {}
+            if dirty.pop(owner, None) is not None:
+                self.cache.set(shard_key, dirty, None)
+
+    def _dirty_owners(self, limit):
+        """Donos sujos desde antes de limit (timestamp)"""
+        redis = self._redis_dirty()
+        if redis is not None:
+            client, key = redis
+            return [owner.decode() if isinstance(owner, bytes) else owner
+                    for owner in client.zrangebyscore(key, '-inf', limit)]
+        owners = []
+        for dirty in self.cache.get_many(
+            [f'{DIRTY_KEY}:{shard}' for shard in range(DIRTY_SHARDS)]
+        ).values():
+            owners.extend(owner for owner, since in dirty.items() if since <= limit)
+        return owners
+
+    def update(self, owner, mutate, expected_version=None):
+        """
+        Aplica mutate(items) sob o lock do carrinho. mutate altera a lista
+        de itens no lugar e retorna True se algo mudou.
+        """
+        key = self._key(owner)
+        with self._lock(key):
+            state = self.get(owner)
+            if expected_version is not None and state['version'] != expected_version:
+                raise HotCartConflict(state)
+            if mutate(state['items']):
+                # Entra no índice antes de gravar o estado: se falhar, o cache não fica sujo sem flush
+                self._mark_dirty(owner)
+                state['version'] += 1
+                state['dirty'] = True
+                self.cache.set(key, state, TTL)
+                schedule_flush(self.cache)
+        return state
+
+    def add(self, owner, variant, quantity, image_url='', expected_version=None):
+        from .models import CartItem
+
+        def mutate(items):
+            for item in items:
+                if item['variant'] == variant.id:
+                    if item['quantity'] + quantity > variant.stock:
+                        raise HotStockError(item['quantity'], variant.stock)
+                    item['quantity'] += quantity
+                    item['stock'] = variant.stock
+                    return True
+            product = variant.product
+            items.append(_item_data(CartItem(
+                variant=variant,
+                product_name=product.name,
+                unit_price=variant.price or product.base_price,
+                quantity=quantity,
+                size=variant.size or '',
+                color=variant.color or '',
+                sku=variant.sku or '',
+                image_url=image_url,
+                product_id=product.id,
+            ), variant.id))
+            return True
+
+        return self.update(owner, mutate, expected_version)
+
+    def set_quantity(self, owner, variant_id, quantity, stock=None, expected_version=None):
+        """quantity <= 0 remove o item; retorna None se a variante não está no carrinho"""
+        found = []
+
+        def mutate(items):
+            for idx, item in enumerate(items):
+                if item['variant'] == variant_id:
+                    found.append(item)
+                    if quantity <= 0:
+                        del items[idx]
+                        return True
+                    if stock is not None and quantity > stock:
+                        raise HotStockError(item['quantity'], stock)
+                    changed = item['quantity'] != quantity
+                    item['quantity'] = quantity
+                    return changed
+            return False
+
+        state = self.update(owner, mutate, expected_version)
+        return state if found else None
+
+    def clear(self, owner, expected_version=None):
+        def mutate(items):
+            changed = bool(items)
+            items.clear()
+            return changed
+
+        return self.update(owner, mutate, expected_version)
+
+    def replace(self, owner, desired, variants, replace=True, expected_version=None):
+        """
+        Mesmo contrato de cart.sync.apply_cart_delta: desired é
+        {variant_id: quantidade}; variants traz as variantes novas
+        (com produto e imagens pré-carregados).
+        Retorna (estado, itens criados/alterados, ids removidos).
+        """
+        from .sync import new_cart_item
+
+        changed, removed = [], []
+
+        def mutate(items):
+            kept = []
+            present = set()
+            for item in items:
+                quantity = desired.get(item['variant'], 0 if replace else item['quantity'])
+                if quantity <= 0:
+                    removed.append(item['id'])
+                    continue
+                if quantity != item['quantity']:
+                    item['quantity'] = quantity
+                    changed.append(item)
+                present.add(item['variant'])
+                kept.append(item)
+            for variant in variants:
+                quantity = desired.get(variant.id, 0)
+                if quantity > 0 and variant.id not in present:
+                    item = _item_data(new_cart_item(None, variant, quantity), variant.id)
+                    changed.append(item)
+                    kept.append(item)
+            items[:] = kept
+            return bool(changed or removed)
+
+        state = self.update(owner, mutate, expected_version)
+        return state, changed, removed
+
+    # ---- persistência ----
+
+    def flush(self, owner):
+        """Grava o carrinho no banco (se estiver sujo). Retorna True se gravou."""
+        from .concurrency import get_or_create_cart, locked_cart
+        from .sync import apply_cart_delta
+
+        key = self._key(owner)
+        with self._lock(key):
+            state = self.cache.get(key)
+            if state is None or not state['dirty']:
+                self._unmark_dirty(owner)
+                return False
+            lookup = _owner_filter(owner)
+            if 'user_id' in lookup:
+                cart = get_or_create_cart(user=get_user_model()(pk=lookup['user_id']))
+            else:
+                cart = get_or_create_cart(session_key=lookup['session_key'])
+            desired = {item['variant']: item['quantity'] for item in state['items']}
+            with locked_cart(cart) as cart:
+                apply_cart_delta(cart, desired, replace=True)
+            state['cart_id'] = cart.pk
+            state['dirty'] = False
+            self.cache.set(key, state, TTL)
+            self._unmark_dirty(owner)
+        return True
+
+    def has_dirty(self):
+        return bool(self._dirty_owners(time.time()))
+
+    def flush_dirty(self, older_than=0):
+        """Grava os carrinhos sujos há mais de older_than segundos"""
+        flushed = 0
+        for owner in self._dirty_owners(time.time() - older_than):
+            try:
+                flushed += self.flush(owner)
+            except CartBusy:
+                continue
+            except Exception as e:
+                logger.error(f"Error flushing hot cart {owner}: {e}")
+        return flushed
+
+    def evict(self, owner):
+        """Descarta o estado em cache (a próxima leitura recarrega do banco)"""
+        key = self._key(owner)
+        with self._lock(key):
+            self.cache.delete(key)
+            self._unmark_dirty(owner)
+
+    # ---- resposta ----
+
+    @staticmethod
+    def to_response(state):
+        """Mesmo formato de CartSerializer"""
+        lookup = _owner_filter(state['owner'])
+        items = state['items']
+        return {
+            'id': state['cart_id'],
+            'user': lookup.get('user_id'),
+            'session_key': lookup.get('session_key', ''),
+            'version': state['version'],
+            'items': items,
+            'subtotal': sum((Decimal(str(item['unit_price'])) * item['quantity'] for item in items), Decimal('0')),
+            'total_items': sum(item['quantity'] for item in items),
+        }
+
+
+_store = None
+
+
+def get_hot_cart_store():
+    global _store
+    if _store is None:
+        _store = HotCartStore()
+    return _store
+
+
+def _flush_delay():
+    return getattr(settings, 'CART_HOT_FLUSH_DELAY', 60)
+
+
+def schedule_flush(cache=None):
+    """Agenda a gravação dos carrinhos sujos para daqui a CART_HOT_FLUSH_DELAY segundos"""
+    if getattr(settings, 'CART_HOT_FLUSH', 'thread') == 'celery':
+        cache = cache or get_hot_cart_store().cache
+        # Uma tarefa por janela para todos os workers
+        if not cache.add(FLUSH_QUEUED_KEY, 1, _flush_delay()):
+            return
+        from .tasks import flush_hot_carts
+        if try_apply_async(flush_hot_carts, countdown=_flush_delay()):
+            return
+        cache.delete(FLUSH_QUEUED_KEY)
+    _start_timer()
+
+
+def _start_timer(delay=None):
+    global _timer
+    with _timer_lock:
+        if _timer is None:
+            _timer = threading.Timer(_flush_delay() if delay is None else delay, _run_timer)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _run_timer():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    store = get_hot_cart_store()
+    try:
+        store.flush_dirty(older_than=_flush_delay())
+    except Exception as e:
+        logger.error(f"Error flushing hot carts: {e}", exc_info=True)
+    finally:
+        connection.close()
+    # Carrinhos que ficaram sujos depois da primeira escrita: próxima rodada
+    if store.has_dirty():
+        _start_timer()
+
+
+def flush_hot_cart(user=None, session_key=None):
+    """Persiste o carrinho quente do dono (no-op com CART_STORAGE = 'db')"""
+    owner = cart_owner(user, session_key)
+    if owner and hot_cart_enabled():
+        get_hot_cart_store().flush(owner)
+    return owner
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from cart.reservations import reap_expired
+
+
+class Command(BaseCommand):
+    help = 'Remove as reservas de estoque vencidas em lotes e registra os logs de expiração'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=None,
+            help='Reservas por lote (padrão: RESERVATION_REAPER_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=None,
+            help='Pausa em segundos entre lotes (padrão: RESERVATION_REAPER_SLEEP)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            default=None,
+            help='Para depois de N lotes',
+        )
+
+    def handle(self, *args, **options):
+        total = reap_expired(
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            max_batches=options['max_batches'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} reserva(s) vencida(s) removida(s)'))
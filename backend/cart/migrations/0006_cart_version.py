@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0005_cart_abandoned_email_1_sent_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Min, Sum
+
+
+def backfill_counters(apps, schema_editor):
+    StockReservation = apps.get_model('cart', 'StockReservation')
+    VariantReservationCounter = apps.get_model('cart', 'VariantReservationCounter')
+
+    rows = (
+        StockReservation.objects.filter(order_id__isnull=True)
+        .values('variant_id')
+        .annotate(reserved=Sum('quantity'), next_expiry=Min('expires_at'))
+        .order_by()
+    )
+    VariantReservationCounter.objects.bulk_create(
+        [VariantReservationCounter(**row) for row in rows], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cart', '0006_cart_version'),
+        ('catalog', '0005_alter_product_options_alter_productvariant_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VariantReservationCounter',
+            fields=[
+                ('variant', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reservation_counter', serialize=False, to='catalog.productvariant')),
+                ('reserved', models.IntegerField(default=0)),
+                ('next_expiry', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Contador de Reservas',
+                'verbose_name_plural': 'Contadores de Reservas',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockreservation',
+            index=models.Index(fields=['variant', 'expires_at'], name='cart_stockr_variant_a8eaba_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -8,6 +8,8 @@ class Cart(models.Model):
     session_key = models.CharField(max_length=64, blank=True, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True, db_index=True)
+    # Incrementada a cada escrita (ver cart.concurrency)
+    version = models.PositiveIntegerField(default=0)
     
     # Abandoned cart email tracking
     abandoned_email_1_sent = models.BooleanField(default=False, help_text='Email de lembrete 1h enviado')
@@ -47,3 +49,7 @@ class CartItem(models.Model):
         indexes = [
             models.Index(fields=['cart', 'variant']),
         ]
+
+
+# Modelos de reserva ficam em módulo próprio; importados aqui para o registro do app
+from .models_reservation import StockReservation, ReservationLog, VariantReservationCounter  # noqa: E402,F401
@@ -23,6 +23,8 @@ class StockReservation(models.Model):
         indexes = [
             models.Index(fields=['expires_at']),
             models.Index(fields=['session_key']),
+            # Varredura preguiçosa das reservas vencidas de uma variante
+            models.Index(fields=['variant', 'expires_at']),
         ]
     
     def __str__(self):
@@ -31,27 +33,11 @@ class StockReservation(models.Model):
     @classmethod
     def create_reservation(cls, variant, quantity, session_key=None, user=None, minutes=15):
         """
-        Cria uma reserva de estoque com tempo de expiração
+        Cria (ou ajusta) uma reserva de estoque com tempo de expiração.
+        Levanta cart.reservations.InsufficientStock se não houver estoque livre.
         """
-        expires_at = timezone.now() + timedelta(minutes=minutes)
-        
-        # Verificar se já existe uma reserva ativa para esta sessão/usuário
-        existing = cls.get_active_reservation(variant, session_key, user)
-        if existing:
-            # Atualizar a reserva existente
-            existing.quantity = quantity
-            existing.expires_at = expires_at
-            existing.save()
-            return existing
-        
-        # Criar nova reserva
-        reservation = cls.objects.create(
-            variant=variant,
-            quantity=quantity,
-            session_key=session_key or '',
-            user=user,
-            expires_at=expires_at
-        )
+        from .reservations import reserve
+        reservation, created, available = reserve(variant.pk, quantity, session_key, user, minutes)
         return reservation
     
     @classmethod
@@ -78,27 +64,18 @@ class StockReservation(models.Model):
     @classmethod
     def get_reserved_quantity(cls, variant):
         """
-        Retorna a quantidade total reservada para uma variante
+        Retorna a quantidade total reservada para uma variante (contador)
         """
-        now = timezone.now()
-        reserved = cls.objects.filter(
-            variant=variant,
-            expires_at__gt=now,
-            order_id__isnull=True
-        ).aggregate(models.Sum('quantity'))['quantity__sum'] or 0
-        return reserved
+        from .reservations import reserved_quantity
+        return reserved_quantity(variant.pk)
     
     @classmethod
-    def cleanup_expired(cls):
+    def cleanup_expired(cls, max_batches=None):
         """
-        Remove reservas expiradas (executar via cronjob)
+        Remove reservas expiradas em lotes e atualiza os contadores
         """
-        now = timezone.now()
-        expired_count = cls.objects.filter(
-            expires_at__lte=now,
-            order_id__isnull=True
-        ).delete()[0]
-        return expired_count
+        from .reservations import reap_expired
+        return reap_expired(max_batches=max_batches)
     
     @classmethod
     def extend_reservation(cls, reservation_id, minutes=15):
@@ -117,8 +94,8 @@ class StockReservation(models.Model):
         """
         Marca a reserva como convertida em pedido
         """
-        self.order_id = str(order_id)
-        self.save()
+        from .reservations import convert
+        convert(self, order_id)
     
     def is_expired(self):
         """
@@ -134,6 +111,28 @@ class StockReservation(models.Model):
         return self.variant.stock - reserved
 
 
+class VariantReservationCounter(models.Model):
+    """
+    Total reservado (reservas ativas, não convertidas) por variante.
+    Mantido por cart.reservations sob lock da linha; substitui o SUM sobre
+    StockReservation nas checagens de disponibilidade.
+    """
+    variant = models.OneToOneField(
+        ProductVariant, on_delete=models.CASCADE, primary_key=True, related_name='reservation_counter'
+    )
+    reserved = models.IntegerField(default=0)
+    # Limite inferior do próximo vencimento: se já passou, há reservas a varrer
+    next_expiry = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = 'Contador de Reservas'
+        verbose_name_plural = 'Contadores de Reservas'
+    
+    def __str__(self):
+        return f"{self.variant_id}: {self.reserved} reservado(s)"
+
+
 class ReservationLog(models.Model):
     """
     Log de ações de reserva para auditoria
@@ -0,0 +1,321 @@
+"""
+Motor de reservas de estoque
+
+Cada variante tem um VariantReservationCounter com a soma das reservas não
+convertidas em pedido. Invariante: counter.reserved == SUM(quantity) das
+linhas de StockReservation da variante com order_id nulo (vencidas
+incluídas até serem varridas).
+
+Toda alteração começa travando a linha do contador (UPDATE, que pega o
+lock da linha no PostgreSQL e o lock de escrita no SQLite logo no início da
+transação), então checar o disponível e gravar a reserva é atômico: duas
+compras simultâneas da última unidade não passam as duas.
+
+Vencimento preguiçoso: counter.next_expiry é um limite inferior do próximo
+vencimento. Quando já passou, a operação seguinte na variante remove (até
+um lote) as reservas vencidas pelo índice (variant, expires_at) e desconta
+do contador. O reaper (reap_expired, tarefa periódica) varre o resto em
+lotes curtos.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Min, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from catalog.models import ProductVariant
+
+from .models_reservation import ReservationLog, StockReservation, VariantReservationCounter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MINUTES = 15
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available):
+        super().__init__(f'Only {available} available')
+        self.available = available
+
+
+def _lock_counter(variant_id):
+    """Cria (se preciso) e trava o contador da variante; chamar dentro de transaction.atomic"""
+    VariantReservationCounter.objects.bulk_create(
+        [VariantReservationCounter(variant_id=variant_id)], ignore_conflicts=True
+    )
+    VariantReservationCounter.objects.filter(pk=variant_id).update(updated_at=timezone.now())
+    return VariantReservationCounter.objects.get(pk=variant_id)
+
+
+def _next_expiry(variant_id):
+    return (
+        StockReservation.objects.filter(variant_id=variant_id, order_id__isnull=True)
+        .order_by('expires_at')
+        .values_list('expires_at', flat=True)
+        .first()
+    )
+
+
+def _log_expired(reservations):
+    ReservationLog.objects.bulk_create([
+        ReservationLog(
+            variant_id=r.variant_id,
+            action='expired',
+            quantity=r.quantity,
+            session_key=r.session_key,
+            user_id=r.user_id,
+            notes=f'Reserva {r.pk} expirada em {r.expires_at.isoformat()}',
+        )
+        for r in reservations
+    ], batch_size=500)
+
+
+def _sweep(counter, now):
+    """
+    Remove reservas vencidas da variante (contador travado), no máximo um
+    lote (RESERVATION_REAPER_BATCH_SIZE); o restante fica para a próxima
+    operação ou para o reaper. Retorna as removidas.
+    """
+    if counter.next_expiry is None or counter.next_expiry > now:
+        return []
+    expired = list(
+        StockReservation.objects.filter(
+            variant_id=counter.variant_id, expires_at__lte=now, order_id__isnull=True
+        ).order_by('expires_at')[:reaper_batch_size()]
+    )
+    released = sum(r.quantity for r in expired)
+    if expired:
+        StockReservation.objects.filter(pk__in=[r.pk for r in expired]).delete()
+        _log_expired(expired)
+        counter.reserved -= released
+    counter.next_expiry = _next_expiry(counter.variant_id)
+    VariantReservationCounter.objects.filter(pk=counter.pk).update(
+        reserved=F('reserved') - released,
+        next_expiry=counter.next_expiry,
+    )
+    return expired
+
+
+def _owner_filter(session_key=None, user=None):
+    if user is not None and user.is_authenticated:
+        return {'user': user}
+    if session_key:
+        return {'session_key': session_key}
+    return None
+
+
+def reserve(variant_id, quantity, session_key=None, user=None, minutes=DEFAULT_MINUTES):
+    """
+    Cria ou ajusta a reserva do dono (usuário ou sessão) para a variante.
+    Retorna (reserva, criada, disponível após a reserva).
+    Levanta InsufficientStock se não houver estoque livre.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(minutes=minutes)
+    owner = _owner_filter(session_key, user)
+    with transaction.atomic():
+        counter = _lock_counter(variant_id)
+        _sweep(counter, now)
+        stock = ProductVariant.objects.filter(pk=variant_id).values_list('stock', flat=True).get()
+
+        existing = None
+        if owner is not None:
+            existing = StockReservation.objects.filter(
+                variant_id=variant_id, order_id__isnull=True, **owner
+            ).first()
+        delta = quantity - (existing.quantity if existing else 0)
+        available = stock - counter.reserved
+        if delta > available:
+            raise InsufficientStock(available + (existing.quantity if existing else 0))
+
+        if existing:
+            existing.quantity = quantity
+            existing.expires_at = expires_at
+            existing.save(update_fields=['quantity', 'expires_at'])
+            reservation = existing
+        else:
+            reservation = StockReservation.objects.create(
+                variant_id=variant_id,
+                quantity=quantity,
+                session_key=session_key or '',
+                user=user if user is not None and user.is_authenticated else None,
+                expires_at=expires_at,
+            )
+
+        next_expiry = expires_at if counter.next_expiry is None else min(counter.next_expiry, expires_at)
+        VariantReservationCounter.objects.filter(pk=variant_id).update(
+            reserved=F('reserved') + delta, next_expiry=next_expiry
+        )
+    return reservation, existing is None, available - delta
+
+
+def release(reservation):
+    """Cancela a reserva e devolve a quantidade ao disponível"""
+    with transaction.atomic():
+        _lock_counter(reservation.variant_id)
+        deleted, _ = StockReservation.objects.filter(pk=reservation.pk, order_id__isnull=True).delete()
+        if deleted:
+            VariantReservationCounter.objects.filter(pk=reservation.variant_id).update(
+                reserved=F('reserved') - reservation.quantity
+            )
+    return bool(deleted)
+
+
+def convert(reservation, order_id):
+    """Marca a reserva como convertida em pedido (sai do total reservado)"""
+    with transaction.atomic():
+        _lock_counter(reservation.variant_id)
+        updated = StockReservation.objects.filter(pk=reservation.pk, order_id__isnull=True).update(
+            order_id=str(order_id)
+        )
+        if updated:
+            VariantReservationCounter.objects.filter(pk=reservation.variant_id).update(
+                reserved=F('reserved') - reservation.quantity
+            )
+    reservation.order_id = str(order_id)
+    return bool(updated)
+
+
+def reserved_quantity(variant_id):
+    """Total reservado da variante (varre as vencidas se houver)"""
+    counter = VariantReservationCounter.objects.filter(pk=variant_id).first()
+    if counter is None:
+        return 0
+    now = timezone.now()
+    if counter.next_expiry is not None and counter.next_expiry <= now:
+        with transaction.atomic():
+            counter = _lock_counter(variant_id)
+            _sweep(counter, now)
+    return max(counter.reserved, 0)
+
+
+def reaper_batch_size():
+    return getattr(settings, 'RESERVATION_REAPER_BATCH_SIZE', 500)
+
+
+def reap_expired(batch_size=None, sleep=None, max_batches=None):
+    """
+    Remove as reservas vencidas em lotes ordenados por expires_at.
+
+    Cada lote é uma transação curta: trava os contadores das variantes do
+    lote (em ordem de id, sem deadlock), apaga as reservas, desconta dos
+    contadores e grava os logs 'expired' com bulk_create. Entre lotes dorme
+    `sleep` segundos para não disputar o banco com o checkout.
+    Retorna o total de reservas removidas.
+    """
+    batch_size = batch_size or reaper_batch_size()
+    if sleep is None:
+        sleep = getattr(settings, 'RESERVATION_REAPER_SLEEP', 0.05)
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        now = timezone.now()
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=now, order_id__isnull=True)
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            variant_ids = sorted(set(
+                StockReservation.objects.filter(pk__in=ids).values_list('variant_id', flat=True)
+            ))
+            for variant_id in variant_ids:
+                _lock_counter(variant_id)
+            # Relê sob lock: reservas estendidas ou convertidas nesse meio tempo ficam
+            expired = list(StockReservation.objects.filter(
+                pk__in=ids, expires_at__lte=now, order_id__isnull=True
+            ))
+            StockReservation.objects.filter(pk__in=[r.pk for r in expired]).delete()
+            _log_expired(expired)
+
+            released = {}
+            for r in expired:
+                released[r.variant_id] = released.get(r.variant_id, 0) + r.quantity
+            next_expiry = dict(
+                StockReservation.objects.filter(variant_id__in=variant_ids, order_id__isnull=True)
+                .values('variant_id')
+                .annotate(first=Min('expires_at'))
+                .values_list('variant_id', 'first')
+                .order_by()
+            )
+            for variant_id in variant_ids:
+                VariantReservationCounter.objects.filter(pk=variant_id).update(
+                    reserved=F('reserved') - released.get(variant_id, 0),
+                    next_expiry=next_expiry.get(variant_id),
+                )
+        total += len(expired)
+        batches += 1
+        if len(ids) < batch_size:
+            break
+        if sleep:
+            time.sleep(sleep)
+    if total:
+        logger.info(f"Reservation reaper: {total} expired reservation(s) removed in {batches} batch(es)")
+    return total
+
+
+def availability(requested, session_key=None, user=None):
+    """
+    Disponibilidade de várias variantes de uma vez.
+
+    requested: {variant_id: quantidade}. As reservas do próprio dono
+    (sessão/usuário) não contam contra ele.
+    Retorna {variant_id: {'stock', 'reserved', 'available', 'requested',
+    'shortfall'}}; variantes inexistentes ficam de fora.
+    Custo fixo: uma consulta (variantes + contadores) e, com dono, uma
+    agregação das reservas dele.
+    """
+    ids = list(requested)
+    if not ids:
+        return {}
+    now = timezone.now()
+    rows = list(
+        ProductVariant.objects.filter(pk__in=ids)
+        .values('id', 'stock')
+        .annotate(
+            reserved=Coalesce(F('reservation_counter__reserved'), Value(0)),
+            next_expiry=F('reservation_counter__next_expiry'),
+        )
+        .order_by()
+    )
+    stale = [row['id'] for row in rows if row['next_expiry'] is not None and row['next_expiry'] <= now]
+    if stale:
+        # Raro: há reservas vencidas ainda não varridas nessas variantes
+        for variant_id in stale:
+            with transaction.atomic():
+                counter = _lock_counter(variant_id)
+                _sweep(counter, now)
+        reserved = dict(VariantReservationCounter.objects.filter(pk__in=stale).values_list('pk', 'reserved'))
+        for row in rows:
+            if row['id'] in reserved:
+                row['reserved'] = reserved[row['id']]
+
+    own = {}
+    owner = _owner_filter(session_key, user)
+    if owner is not None:
+        own = dict(
+            StockReservation.objects.filter(variant_id__in=ids, order_id__isnull=True, **owner)
+            .values('variant_id')
+            .annotate(total=Sum('quantity'))
+            .values_list('variant_id', 'total')
+            .order_by()
+        )
+
+    result = {}
+    for row in rows:
+        reserved = max(row['reserved'] - own.get(row['id'], 0), 0)
+        available = max(row['stock'] - reserved, 0)
+        wanted = requested[row['id']]
+        result[row['id']] = {
+            'stock': row['stock'],
+            'reserved': reserved,
+            'available': available,
+            'requested': wanted,
+            'shortfall': max(wanted - available, 0),
+        }
+    return result
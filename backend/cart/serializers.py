@@ -1,7 +1,28 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
+
+from core.media import media_url
+
 from .models import Cart, CartItem
 
 
+def cart_items_prefetch():
+    """
+    Itens com variante e produto (JOIN) e as imagens dos produtos em uma
+    única consulta extra: o carrinho serializa em 3 consultas, qualquer que
+    seja o número de itens.
+    """
+    return Prefetch(
+        'items',
+        queryset=CartItem.objects.select_related('variant__product').prefetch_related('variant__product__images'),
+    )
+
+
+def load_cart(cart_id):
+    """Carrinho pronto para CartSerializer (cart + itens + imagens)"""
+    return Cart.objects.prefetch_related(cart_items_prefetch()).get(pk=cart_id)
+
+
 class CartItemSerializer(serializers.ModelSerializer):
     # Campos adicionais da variante
     variant_size = serializers.CharField(source='variant.size', read_only=True)
@@ -18,14 +39,13 @@ class CartItemSerializer(serializers.ModelSerializer):
             if obj.image_url:
                 return {'url': obj.image_url, 'alt': obj.product_name}
             
-            # Buscar imagem do produto
-            primary_image = obj.variant.product.images.filter(is_primary=True).first()
-            if not primary_image:
-                primary_image = obj.variant.product.images.first()
+            # Buscar imagem do produto (usa as imagens pré-carregadas)
+            images = list(obj.variant.product.images.all())
+            primary_image = next((img for img in images if img.is_primary), images[0] if images else None)
             
             if primary_image:
                 return {
-                    'url': primary_image.image.url,
+                    'url': media_url(primary_image.image.name),
                     'alt': primary_image.alt_text or obj.product_name
                 }
         except Exception:
@@ -56,4 +76,4 @@ class CartSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Cart
-        fields = ("id", "user", "session_key", "items", "subtotal", "total_items")
+        fields = ("id", "user", "session_key", "version", "items", "subtotal", "total_items")
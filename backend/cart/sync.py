@@ -0,0 +1,107 @@
+"""
+Sincronização incremental do carrinho
+
+O cliente envia o estado desejado (variante -> quantidade) e o servidor
+calcula o diff contra os itens gravados: só insere variantes novas,
+atualiza quantidades diferentes e remove o que saiu. Itens inalterados não
+são tocados, e os snapshots (preço, imagem, tamanho, cor, sku) dos itens
+existentes são preservados.
+"""
+from django.utils import timezone
+
+from catalog.models import ProductVariant
+from core.media import media_url
+
+from .models import CartItem
+
+
+def parse_items(items_data):
+    """[{"variant_id": 1, "quantity": 2}, ...] -> {variant_id: quantidade} (somando repetidos)"""
+    desired = {}
+    for item_data in items_data:
+        if not isinstance(item_data, dict):
+            continue
+        try:
+            variant_id = int(item_data.get('variant_id') or 0)
+            quantity = int(item_data.get('quantity', 1) or 0)
+        except (TypeError, ValueError):
+            continue
+        if variant_id <= 0:
+            continue
+        desired[variant_id] = desired.get(variant_id, 0) + max(quantity, 0)
+    return desired
+
+
+def primary_image_url(product):
+    images = list(product.images.all())
+    image = next((img for img in images if img.is_primary), images[0] if images else None)
+    return media_url(image.image.name) if image else ''
+
+
+def new_cart_item(cart, variant, quantity):
+    product = variant.product
+    return CartItem(
+        cart=cart,
+        variant=variant,
+        product_name=product.name,
+        unit_price=variant.price or product.base_price,
+        quantity=quantity,
+        size=variant.size or '',
+        color=variant.color or '',
+        sku=variant.sku or '',
+        image_url=primary_image_url(product),
+        product_id=product.id,
+    )
+
+
+def apply_cart_delta(cart, desired, replace=True):
+    """
+    Aplica o estado desejado ao carrinho (chamar dentro de locked_cart).
+
+    desired: {variant_id: quantidade}; quantidade 0 remove o item.
+    replace=True: variantes ausentes em desired são removidas (sync completo);
+    replace=False: só as variantes informadas são alteradas (patch).
+
+    Retorna (itens criados/alterados, ids removidos, itens finais).
+    """
+    existing = {}
+    duplicates = []
+    for item in CartItem.objects.filter(cart=cart).select_related('variant__product').prefetch_related('variant__product__images').order_by('id'):
+        if item.variant_id in existing:
+            duplicates.append(item.id)
+        else:
+            existing[item.variant_id] = item
+
+    removed = list(duplicates)
+    to_update = []
+    for variant_id, item in existing.items():
+        quantity = desired.get(variant_id, 0 if replace else item.quantity)
+        if quantity <= 0:
+            removed.append(item.id)
+        elif quantity != item.quantity:
+            item.quantity = quantity
+            to_update.append(item)
+
+    missing = [vid for vid, qty in desired.items() if qty > 0 and vid not in existing]
+    to_create = []
+    if missing:
+        variants = (
+            ProductVariant.objects.filter(id__in=missing)
+            .select_related('product')
+            .prefetch_related('product__images')
+        )
+        to_create = [new_cart_item(cart, variant, desired[variant.id]) for variant in variants]
+
+    if removed:
+        CartItem.objects.filter(id__in=removed).delete()
+    if to_update:
+        now = timezone.now()
+        for item in to_update:
+            item.updated_at = now
+        CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+    if to_create:
+        CartItem.objects.bulk_create(to_create)
+
+    removed_set = set(removed)
+    final = [item for item in existing.values() if item.id not in removed_set] + to_create
+    return to_update + to_create, removed, final
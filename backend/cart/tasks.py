@@ -0,0 +1,25 @@
+from celery import shared_task
+from django.conf import settings
+
+from .hot import FLUSH_QUEUED_KEY, get_hot_cart_store, hot_cart_enabled, schedule_flush
+from .reservations import reap_expired
+
+
+@shared_task
+def flush_hot_carts():
+    """Persiste os carrinhos quentes sujos há mais de CART_HOT_FLUSH_DELAY segundos"""
+    if not hot_cart_enabled():
+        return 0
+    store = get_hot_cart_store()
+    store.cache.delete(FLUSH_QUEUED_KEY)
+    flushed = store.flush_dirty(older_than=getattr(settings, 'CART_HOT_FLUSH_DELAY', 60))
+    # Escritas depois do agendamento ainda não venceram: agenda a próxima rodada
+    if store.has_dirty():
+        schedule_flush(store.cache)
+    return flushed
+
+
+@shared_task
+def reap_expired_reservations():
+    """Remove as reservas de estoque vencidas em lotes (RESERVATION_REAPER_*)"""
+    return reap_expired()
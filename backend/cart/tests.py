@@ -1,3 +1,579 @@
-from django.test import TestCase
+import os
+import random
+import shutil
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import connection
+from django.db.models import Sum
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from catalog.models import Category, Product, ProductImage, ProductVariant
+from catalog.testing import CatalogTestCase, CatalogTransactionTestCase
+from . import hot
+from .hot import DIRTY_KEY, DIRTY_SHARDS, CartBusy, HotCartStore
+from .models import Cart, CartItem
+from .models_reservation import ReservationLog, StockReservation, VariantReservationCounter
+from .reservations import InsufficientStock, reap_expired, release, reserve, reserved_quantity
+from .serializers import CartSerializer, load_cart
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def create_variants(count):
+    category = Category.objects.create(name='Camisetas', slug='camisetas')
+    variants = []
+    for i in range(count):
+        product = Product.objects.create(
+            category=category, name=f'Produto {i}', slug=f'produto-{i}', base_price='99.90'
+        )
+        ProductImage.objects.create(product=product, image=f'products/p{i}.jpg', sort_order=1)
+        ProductImage.objects.create(product=product, image=f'products/p{i}-main.jpg', is_primary=True)
+        variants.append(ProductVariant.objects.create(
+            product=product, sku=f'SKU-{i}', size='M', color='Preto', stock=50
+        ))
+    return variants
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CartQueryCountTests(CatalogTestCase):
+    """
+    O número de consultas de cada endpoint do carrinho não pode depender da
+    quantidade de itens: cada cenário roda com 2 e com 10 itens.
+    """
+
+    SESSION = 'query-count'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.variants = create_variants(12)
+        cls.user = get_user_model().objects.create_user(
+            username='cliente', email='cliente@example.com', password='senha-forte-123'
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_SESSION_KEY=self.SESSION)
+
+    def make_cart(self, size, **kwargs):
+        kwargs.setdefault('session_key', self.SESSION)
+        cart = Cart.objects.create(**kwargs)
+        for variant in self.variants[:size]:
+            # Sem image_url: força o uso das imagens pré-carregadas
+            CartItem.objects.create(
+                cart=cart, variant=variant, product_name=variant.product.name,
+                unit_price=variant.product.base_price, quantity=1, product_id=variant.product_id,
+            )
+        return cart
+
+    def count_queries(self, size, request, prepare=None):
+        Cart.objects.all().delete()
+        cart = self.make_cart(size)
+        item = cart.items.order_by('id').first()
+        if prepare:
+            prepare(cart)
+        with CaptureQueriesContext(connection) as ctx:
+            response = request(item)
+        self.assertLess(response.status_code, 400, getattr(response, 'data', None))
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, request, maximum, prepare=None):
+        small = self.count_queries(2, request, prepare)
+        large = self.count_queries(10, request, prepare)
+        self.assertEqual(small, large, 'consultas crescem com o número de itens')
+        self.assertLessEqual(large, maximum)
+
+    def test_load_cart(self):
+        cart = self.make_cart(10)
+        with self.assertNumQueries(3):
+            data = CartSerializer(load_cart(cart.id)).data
+        self.assertEqual(len(data['items']), 10)
+        self.assertEqual(data['total_items'], 10)
+        self.assertTrue(data['items'][0]['image']['url'].endswith('p0-main.jpg'))
+
+    def test_get_cart(self):
+        self.assertConstantQueries(lambda item: self.client.get('/api/cart/'), 3)
+
+    def test_add_to_cart(self):
+        self.assertConstantQueries(
+            lambda item: self.client.post(
+                '/api/cart/add/', {'variant_id': self.variants[11].id, 'quantity': 1}, format='json'
+            ),
+            14,
+        )
+
+    def test_add_existing_item(self):
+        self.assertConstantQueries(
+            lambda item: self.client.post(
+                '/api/cart/add/', {'variant_id': self.variants[0].id, 'quantity': 1}, format='json'
+            ),
+            12,
+        )
+
+    def test_update_item(self):
+        self.assertConstantQueries(
+            lambda item: self.client.put(
+                f'/api/cart/update/{item.id}/', {'quantity': 2}, format='json'
+            ),
+            10,
+        )
+
+    def test_remove_item(self):
+        self.assertConstantQueries(
+            lambda item: self.client.delete(f'/api/cart/remove/{item.id}/'),
+            10,
+        )
+
+    def test_clear_cart(self):
+        self.assertConstantQueries(lambda item: self.client.delete('/api/cart/clear/'), 6)
+
+    def test_sync_cart(self):
+        def sync(item):
+            items = [{'variant_id': v.id, 'quantity': 2} for v in self.variants[1:11]]
+            return self.client.post('/api/cart/sync/', {'items': items}, format='json')
+        self.assertConstantQueries(sync, 12)
+
+    def test_sync_cart_patch(self):
+        def patch(item):
+            items = [{'variant_id': self.variants[0].id, 'quantity': 0},
+                     {'variant_id': self.variants[11].id, 'quantity': 1}]
+            return self.client.patch('/api/cart/sync/', {'items': items}, format='json')
+        self.assertConstantQueries(patch, 11)
+
+    def test_cart_count(self):
+        self.assertConstantQueries(lambda item: self.client.get('/api/cart/count/'), 2)
+
+    def test_validate_cart_stock(self):
+        self.assertConstantQueries(lambda item: self.client.post('/api/cart/validate/'), 4)
+
+    def test_check_availability_batch(self):
+        StockReservation.objects.create(
+            variant=self.variants[0], quantity=45, session_key='outra-sessao',
+            expires_at=timezone.now() + timedelta(minutes=15),
+        )
+        VariantReservationCounter.objects.create(variant=self.variants[0], reserved=45)
+
+        counts = []
+        for size in (2, 12):
+            items = [{'variant_id': v.id, 'quantity': 10} for v in self.variants[:size]]
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post(
+                    '/api/cart/check-availability/batch/',
+                    {'items': items, 'session_key': self.SESSION}, format='json',
+                )
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts, [2, 2])
+        first = next(i for i in response.data['items'] if i['variant_id'] == self.variants[0].id)
+        self.assertEqual((first['reserved'], first['available'], first['shortfall']), (45, 5, 5))
+        self.assertFalse(response.data['all_available'])
+
+    def test_add_to_cart_with_validation(self):
+        self.assertConstantQueries(
+            lambda item: self.client.post(
+                '/api/cart/add-validated/', {'variant_id': self.variants[11].id, 'quantity': 1}, format='json'
+            ),
+            13,
+        )
+
+    def test_merge_cart(self):
+        def user_cart(guest_cart):
+            cart = Cart.objects.create(user=self.user)
+            CartItem.objects.create(
+                cart=cart, variant=self.variants[0], product_name='Produto 0',
+                unit_price='99.90', quantity=1,
+            )
+
+        self.client.force_authenticate(self.user)
+        self.assertConstantQueries(
+            lambda item: self.client.post('/api/cart/merge/', {'session_key': self.SESSION}, format='json'),
+            17,
+            prepare=user_cart,
+        )
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(cart.items.count(), 10)
+        self.assertEqual(cart.items.get(variant=self.variants[0]).quantity, 2)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CartVersionTests(CatalogTestCase):
+    SESSION = 'versioned'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.variants = create_variants(3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_SESSION_KEY=self.SESSION)
+        response = self.client.post('/api/cart/add/', {'variant_id': self.variants[0].id, 'quantity': 1}, format='json')
+        self.item = response.data['items'][0]
+        self.version = response.data['version']
+
+    def test_stale_version_is_rejected_with_the_current_cart(self):
+        # Outra aba muda o carrinho
+        self.client.put(f'/api/cart/update/{self.item["id"]}/', {'quantity': 3}, format='json')
+
+        response = self.client.put(
+            f'/api/cart/update/{self.item["id"]}/', {'quantity': 5}, format='json', HTTP_IF_MATCH=f'"{self.version}"',
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['cart']['version'], self.version + 1)
+        self.assertEqual(response.data['cart']['items'][0]['quantity'], 3)
+        # O 409 não grava nada nem avança a versão
+        cart = Cart.objects.get(session_key=self.SESSION)
+        self.assertEqual((cart.version, cart.items.get().quantity), (self.version + 1, 3))
+
+        response = self.client.put(
+            f'/api/cart/update/{self.item["id"]}/', {'quantity': 5, 'version': self.version + 1}, format='json',
+        )
+        self.assertEqual((response.status_code, response.data['version']), (200, self.version + 2))
+        self.assertEqual(response.data['items'][0]['quantity'], 5)
+
+    def test_relative_adds_without_version_are_applied_in_order(self):
+        for _ in range(2):
+            response = self.client.post('/api/cart/add/', {'variant_id': self.variants[0].id, 'quantity': 2}, format='json')
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['items'][0]['quantity'], 5)
+        self.assertEqual(response.data['version'], self.version + 2)
+
+        response = self.client.delete('/api/cart/clear/', HTTP_IF_MATCH='"0"')
+        self.assertEqual(response.status_code, 409)
+        self.assertTrue(CartItem.objects.filter(cart__session_key=self.SESSION).exists())
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class CartSyncDeltaTests(CatalogTestCase):
+    SESSION = 'delta'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.variants = create_variants(4)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_SESSION_KEY=self.SESSION)
+        self.sync('post', {0: 1, 1: 2})
+
+    def sync(self, method, quantities, **extra):
+        items = [{'variant_id': self.variants[i].id, 'quantity': qty} for i, qty in quantities.items()]
+        return getattr(self.client, method)('/api/cart/sync/', {'items': items, **extra}, format='json')
+
+    def item_ids(self):
+        return dict(CartItem.objects.filter(cart__session_key=self.SESSION).values_list('variant_id', 'id'))
+
+    def test_patch_returns_only_the_changes(self):
+        before = self.item_ids()
+        CartItem.objects.filter(id=before[self.variants[0].id]).update(unit_price='10.00')
+
+        response = self.sync('patch', {1: 0, 2: 3})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([i['variant'] for i in response.data['items']], [self.variants[2].id])
+        self.assertEqual(response.data['removed'], [before[self.variants[1].id]])
+        self.assertEqual(response.data['total_items'], 4)
+        self.assertEqual(response.data['subtotal'], Decimal('10.00') + 3 * Decimal('99.90'))
+
+        # A variante fora do PATCH fica intacta (mesmo id e preço gravado)
+        after = self.item_ids()
+        self.assertEqual(after[self.variants[0].id], before[self.variants[0].id])
+        self.assertEqual(set(after), {self.variants[0].id, self.variants[2].id})
+
+    def test_post_replaces_and_unchanged_sync_keeps_the_version(self):
+        version = self.sync('patch', {}).data['version']
+        self.assertEqual(self.sync('post', {0: 1, 1: 2}).data['version'], version)
+        self.assertEqual(self.sync('post', {0: 1, 1: 2}).data['items'], [])
+
+        response = self.sync('post', {1: 5})
+        self.assertEqual(response.data['version'], version + 1)
+        self.assertEqual(set(self.item_ids()), {self.variants[1].id})
+        self.assertEqual([(i['variant'], i['quantity']) for i in response.data['items']], [(self.variants[1].id, 5)])
+
+        response = self.sync('patch', {3: 1}, version=version)
+        self.assertEqual(response.status_code, 409)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, CART_STORAGE='cache')
+class HotCartStoreTests(CatalogTestCase):
+    """
+    CART_STORAGE = 'cache' com LocMem. Para rodar contra um Redis local,
+    defina CART_TEST_REDIS_URL (ex.: redis://localhost:6379/15).
+    """
+
+    SESSION = 'hot-cart'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.variants = create_variants(3)
+        cls.user = get_user_model().objects.create_user(
+            username='cliente', email='cliente@example.com', password='senha-forte-123'
+        )
+
+    def make_cache(self):
+        return LocMemCache('hot-cart-tests', {})
+
+    def setUp(self):
+        self.cache = self.make_cache()
+        self.cache.clear()
+        self.store = HotCartStore(self.cache)
+        patcher = unittest.mock.patch('cart.hot._store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # O timer de flush em segundo plano é exercitado em test_writes_schedule_a_background_flush
+        timer = unittest.mock.patch('cart.hot._start_timer')
+        self.start_timer = timer.start()
+        self.addCleanup(timer.stop)
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_SESSION_KEY=self.SESSION)
+
+    def test_writes_stay_in_cache_until_flush(self):
+        v0, v1, v2 = self.variants
+        self.client.post('/api/cart/add/', {'variant_id': v0.id, 'quantity': 2}, format='json')
+        self.client.post('/api/cart/sync/', {'items': [
+            {'variant_id': v0.id, 'quantity': 2}, {'variant_id': v1.id, 'quantity': 1},
+        ]}, format='json')
+        self.client.put(f'/api/cart/update/{v1.id}/', {'quantity': 3}, format='json')
+        response = self.client.get('/api/cart/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_items'], 5)
+        self.assertEqual(response.data['version'], 3)
+        self.assertTrue(response.data['items'][0]['image']['url'].endswith('p0-main.jpg'))
+        self.assertFalse(Cart.objects.exists())
+
+        self.assertEqual(self.store.flush_dirty(), 1)
+        cart = Cart.objects.get(session_key=self.SESSION)
+        items = {item.variant_id: item for item in cart.items.all()}
+        self.assertEqual({vid: item.quantity for vid, item in items.items()}, {v0.id: 2, v1.id: 3})
+        self.assertTrue(items[v0.id].image_url.endswith('p0-main.jpg'))
+        self.assertEqual(self.store.flush_dirty(), 0)
+
+    def test_loads_existing_cart_from_database(self):
+        cart = Cart.objects.create(session_key=self.SESSION, version=7)
+        CartItem.objects.create(
+            cart=cart, variant=self.variants[2], product_name='Produto 2', unit_price='99.90', quantity=4,
+        )
+        response = self.client.get('/api/cart/')
+        self.assertEqual(response.data['id'], cart.id)
+        self.assertEqual(response.data['version'], 7)
+        self.assertEqual(response.data['items'][0]['id'], self.variants[2].id)
+        self.assertEqual(self.client.get('/api/cart/count/').data['count'], 4)
+
+    def test_stale_version_is_rejected(self):
+        v0 = self.variants[0]
+        self.client.post('/api/cart/add/', {'variant_id': v0.id}, format='json')
+        response = self.client.post('/api/cart/sync/', {'items': [], 'version': 0}, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['cart']['total_items'], 1)
+
+    def test_concurrent_adds_are_not_lost(self):
+        variant = ProductVariant.objects.select_related('product').get(pk=self.variants[0].pk)
+
+        def worker():
+            for _ in range(5):
+                self.store.add('sconcurrent', variant, 1)
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        state = self.store.get('sconcurrent')
+        self.assertEqual(state['items'][0]['quantity'], 40)
+        self.assertEqual(state['version'], 40)
+
+    def test_failed_dirty_mark_does_not_leave_unflushed_state(self):
+        variant = ProductVariant.objects.select_related('product').get(pk=self.variants[0].pk)
+        with unittest.mock.patch.object(self.store, '_mark_dirty', side_effect=CartBusy('dirty')):
+            with self.assertRaises(CartBusy):
+                self.store.add('sbusy', variant, 1)
+        self.assertFalse(self.store.get('sbusy')['dirty'])
+
+        # Índice perdido (eviction): a próxima escrita volta a registrar o dono
+        self.store.add('sbusy', variant, 1)
+        self.cache.delete_many([f'{DIRTY_KEY}:{shard}' for shard in range(DIRTY_SHARDS)])
+        self.store.add('sbusy', variant, 1)
+        self.assertEqual(self.store.flush_dirty(), 1)
+        self.assertEqual(Cart.objects.get(session_key='busy').items.get().quantity, 2)
+
+    def test_writes_schedule_a_background_flush(self):
+        variant = ProductVariant.objects.select_related('product').get(pk=self.variants[0].pk)
+        self.store.add('stimer', variant, 1)
+        self.start_timer.assert_called()
+
+        # Ainda dentro de CART_HOT_FLUSH_DELAY: nada gravado, o timer é rearmado
+        self.start_timer.reset_mock()
+        with unittest.mock.patch('cart.hot.connection'):
+            hot._run_timer()
+        self.assertFalse(Cart.objects.exists())
+        self.start_timer.assert_called_once_with()
+
+        self.start_timer.reset_mock()
+        with override_settings(CART_HOT_FLUSH_DELAY=0), unittest.mock.patch('cart.hot.connection'):
+            hot._run_timer()
+        self.assertEqual(Cart.objects.get(session_key='timer').items.get().quantity, 1)
+        self.start_timer.assert_not_called()
+
+    @override_settings(CART_HOT_FLUSH='celery')
+    def test_celery_flush_is_queued_once_and_falls_back_to_timer(self):
+        variant = ProductVariant.objects.select_related('product').get(pk=self.variants[0].pk)
+        with unittest.mock.patch('cart.hot.try_apply_async', return_value=True) as apply_async:
+            self.store.add('squeued', variant, 1)
+            self.store.add('squeued', variant, 1)
+        apply_async.assert_called_once()
+        self.start_timer.assert_not_called()
+
+        self.cache.delete(hot.FLUSH_QUEUED_KEY)
+        with unittest.mock.patch('cart.hot.try_apply_async', return_value=False):
+            self.store.add('squeued', variant, 1)
+        self.start_timer.assert_called_once_with()
+
+    def test_merge_flushes_hot_carts(self):
+        v0, v1, _ = self.variants
+        self.client.post('/api/cart/add/', {'variant_id': v0.id}, format='json')
+        self.store.add(f'u{self.user.pk}', ProductVariant.objects.select_related('product').get(pk=v1.pk), 2)
+
+        self.client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/cart/merge/', {'session_key': self.SESSION}, format='json')
+        self.assertEqual(response.data['merged_count'], 1)
+
+        data = self.client.get('/api/cart/').data
+        self.assertEqual({item['variant']: item['quantity'] for item in data['items']}, {v0.id: 1, v1.id: 2})
+
+
+@unittest.skipUnless(os.environ.get('CART_TEST_REDIS_URL'), 'CART_TEST_REDIS_URL não definido')
+class RedisHotCartStoreTests(HotCartStoreTests):
+    def make_cache(self):
+        from django.core.cache.backends.redis import RedisCache
+        return RedisCache(os.environ['CART_TEST_REDIS_URL'], {'KEY_PREFIX': 'cart-tests'})
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ReservationStressTests(CatalogTransactionTestCase):
+    """
+    Reservas concorrentes em threads (conexões separadas): o contador nunca
+    passa do estoque e sempre bate com a soma das reservas ativas.
+    """
+
+    def setUp(self):
+        self.variant = create_variants(1)[0]
+
+    def set_stock(self, stock):
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock=stock)
+
+    def run_threads(self, target, count):
+        barrier = threading.Barrier(count)
+        results, errors = [], []
+
+        def run(i):
+            try:
+                barrier.wait()
+                results.append(target(i))
+            except InsufficientStock:
+                results.append(None)
+            except Exception as e:  # noqa: BLE001 - reportado na asserção
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        return results
+
+    def assertCounterConsistent(self):
+        counter = VariantReservationCounter.objects.get(pk=self.variant.pk)
+        total = StockReservation.objects.filter(
+            variant=self.variant, order_id__isnull=True
+        ).aggregate(total=Sum('quantity'))['total'] or 0
+        self.assertEqual(counter.reserved, total)
+        return counter.reserved
+
+    def test_last_units_are_not_oversold(self):
+        self.set_stock(10)
+        results = self.run_threads(lambda i: reserve(self.variant.pk, 1, session_key=f'stress-{i}'), 30)
+        self.assertEqual(sum(result is not None for result in results), 10)
+        self.assertEqual(self.assertCounterConsistent(), 10)
+
+    def test_mixed_operations_keep_counter_consistent(self):
+        self.set_stock(25)
+
+        def shopper(i):
+            rng = random.Random(i)
+            reservation = None
+            for _ in range(6):
+                try:
+                    reservation, _, _ = reserve(self.variant.pk, rng.randint(1, 3), session_key=f'mixed-{i}')
+                except InsufficientStock:
+                    pass
+                if reservation and rng.random() < 0.3:
+                    release(reservation)
+                    reservation = None
+            return reservation
+
+        self.run_threads(shopper, 16)
+        self.assertLessEqual(self.assertCounterConsistent(), 25)
+
+    def test_expired_reservations_are_swept_lazily(self):
+        self.set_stock(2)
+        reservation, _, _ = reserve(self.variant.pk, 2, session_key='expired')
+        with self.assertRaises(InsufficientStock):
+            reserve(self.variant.pk, 1, session_key='late')
+
+        past = reservation.expires_at.replace(year=reservation.expires_at.year - 1)
+        StockReservation.objects.filter(pk=reservation.pk).update(expires_at=past)
+        VariantReservationCounter.objects.filter(pk=self.variant.pk).update(next_expiry=past)
+
+        self.assertEqual(reserved_quantity(self.variant.pk), 0)
+        self.assertFalse(StockReservation.objects.filter(pk=reservation.pk).exists())
+        reserve(self.variant.pk, 2, session_key='late')
+        self.assertEqual(self.assertCounterConsistent(), 2)
+
+    def test_reaper_removes_expired_in_batches(self):
+        self.set_stock(20)
+        reservations = [reserve(self.variant.pk, 1, session_key=f'reap-{i}')[0] for i in range(7)]
+        past = timezone.now() - timedelta(minutes=1)
+        StockReservation.objects.filter(pk__in=[r.pk for r in reservations[:5]]).update(expires_at=past)
+        VariantReservationCounter.objects.filter(pk=self.variant.pk).update(next_expiry=past)
+
+        self.assertEqual(reap_expired(batch_size=2, sleep=0, max_batches=1), 2)
+        self.assertEqual(reap_expired(batch_size=2, sleep=0), 3)
+        self.assertEqual(reap_expired(batch_size=2, sleep=0), 0)
+
+        self.assertEqual(self.assertCounterConsistent(), 2)
+        counter = VariantReservationCounter.objects.get(pk=self.variant.pk)
+        self.assertEqual(counter.next_expiry, min(r.expires_at for r in reservations[5:]))
+        self.assertEqual(ReservationLog.objects.filter(action='expired', variant=self.variant).count(), 5)
+
+    @override_settings(RESERVATION_REAPER_BATCH_SIZE=2, RESERVATION_REAPER_MAX_BATCHES=1, RESERVATION_REAPER_SLEEP=0)
+    def test_cleanup_endpoint_is_admin_only_and_bounded(self):
+        self.set_stock(20)
+        reservations = [reserve(self.variant.pk, 1, session_key=f'cleanup-{i}')[0] for i in range(3)]
+        past = timezone.now() - timedelta(minutes=1)
+        StockReservation.objects.filter(pk__in=[r.pk for r in reservations]).update(expires_at=past)
+        VariantReservationCounter.objects.filter(pk=self.variant.pk).update(next_expiry=past)
+
+        client = APIClient()
+        self.assertIn(client.post('/api/cart/cleanup-reservations/').status_code, (401, 403))
+        self.assertEqual(StockReservation.objects.count(), 3)
+
+        client.force_authenticate(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'senha-forte-123'))
+        self.assertEqual(client.post('/api/cart/cleanup-reservations/').data['count'], 2)
+        self.assertEqual(client.post('/api/cart/cleanup-reservations/').data['count'], 1)
+        self.assertEqual(self.assertCounterConsistent(), 0)
@@ -16,6 +16,7 @@ urlpatterns = [
     path('reservation/<int:reservation_id>/extend/', views_reservation.extend_stock_reservation, name='reservation_extend'),
     path('reservation/<int:reservation_id>/', views_reservation.cancel_stock_reservation, name='reservation_cancel'),
     path('check-availability/', views_reservation.check_availability, name='check_availability'),
+    path('check-availability/batch/', views_reservation.check_availability_batch, name='check_availability_batch'),
     path('my-reservations/', views_reservation.get_user_reservations, name='my_reservations'),
     path('cleanup-reservations/', views_reservation.cleanup_expired_reservations, name='cleanup_reservations'),
     
@@ -3,64 +3,58 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
-from django.db import transaction
 from .models import Cart, CartItem
-from .serializers import CartSerializer
+from .serializers import CartSerializer, CartItemSerializer, cart_items_prefetch, load_cart
+from .concurrency import CartConflict, discard_cart_write, get_expected_version, get_or_create_cart, locked_cart
+from .sync import apply_cart_delta, parse_items
+from .hot import hot_cart_view
+from . import views_hot
 from catalog.models import ProductVariant
-import threading
-import time
-from django.db.utils import OperationalError
+from core.media import media_url
 
 
 def _get_session_key(request):
     return request.headers.get('X-Session-Key') or request.query_params.get('session_key')
 
 
-_CART_LOCKS = {}
-_CART_LOCKS_LOCK = threading.Lock()
+def _get_or_create_cart_for_request(request, queryset=None):
+    if request.user.is_authenticated:
+        return get_or_create_cart(user=request.user, queryset=queryset)
+    return get_or_create_cart(session_key=_get_session_key(request), queryset=queryset)
 
-def _get_cart_lock(cart_id: int):
-    with _CART_LOCKS_LOCK:
-        lock = _CART_LOCKS.get(cart_id)
-        if lock is None:
-            lock = threading.Lock()
-            _CART_LOCKS[cart_id] = lock
-        return lock
 
+class _StockError(Exception):
+    """Desfaz a transação do carrinho quando a quantidade excede o estoque"""
 
-def _get_or_create_cart_for_request(request):
-    if request.user.is_authenticated:
-        cart = Cart.objects.filter(user=request.user).order_by('id').first()
-        if cart is None:
-            cart = Cart.objects.create(user=request.user)
-        return cart
-    session_key = _get_session_key(request)
-    if not session_key:
-        return None
-    cart = Cart.objects.filter(user=None, session_key=session_key).order_by('id').first()
-    if cart is None:
-        cart = Cart.objects.create(user=None, session_key=session_key)
-    return cart
+    def __init__(self, current, available=None):
+        super().__init__()
+        self.current = current
+        self.available = available
+
+
+def _conflict_response(exc):
+    return Response({
+        "error": "O carrinho foi alterado em outra sessão",
+        "cart": CartSerializer(load_cart(exc.cart.pk)).data,
+    }, status=status.HTTP_409_CONFLICT)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@hot_cart_view(views_hot.get_cart)
 def get_cart(request):
-    cart = _get_or_create_cart_for_request(request)
+    cart = _get_or_create_cart_for_request(
+        request, Cart.objects.prefetch_related(cart_items_prefetch())
+    )
     if cart is None:
         return Response({"error": "Informe X-Session-Key no header para carrinho de convidado."}, status=status.HTTP_400_BAD_REQUEST)
     
-    cart = Cart.objects.prefetch_related(
-        'items__variant__product__category',
-        'items__variant__product__images'
-    ).get(id=cart.id)
-    
     return Response(CartSerializer(cart).data)
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
-@transaction.atomic
+@hot_cart_view(views_hot.add_to_cart)
 def add_to_cart(request):
     cart = _get_or_create_cart_for_request(request)
     if cart is None:
@@ -89,95 +83,123 @@ def add_to_cart(request):
     unit_price = variant.price or variant.product.base_price
     product_name = variant.product.name
     
-    # Obter imagem principal
-    primary_image = variant.product.images.filter(is_primary=True).first()
-    if not primary_image:
-        primary_image = variant.product.images.first()
-    image_url = primary_image.image.url if primary_image else ''
-
-    item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        variant=variant,
-        defaults={
-            "product_name": product_name,
-            "unit_price": unit_price,
-            "quantity": quantity,
-            "size": variant.size or '',
-            "color": variant.color or '',
-            "sku": variant.sku or '',
-            "image_url": image_url,
-            "product_id": variant.product.id
-        }
-    )
-    if not created:
-        new_quantity = item.quantity + quantity
-        # VALIDAR NOVA QUANTIDADE
-        if new_quantity > variant.stock:
-            return Response({
-                "error": "Estoque insuficiente",
-                "available": variant.stock,
-                "current_in_cart": item.quantity,
-                "requested": quantity
-            }, status=status.HTTP_400_BAD_REQUEST)
-        item.quantity = new_quantity
-        item.save(update_fields=["quantity", "updated_at"])
-
-    return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+    # Obter imagem principal (imagens já pré-carregadas)
+    images = list(variant.product.images.all())
+    primary_image = next((img for img in images if img.is_primary), images[0] if images else None)
+    image_url = media_url(primary_image.image.name) if primary_image else ''
+
+    # Adicionar é relativo: escritas concorrentes são somadas na ordem do lock
+    try:
+        with locked_cart(cart, get_expected_version(request)) as cart:
+            item, created = CartItem.objects.get_or_create(
+                cart=cart,
+                variant=variant,
+                defaults={
+                    "product_name": product_name,
+                    "unit_price": unit_price,
+                    "quantity": quantity,
+                    "size": variant.size or '',
+                    "color": variant.color or '',
+                    "sku": variant.sku or '',
+                    "image_url": image_url,
+                    "product_id": variant.product.id
+                }
+            )
+            if not created:
+                new_quantity = item.quantity + quantity
+                # VALIDAR NOVA QUANTIDADE
+                if new_quantity > variant.stock:
+                    raise _StockError(item.quantity)
+                item.quantity = new_quantity
+                item.save(update_fields=["quantity", "updated_at"])
+    except CartConflict as exc:
+        return _conflict_response(exc)
+    except _StockError as exc:
+        return Response({
+            "error": "Estoque insuficiente",
+            "available": variant.stock,
+            "current_in_cart": exc.current,
+            "requested": quantity
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(CartSerializer(load_cart(cart.id)).data, status=status.HTTP_200_OK)
 
 
 @api_view(['PUT'])
 @permission_classes([AllowAny])
-@transaction.atomic
+@hot_cart_view(views_hot.update_item)
 def update_item(request, item_id: int):
     cart = _get_or_create_cart_for_request(request)
     if cart is None:
         return Response({"error": "Informe X-Session-Key no header para carrinho de convidado."}, status=status.HTTP_400_BAD_REQUEST)
-    item = get_object_or_404(CartItem.objects.select_related('variant'), id=item_id, cart=cart)
     quantity = int(request.data.get('quantity') or 1)
-    if quantity <= 0:
-        item.delete()
-    else:
-        # VALIDAR ESTOQUE
-        if quantity > item.variant.stock:
-            return Response({
-                "error": "Estoque insuficiente",
-                "available": item.variant.stock,
-                "requested": quantity
-            }, status=status.HTTP_400_BAD_REQUEST)
-        item.quantity = quantity
-        item.save(update_fields=["quantity", "updated_at"])
-    return Response(CartSerializer(cart).data)
+    try:
+        with locked_cart(cart, get_expected_version(request)) as cart:
+            item = get_object_or_404(CartItem.objects.select_related('variant'), id=item_id, cart=cart)
+            if quantity <= 0:
+                item.delete()
+            else:
+                # VALIDAR ESTOQUE
+                if quantity > item.variant.stock:
+                    raise _StockError(item.quantity, item.variant.stock)
+                item.quantity = quantity
+                item.save(update_fields=["quantity", "updated_at"])
+    except CartConflict as exc:
+        return _conflict_response(exc)
+    except _StockError as exc:
+        return Response({
+            "error": "Estoque insuficiente",
+            "available": exc.available,
+            "requested": quantity
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response(CartSerializer(load_cart(cart.id)).data)
 
 
 @api_view(['DELETE'])
 @permission_classes([AllowAny])
-@transaction.atomic
+@hot_cart_view(views_hot.remove_item)
 def remove_item(request, item_id: int):
     cart = _get_or_create_cart_for_request(request)
     if cart is None:
         return Response({"error": "Informe X-Session-Key no header para carrinho de convidado."}, status=status.HTTP_400_BAD_REQUEST)
-    item = get_object_or_404(CartItem, id=item_id, cart=cart)
-    item.delete()
-    return Response(CartSerializer(cart).data)
+    try:
+        with locked_cart(cart, get_expected_version(request)) as cart:
+            item = get_object_or_404(CartItem, id=item_id, cart=cart)
+            item.delete()
+    except CartConflict as exc:
+        return _conflict_response(exc)
+    return Response(CartSerializer(load_cart(cart.id)).data)
 
 
 @api_view(['DELETE'])
 @permission_classes([AllowAny])
-@transaction.atomic
+@hot_cart_view(views_hot.clear_cart)
 def clear_cart(request):
     cart = _get_or_create_cart_for_request(request)
     if cart is None:
         return Response({"error": "Informe X-Session-Key no header para carrinho de convidado."}, status=status.HTTP_400_BAD_REQUEST)
-    cart.items.all().delete()
+    try:
+        with locked_cart(cart, get_expected_version(request)) as cart:
+            cart.items.all().delete()
+    except CartConflict as exc:
+        return _conflict_response(exc)
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-@api_view(['POST'])
+@api_view(['POST', 'PATCH'])
 @permission_classes([AllowAny])
+@hot_cart_view(views_hot.sync_cart)
 def sync_cart(request):
     """
-    Sincroniza o carrinho inteiro de uma vez, evitando múltiplas requisições.
+    Sincroniza o carrinho aplicando apenas a diferença.
     Espera um array de itens: [{"variant_id": 1, "quantity": 2}, ...]
+    
+    POST: o array é o carrinho inteiro (variantes ausentes são removidas).
+    PATCH: só as variantes enviadas mudam; quantity 0 remove.
+    
+    Retorna apenas os itens criados/alterados, os ids removidos, os totais
+    e a versão do carrinho. Envie "version" (ou If-Match) para receber 409
+    em vez de sobrescrever alterações feitas em outra sessão.
     """
     cart = _get_or_create_cart_for_request(request)
     if cart is None:
@@ -187,49 +209,20 @@ def sync_cart(request):
     if not isinstance(items_data, list):
         return Response({"error": "items deve ser um array"}, status=status.HTTP_400_BAD_REQUEST)
     
-    with _get_cart_lock(cart.id):
-        for attempt in range(5):
-            try:
-                with transaction.atomic():
-                    CartItem.objects.filter(cart=cart).delete()
-                break
-            except OperationalError as e:
-                if 'database is locked' in str(e).lower() and attempt < 4:
-                    time.sleep(0.05 * (2 ** attempt))
-                    continue
-                raise
-        aggregated = {}
-        for item_data in items_data:
-            variant_id = item_data.get('variant_id')
-            quantity = int(item_data.get('quantity', 1) or 1)
-            if not variant_id or quantity < 1:
-                continue
-            aggregated[variant_id] = aggregated.get(variant_id, 0) + quantity
-        if aggregated:
-            variants = ProductVariant.objects.select_related('product').filter(id__in=list(aggregated.keys()))
-            items_to_create = []
-            for variant in variants:
-                unit_price = variant.price or variant.product.base_price
-                product_name = variant.product.name
-                qty = aggregated.get(variant.id, 0)
-                if qty > 0:
-                    items_to_create.append(CartItem(
-                        cart=cart,
-                        variant=variant,
-                        product_name=product_name,
-                        unit_price=unit_price,
-                        quantity=qty
-                    ))
-            if items_to_create:
-                for attempt in range(5):
-                    try:
-                        with transaction.atomic():
-                            CartItem.objects.bulk_create(items_to_create)
-                        break
-                    except OperationalError as e:
-                        if 'database is locked' in str(e).lower() and attempt < 4:
-                            time.sleep(0.05 * (2 ** attempt))
-                            continue
-                        raise
+    desired = parse_items(items_data)
+    try:
+        with locked_cart(cart, get_expected_version(request)) as cart:
+            changed, removed, final = apply_cart_delta(cart, desired, replace=request.method == 'POST')
+            if not changed and not removed:
+                discard_cart_write(cart)
+    except CartConflict as exc:
+        return _conflict_response(exc)
     
-    return Response(CartSerializer(cart).data, status=status.HTTP_200_OK)
+    return Response({
+        "id": cart.id,
+        "version": cart.version,
+        "items": CartItemSerializer(changed, many=True).data,
+        "removed": removed,
+        "subtotal": sum(item.unit_price * item.quantity for item in final),
+        "total_items": sum(item.quantity for item in final),
+    }, status=status.HTTP_200_OK)
@@ -6,7 +6,14 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
 from .models import Cart, CartItem
+from .concurrency import get_or_create_cart, locked_cart
+from .serializers import CartSerializer, load_cart
+from .reservations import availability
+from .hot import flush_hot_cart, get_hot_cart_store, hot_cart_enabled, hot_cart_view
+from . import views_hot
 from catalog.models import ProductVariant
 
 
@@ -25,6 +32,11 @@ def merge_cart(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
+    # Carrinhos quentes (CART_STORAGE = 'cache') vão para o banco antes do merge
+    hot_owners = []
+    if hot_cart_enabled():
+        hot_owners = [flush_hot_cart(session_key=guest_session_key), flush_hot_cart(user=user)]
+    
     try:
         with transaction.atomic():
             # Buscar carrinho guest
@@ -40,30 +52,40 @@ def merge_cart(request):
                 })
             
             # Buscar ou criar carrinho do usuário
-            user_cart, created = Cart.objects.get_or_create(user=user)
+            user_cart = get_or_create_cart(user=user)
             
-            # Mesclar itens
-            merged_count = 0
-            for guest_item in guest_cart.items.all():
-                # Verificar se item já existe no carrinho do usuário
-                user_item = user_cart.items.filter(
-                    variant=guest_item.variant
-                ).first()
-                
-                if user_item:
-                    # Somar quantidades
-                    user_item.quantity += guest_item.quantity
-                    user_item.save()
-                else:
-                    # Mover item para carrinho do usuário
-                    guest_item.cart = user_cart
-                    guest_item.save()
-                
-                merged_count += 1
+            # Trava os dois carrinhos sempre na mesma ordem (por id)
+            first, second = sorted([guest_cart, user_cart], key=lambda c: c.pk)
+            with locked_cart(first), locked_cart(second):
+                # Mesclar itens (itens da mesma variante somam quantidades)
+                guest_items = list(guest_cart.items.all())
+                by_variant = {
+                    item.variant_id: item
+                    for item in user_cart.items.filter(variant_id__in=[g.variant_id for g in guest_items])
+                }
+                now = timezone.now()
+                changed = {}
+                for guest_item in guest_items:
+                    target = by_variant.get(guest_item.variant_id)
+                    if target:
+                        # Somar quantidades
+                        target.quantity += guest_item.quantity
+                    else:
+                        # Mover item para carrinho do usuário
+                        guest_item.cart = user_cart
+                        target = by_variant[guest_item.variant_id] = guest_item
+                    target.updated_at = now
+                    changed[target.id] = target
+                CartItem.objects.bulk_update(list(changed.values()), ['cart', 'quantity', 'updated_at'])
+                merged_count = len(guest_items)
             
             # Deletar carrinho guest
             guest_cart.delete()
             
+            # Próxima leitura recarrega o carrinho mesclado do banco
+            for owner in hot_owners:
+                transaction.on_commit(lambda owner=owner: get_hot_cart_store().evict(owner))
+            
             return Response({
                 'success': True,
                 'merged_count': merged_count,
@@ -79,6 +101,7 @@ def merge_cart(request):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@hot_cart_view(views_hot.cart_count)
 def cart_count(request):
     """
     Retorna quantidade de itens no carrinho
@@ -96,7 +119,7 @@ def cart_count(request):
     if not cart:
         return Response({'count': 0})
     
-    count = sum(item.quantity for item in cart.items.all())
+    count = cart.items.aggregate(total=Sum('quantity'))['total'] or 0
     
     return Response({'count': count})
 
@@ -110,6 +133,9 @@ def validate_cart_stock(request):
     user = request.user if request.user.is_authenticated else None
     session_key = request.headers.get('X-Session-Key')
     
+    # Checkout: persiste o carrinho quente antes de validar
+    flush_hot_cart(user, session_key)
+    
     if user:
         cart = Cart.objects.filter(user=user).first()
     elif session_key:
@@ -129,22 +155,30 @@ def validate_cart_stock(request):
     out_of_stock = []
     insufficient_stock = []
     
-    for item in cart.items.all():
+    # Estoque menos reservas de terceiros, para todos os itens de uma vez
+    items = list(cart.items.select_related('variant'))
+    requested = {}
+    for item in items:
+        requested[item.variant_id] = requested.get(item.variant_id, 0) + item.quantity
+    stock = availability(requested, session_key=session_key, user=user)
+    
+    for item in items:
         variant = item.variant
+        available = stock[variant.id]['available'] if variant.id in stock else 0
         
-        if variant.stock == 0:
+        if available == 0:
             out_of_stock.append({
                 'item_id': item.id,
                 'product_name': item.product_name,
                 'size': variant.size,
                 'color': variant.color
             })
-        elif variant.stock < item.quantity:
+        elif available < item.quantity:
             insufficient_stock.append({
                 'item_id': item.id,
                 'product_name': item.product_name,
                 'requested': item.quantity,
-                'available': variant.stock,
+                'available': available,
                 'size': variant.size,
                 'color': variant.color
             })
@@ -160,6 +194,7 @@ def validate_cart_stock(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@hot_cart_view(views_hot.add_to_cart)
 def add_to_cart_with_validation(request):
     """
     Adiciona item ao carrinho com validação de estoque
@@ -203,12 +238,9 @@ def add_to_cart_with_validation(request):
     session_key = request.headers.get('X-Session-Key')
     
     if user:
-        cart, created = Cart.objects.get_or_create(user=user)
+        cart = get_or_create_cart(user=user)
     elif session_key:
-        cart, created = Cart.objects.get_or_create(
-            session_key=session_key,
-            user__isnull=True
-        )
+        cart = get_or_create_cart(session_key=session_key)
     else:
         return Response(
             {'error': 'Session key é obrigatório para guests'},
@@ -216,35 +248,36 @@ def add_to_cart_with_validation(request):
         )
     
     # Adicionar ou atualizar item
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        variant=variant,
-        defaults={
-            'product_name': variant.product.name,
-            'unit_price': variant.price or variant.product.base_price,
-            'quantity': quantity
-        }
-    )
-    
-    if not created:
-        # Verificar se a nova quantidade não excede o estoque
-        new_quantity = cart_item.quantity + quantity
-        if new_quantity > variant.stock:
-            return Response(
-                {
-                    'error': 'Estoque insuficiente',
-                    'available': variant.stock,
-                    'current_in_cart': cart_item.quantity,
-                    'requested': quantity
-                },
-                status=status.HTTP_400_BAD_REQUEST
-            )
+    with locked_cart(cart) as cart:
+        cart_item, created = CartItem.objects.get_or_create(
+            cart=cart,
+            variant=variant,
+            defaults={
+                'product_name': variant.product.name,
+                'unit_price': variant.price or variant.product.base_price,
+                'quantity': quantity
+            }
+        )
         
-        cart_item.quantity = new_quantity
-        cart_item.save()
+        if not created:
+            # Verificar se a nova quantidade não excede o estoque
+            new_quantity = cart_item.quantity + quantity
+            if new_quantity > variant.stock:
+                transaction.set_rollback(True)
+                return Response(
+                    {
+                        'error': 'Estoque insuficiente',
+                        'available': variant.stock,
+                        'current_in_cart': cart_item.quantity,
+                        'requested': quantity
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            cart_item.quantity = new_quantity
+            cart_item.save()
     
-    from .serializers import CartSerializer
     return Response(
-        CartSerializer(cart).data,
+        CartSerializer(load_cart(cart.id)).data,
         status=status.HTTP_201_CREATED if created else status.HTTP_200_OK
     )
@@ -0,0 +1,183 @@
+"""
+Views do carrinho no modo CART_STORAGE = 'cache' (cart.hot)
+
+Mesmas rotas e respostas de cart.views; as escritas vão para o cache e são
+persistidas em segundo plano. Ativadas por cart.hot.hot_cart_view.
+"""
+from rest_framework.response import Response
+from rest_framework import status
+from django.shortcuts import get_object_or_404
+from catalog.models import ProductVariant
+from .concurrency import get_expected_version
+from .hot import (
+    CartBusy, HotCartConflict, HotStockError, cart_owner, get_hot_cart_store,
+)
+from .sync import primary_image_url, parse_items
+
+SESSION_REQUIRED = "Informe X-Session-Key no header para carrinho de convidado."
+
+
+def _owner(request):
+    session_key = request.headers.get('X-Session-Key') or request.query_params.get('session_key')
+    return cart_owner(request.user, session_key)
+
+
+def _error_response(exc, store):
+    if isinstance(exc, HotCartConflict):
+        return Response({
+            "error": "O carrinho foi alterado em outra sessão",
+            "cart": store.to_response(exc.state),
+        }, status=status.HTTP_409_CONFLICT)
+    return Response(
+        {"error": "Carrinho ocupado, tente novamente"},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
+
+
+def get_cart(request):
+    owner = _owner(request)
+    if owner is None:
+        return Response({"error": SESSION_REQUIRED}, status=status.HTTP_400_BAD_REQUEST)
+    store = get_hot_cart_store()
+    return Response(store.to_response(store.get(owner)))
+
+
+def add_to_cart(request):
+    owner = _owner(request)
+    if owner is None:
+        return Response({"error": SESSION_REQUIRED}, status=status.HTTP_400_BAD_REQUEST)
+
+    variant_id = request.data.get('variant_id')
+    quantity = int(request.data.get('quantity') or 1)
+    if not variant_id:
+        return Response({"error": "variant_id é obrigatório"}, status=status.HTTP_400_BAD_REQUEST)
+    if quantity < 1:
+        quantity = 1
+
+    variant = get_object_or_404(
+        ProductVariant.objects.select_related('product').prefetch_related('product__images'),
+        id=variant_id
+    )
+    if variant.stock < quantity:
+        return Response({
+            "error": "Estoque insuficiente",
+            "available": variant.stock,
+            "requested": quantity
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    store = get_hot_cart_store()
+    try:
+        state = store.add(
+            owner, variant, quantity,
+            image_url=primary_image_url(variant.product),
+            expected_version=get_expected_version(request),
+        )
+    except (HotCartConflict, CartBusy) as exc:
+        return _error_response(exc, store)
+    except HotStockError as exc:
+        return Response({
+            "error": "Estoque insuficiente",
+            "available": exc.available,
+            "current_in_cart": exc.current,
+            "requested": quantity
+        }, status=status.HTTP_400_BAD_REQUEST)
+    return Response(store.to_response(state), status=status.HTTP_200_OK)
+
+
+def update_item(request, item_id: int):
+    owner = _owner(request)
+    if owner is None:
+        return Response({"error": SESSION_REQUIRED}, status=status.HTTP_400_BAD_REQUEST)
+    quantity = int(request.data.get('quantity') or 1)
+    stock = None
+    if quantity > 0:
+        stock = ProductVariant.objects.filter(id=item_id).values_list('stock', flat=True).first()
+
+    store = get_hot_cart_store()
+    try:
+        state = store.set_quantity(owner, item_id, quantity, stock, get_expected_version(request))
+    except (HotCartConflict, CartBusy) as exc:
+        return _error_response(exc, store)
+    except HotStockError as exc:
+        return Response({
+            "error": "Estoque insuficiente",
+            "available": exc.available,
+            "requested": quantity
+        }, status=status.HTTP_400_BAD_REQUEST)
+    if state is None:
+        return Response({"detail": "Item não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(store.to_response(state))
+
+
+def remove_item(request, item_id: int):
+    owner = _owner(request)
+    if owner is None:
+        return Response({"error": SESSION_REQUIRED}, status=status.HTTP_400_BAD_REQUEST)
+    store = get_hot_cart_store()
+    try:
+        state = store.set_quantity(owner, item_id, 0, expected_version=get_expected_version(request))
+    except (HotCartConflict, CartBusy) as exc:
+        return _error_response(exc, store)
+    if state is None:
+        return Response({"detail": "Item não encontrado."}, status=status.HTTP_404_NOT_FOUND)
+    return Response(store.to_response(state))
+
+
+def clear_cart(request):
+    owner = _owner(request)
+    if owner is None:
+        return Response({"error": SESSION_REQUIRED}, status=status.HTTP_400_BAD_REQUEST)
+    store = get_hot_cart_store()
+    try:
+        store.clear(owner, get_expected_version(request))
+    except (HotCartConflict, CartBusy) as exc:
+        return _error_response(exc, store)
+    return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+def sync_cart(request):
+    owner = _owner(request)
+    if owner is None:
+        return Response({"error": SESSION_REQUIRED}, status=status.HTTP_400_BAD_REQUEST)
+
+    items_data = request.data.get('items', [])
+    if not isinstance(items_data, list):
+        return Response({"error": "items deve ser um array"}, status=status.HTTP_400_BAD_REQUEST)
+
+    store = get_hot_cart_store()
+    desired = parse_items(items_data)
+    present = {item['variant'] for item in store.get(owner)['items']}
+    missing = [vid for vid, qty in desired.items() if qty > 0 and vid not in present]
+    variants = []
+    if missing:
+        variants = list(
+            ProductVariant.objects.filter(id__in=missing)
+            .select_related('product')
+            .prefetch_related('product__images')
+        )
+    try:
+        state, changed, removed = store.replace(
+            owner, desired, variants,
+            replace=request.method == 'POST',
+            expected_version=get_expected_version(request),
+        )
+    except (HotCartConflict, CartBusy) as exc:
+        return _error_response(exc, store)
+
+    response = store.to_response(state)
+    return Response({
+        "id": response['id'],
+        "version": response['version'],
+        "items": changed,
+        "removed": removed,
+        "subtotal": response['subtotal'],
+        "total_items": response['total_items'],
+    }, status=status.HTTP_200_OK)
+
+
+def cart_count(request):
+    owner = cart_owner(request.user, request.headers.get('X-Session-Key'))
+    if owner is None:
+        return Response({'count': 0})
+    state = get_hot_cart_store().get(owner)
+    return Response({'count': sum(item['quantity'] for item in state['items'])})
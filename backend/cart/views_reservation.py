@@ -1,10 +1,13 @@
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
+from django.conf import settings
 from django.db import transaction
 from catalog.models import ProductVariant
 from .models_reservation import StockReservation, ReservationLog
+from .reservations import InsufficientStock, availability, release, reserve
+from .sync import parse_items
 
 
 @api_view(['POST'])
@@ -40,48 +43,35 @@ def create_stock_reservation(request):
     except ProductVariant.DoesNotExist:
         return Response({'error': 'Variante não encontrada'}, status=status.HTTP_404_NOT_FOUND)
     
-    # Verificar estoque disponível
-    reserved_quantity = StockReservation.get_reserved_quantity(variant)
-    available_stock = variant.stock - reserved_quantity
-    
-    # Considera reserva existente do usuário
-    existing_reservation = StockReservation.get_active_reservation(variant, session_key, user)
-    if existing_reservation:
-        available_stock += existing_reservation.quantity
-    
-    if quantity > available_stock:
+    # Checagem e reserva atômicas (contador da variante travado)
+    try:
+        with transaction.atomic():
+            reservation, created, available_stock = reserve(
+                variant.id, quantity, session_key=session_key, user=user, minutes=15  # 15 minutos de reserva
+            )
+            
+            # Log
+            ReservationLog.objects.create(
+                reservation=reservation,
+                variant=variant,
+                action='created' if created else 'extended',
+                quantity=quantity,
+                session_key=session_key or '',
+                user=user,
+                notes=f'Reserva {"criada" if created else "atualizada"} via API'
+            )
+    except InsufficientStock as e:
         return Response({
-            'error': f'Estoque insuficiente. Disponível: {available_stock}',
-            'available': available_stock
+            'error': f'Estoque insuficiente. Disponível: {e.available}',
+            'available': e.available
         }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Criar ou atualizar reserva
-    with transaction.atomic():
-        reservation = StockReservation.create_reservation(
-            variant=variant,
-            quantity=quantity,
-            session_key=session_key,
-            user=user,
-            minutes=15  # 15 minutos de reserva
-        )
-        
-        # Log
-        ReservationLog.objects.create(
-            reservation=reservation,
-            variant=variant,
-            action='created' if not existing_reservation else 'extended',
-            quantity=quantity,
-            session_key=session_key or '',
-            user=user,
-            notes=f'Reserva {"criada" if not existing_reservation else "atualizada"} via API'
-        )
-    
     return Response({
         'reservation_id': reservation.id,
         'expires_at': reservation.expires_at.isoformat(),
         'quantity': reservation.quantity,
         'variant_id': variant.id,
-        'available_stock': available_stock - quantity
+        'available_stock': available_stock
     }, status=status.HTTP_201_CREATED)
 
 
@@ -136,7 +126,7 @@ def cancel_stock_reservation(request, reservation_id):
             notes='Reserva cancelada pelo usuário'
         )
         
-        reservation.delete()
+        release(reservation)
         
         return Response({'message': 'Reserva cancelada'}, status=status.HTTP_200_OK)
     except StockReservation.DoesNotExist:
@@ -160,34 +150,63 @@ def check_availability(request):
         return Response({'error': 'variant_id é obrigatório'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        variant = ProductVariant.objects.get(id=variant_id)
-    except ProductVariant.DoesNotExist:
-        return Response({'error': 'Variante não encontrada'}, status=status.HTTP_404_NOT_FOUND)
+        variant_id = int(variant_id)
+    except ValueError:
+        return Response({'error': 'variant_id inválido'}, status=status.HTTP_400_BAD_REQUEST)
     
-    reserved_quantity = StockReservation.get_reserved_quantity(variant)
-    available_stock = variant.stock - reserved_quantity
+    info = availability({variant_id: quantity}).get(variant_id)
+    if info is None:
+        return Response({'error': 'Variante não encontrada'}, status=status.HTTP_404_NOT_FOUND)
     
     return Response({
-        'variant_id': variant.id,
-        'total_stock': variant.stock,
-        'reserved': reserved_quantity,
-        'available': available_stock,
-        'is_available': quantity <= available_stock,
+        'variant_id': variant_id,
+        'total_stock': info['stock'],
+        'reserved': info['reserved'],
+        'available': info['available'],
+        'is_available': info['shortfall'] == 0,
         'requested_quantity': quantity
     })
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
-def cleanup_expired_reservations(request):
+def check_availability_batch(request):
     """
-    Limpa reservas expiradas (para uso em cronjobs)
-    Requer autenticação de admin em produção
+    Verifica a disponibilidade de várias variantes em uma única consulta
+    
+    Body:
+    {
+        "items": [{"variant_id": 1, "quantity": 2}, ...],
+        "session_key": "abc123" // Opcional: reservas da própria sessão não contam
+    }
     """
-    # Em produção, adicionar permissão de admin
-    # @permission_classes([IsAdminUser])
+    items_data = request.data.get('items', [])
+    if not isinstance(items_data, list):
+        return Response({'error': 'items deve ser um array'}, status=status.HTTP_400_BAD_REQUEST)
     
-    expired_count = StockReservation.cleanup_expired()
+    requested = parse_items(items_data)
+    user = request.user if request.user.is_authenticated else None
+    result = availability(requested, session_key=request.data.get('session_key'), user=user)
+    
+    items = [{'variant_id': variant_id, **info} for variant_id, info in result.items()]
+    return Response({
+        'items': items,
+        'not_found': [variant_id for variant_id in requested if variant_id not in result],
+        'all_available': len(result) == len(requested) and all(info['shortfall'] == 0 for info in result.values()),
+    })
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def cleanup_expired_reservations(request):
+    """
+    Limpa reservas expiradas (para uso em cronjobs, somente admin)
+    No máximo RESERVATION_REAPER_MAX_BATCHES lotes por requisição; o
+    restante fica para a próxima chamada ou para a limpeza de cada variante.
+    """
+    expired_count = StockReservation.cleanup_expired(
+        max_batches=getattr(settings, 'RESERVATION_REAPER_MAX_BATCHES', 10)
+    )
     
     return Response({
         'message': f'{expired_count} reservas expiradas removidas',
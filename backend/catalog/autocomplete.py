@@ -0,0 +1,360 @@
+"""
+Índice de autocomplete em memória (edge n-grams)
+
+Cada processo mantém um índice com os nomes dos produtos ativos e das
+categorias, com acentos removidos e peso por popularidade (unidades
+vendidas em pedidos pagos). Consultas não tocam o banco.
+
+Atualização:
+- saves de Product e ProductImage agendam o produto após o commit
+  (variantes e estoque não aparecem no autocomplete e não agendam nada);
+- se a entrada recalculada é igual à do índice local, nada é publicado;
+- senão, o processo atualiza o próprio índice e publica um delta no cache:
+  SEQUENCE_CACHE_KEY (inteiro) avança e DELTA_CACHE_KEY.<n> guarda os ids;
+- os demais workers, ao ver outra sequência, recarregam só os ids dos
+  deltas; sem os deltas (expirados, mais de MAX_DELTAS ou '*' de
+  invalidate_autocomplete) reconstroem o índice numa thread, servindo o
+  índice atual enquanto isso;
+- o índice também é reconstruído (em segundo plano) após
+  AUTOCOMPLETE_MAX_AGE segundos. Só a primeira consulta do processo
+  constrói o índice dentro da requisição.
+"""
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from .indexing import AfterCommitIds
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+MIN_PREFIX = 2
+MAX_PREFIX = 20
+SEQUENCE_CACHE_KEY = 'catalog:autocomplete:seq'
+DELTA_CACHE_KEY = 'catalog:autocomplete:delta'
+DELTA_TTL = 24 * 3600
+MAX_DELTAS = 100
+FULL_REBUILD = '*'
+
+
+def _prefixes(tokens):
+    result = set()
+    for token in tokens:
+        for size in range(MIN_PREFIX, min(len(token), MAX_PREFIX) + 1):
+            result.add(token[:size])
+    return result
+
+
+class AutocompleteIndex:
+    """
+    Mapa prefixo -> ids de produto ordenados por (-peso, nome).
+    Ids de categoria ficam em um mapa separado com a mesma estrutura.
+    """
+
+    def __init__(self, version=None):
+        self.version = version
+        self.built_at = time.monotonic()
+        self.products = {}
+        self.categories = {}
+        self._product_postings = {}
+        self._category_postings = {}
+        self._lock = threading.Lock()
+
+    # ---- construção ----
+
+    @staticmethod
+    def _sort_key(entry):
+        return (-entry['weight'], entry['name'].lower(), entry['id'])
+
+    def _add(self, entries, postings, entry):
+        entries[entry['id']] = entry
+        key = self._sort_key(entry)
+        for prefix in entry['prefixes']:
+            bucket = postings.setdefault(prefix, [])
+            bisect.insort(bucket, (key, entry['id']))
+
+    def _remove(self, entries, postings, entry_id):
+        entry = entries.pop(entry_id, None)
+        if entry is None:
+            return
+        item = (self._sort_key(entry), entry_id)
+        for prefix in entry['prefixes']:
+            bucket = postings.get(prefix)
+            if not bucket:
+                continue
+            idx = bisect.bisect_left(bucket, item)
+            if idx < len(bucket) and bucket[idx] == item:
+                del bucket[idx]
+            if not bucket:
+                del postings[prefix]
+
+    def add_product(self, entry):
+        with self._lock:
+            self._remove(self.products, self._product_postings, entry['id'])
+            self._add(self.products, self._product_postings, entry)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._remove(self.products, self._product_postings, product_id)
+
+    def add_category(self, entry):
+        with self._lock:
+            self._remove(self.categories, self._category_postings, entry['id'])
+            self._add(self.categories, self._category_postings, entry)
+
+    # ---- consulta ----
+
+    def _match(self, entries, postings, terms, limit):
+        lookup = [term[:MAX_PREFIX] for term in terms]
+        buckets = [postings.get(prefix) for prefix in lookup]
+        if not all(buckets):
+            return []
+        # Percorre a menor lista (já ordenada por popularidade) e confere os demais termos
+        results = []
+        for _, entry_id in min(buckets, key=len):
+            entry = entries[entry_id]
+            if any(prefix not in entry['prefixes'] for prefix in lookup):
+                continue
+            if any(len(term) > MAX_PREFIX and not any(t.startswith(term) for t in entry['tokens']) for term in terms):
+                continue
+            results.append(entry)
+            if len(results) >= limit:
+                break
+        return results
+
+    def suggest(self, query, limit=10):
+        terms = [t for t in tokenize(query) if len(t) >= MIN_PREFIX]
+        if not terms:
+            return []
+        with self._lock:
+            return self._match(self.products, self._product_postings, terms, limit)
+
+    def suggest_categories(self, query, limit=5):
+        terms = [t for t in tokenize(query) if len(t) >= MIN_PREFIX]
+        if not terms:
+            return []
+        with self._lock:
+            return self._match(self.categories, self._category_postings, terms, limit)
+
+
+def _load_weights(product_ids=None):
+    from .sales_models import ProductSalesStats
+
+    qs = ProductSalesStats.objects.filter(units_total__gt=0)
+    if product_ids is not None:
+        qs = qs.filter(product_id__in=product_ids)
+    return dict(qs.values_list('product_id', 'units_total'))
+
+
+def _product_entries(products, weights):
+    from .serializers import ProductImageSerializer
+
+    image_serializer = ProductImageSerializer()
+    entries = []
+    for product in products:
+        images = list(product.images.all())
+        image = next((img for img in images if img.is_primary), images[0] if images else None)
+        category_name = product.category.name if product.category_id else ''
+        tokens = tokenize(f"{product.name} {category_name}")
+        entries.append({
+            'id': product.id,
+            'name': product.name,
+            'category': category_name,
+            'price': float(product.base_price),
+            'image': image_serializer.get_image(image) if image else None,
+            'weight': weights.get(product.id, 0),
+            'tokens': tokens,
+            'prefixes': _prefixes(tokens),
+        })
+    return entries
+
+
+def _products_queryset():
+    from .models import Product
+
+    return (
+        Product.objects.filter(is_active=True)
+        .select_related('category')
+        .prefetch_related('images')
+    )
+
+
+def build_index(version=None):
+    """Constrói um índice completo a partir do banco"""
+    from .models import Category
+
+    index = AutocompleteIndex(version=version)
+    weights = _load_weights()
+    for entry in _product_entries(_products_queryset(), weights):
+        index.add_product(entry)
+
+    for category in Category.objects.all():
+        tokens = tokenize(category.name)
+        index.add_category({
+            'id': category.id,
+            'name': category.name,
+            'slug': category.slug,
+            'weight': 0,
+            'tokens': tokens,
+            'prefixes': _prefixes(tokens),
+        })
+    return index
+
+
+def current_sequence():
+    return cache.get(SEQUENCE_CACHE_KEY) or 0
+
+
+def _publish(delta):
+    """Avança a sequência e grava o delta (lista de ids ou FULL_REBUILD). Retorna o número."""
+    cache.add(SEQUENCE_CACHE_KEY, 0, None)
+    try:
+        sequence = cache.incr(SEQUENCE_CACHE_KEY)
+    except ValueError:
+        # Chave expulsa do cache entre o add e o incr
+        cache.add(SEQUENCE_CACHE_KEY, 1, None)
+        sequence = cache.get(SEQUENCE_CACHE_KEY) or 1
+    cache.set(f'{DELTA_CACHE_KEY}:{sequence}', delta, DELTA_TTL)
+    return sequence
+
+
+def _load_entries(product_ids):
+    products = _products_queryset().filter(pk__in=product_ids)
+    return {entry['id']: entry for entry in _product_entries(products, _load_weights(product_ids))}
+
+
+def _apply(index, product_ids, entries):
+    for product_id in product_ids:
+        entry = entries.get(product_id)
+        if entry is None:
+            index.remove_product(product_id)
+        else:
+            index.add_product(entry)
+
+
+_index = None
+_index_lock = threading.Lock()
+_catch_up_lock = threading.Lock()
+_rebuilding = False
+_last_check = 0.0
+
+
+def _rebuild():
+    global _index
+    sequence = current_sequence()
+    index = build_index(version=sequence)
+    _index = index
+    logger.info(f"Autocomplete index built: {len(index.products)} products")
+    return index
+
+
+def _run_background_rebuild():
+    global _rebuilding
+    try:
+        _rebuild()
+    except Exception as e:
+        logger.warning(f"Autocomplete rebuild failed: {e}")
+    finally:
+        _rebuilding = False
+        connection.close()
+
+
+def _rebuild_in_background():
+    global _rebuilding
+    with _index_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_run_background_rebuild, daemon=True).start()
+
+
+def _catch_up(index, sequence):
+    """Aplica os deltas publicados depois de index.version (ou agenda a reconstrução)"""
+    if not _catch_up_lock.acquire(blocking=False):
+        return  # outra thread já está atualizando; serve o índice atual
+    try:
+        start = index.version or 0
+        if sequence < start or sequence - start > MAX_DELTAS:
+            _rebuild_in_background()
+            return
+        keys = [f'{DELTA_CACHE_KEY}:{n}' for n in range(start + 1, sequence + 1)]
+        deltas = cache.get_many(keys)
+        if len(deltas) < len(keys) or FULL_REBUILD in deltas.values():
+            _rebuild_in_background()
+            return
+        product_ids = sorted({pid for delta in deltas.values() for pid in delta})
+        _apply(index, product_ids, _load_entries(product_ids))
+        index.version = sequence
+    finally:
+        _catch_up_lock.release()
+
+
+def get_autocomplete_index():
+    """
+    Retorna o índice do processo. Só constrói dentro da requisição se ainda
+    não existe; deltas de outros workers são aplicados incrementalmente e
+    reconstruções completas rodam em segundo plano.
+    """
+    global _last_check
+
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _rebuild()
+        return _index
+
+    now = time.monotonic()
+    max_age = getattr(settings, 'AUTOCOMPLETE_MAX_AGE', 3600)
+    check_interval = getattr(settings, 'AUTOCOMPLETE_VERSION_CHECK_INTERVAL', 5)
+    if now - index.built_at > max_age:
+        _rebuild_in_background()
+    elif now - _last_check > check_interval:
+        _last_check = now
+        sequence = current_sequence()
+        if sequence != index.version:
+            _catch_up(index, sequence)
+    return _index
+
+
+def reset_autocomplete_index():
+    """Descarta o índice do processo (próxima consulta reconstrói)"""
+    global _index
+    _index = None
+
+
+def invalidate_autocomplete():
+    """Força a reconstrução em todos os workers (ex.: categoria renomeada)"""
+    _publish(FULL_REBUILD)
+
+
+def refresh_autocomplete(product_ids):
+    """
+    Recalcula as entradas dos produtos; publica um delta só com os que
+    mudaram em relação ao índice local.
+    """
+    index = _index
+    entries = _load_entries(product_ids)
+    if index is not None:
+        product_ids = [pid for pid in product_ids if index.products.get(pid) != entries.get(pid)]
+    if not product_ids:
+        return
+    sequence = _publish(product_ids)
+    if index is not None:
+        _apply(index, product_ids, entries)
+        # Com deltas de outros workers no meio, a próxima verificação os aplica
+        if index.version == sequence - 1:
+            index.version = sequence
+
+
+_pending = AfterCommitIds(refresh_autocomplete)
+
+
+def schedule_autocomplete_refresh(product_id):
+    """Agenda a atualização do produto no autocomplete para depois do commit"""
+    _pending.add(product_id)
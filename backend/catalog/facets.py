@@ -0,0 +1,140 @@
+"""
+Facetas pré-computadas para os filtros de busca
+
+Cada produto ativo tem linhas em ProductFacet (índice invertido) para
+categoria, tamanhos, cores, tecido, faixa de preço e disponibilidade.
+As contagens de todas as facetas para o resultado atual saem de um único
+GROUP BY, no lugar de um DISTINCT por filtro.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .indexing import register_index
+from .search_models import ProductFacet
+
+# Faixas de preço (base_price): (chave, mínimo inclusivo, máximo exclusivo)
+PRICE_BUCKETS = [
+    ('0-50', 0, 50),
+    ('50-100', 50, 100),
+    ('100-200', 100, 200),
+    ('200+', 200, None),
+]
+
+SIZE_ORDER = ['XS', 'S', 'M', 'L', 'XL', 'XXL']
+
+
+def price_bucket(price):
+    """Retorna a chave da faixa de preço de um valor"""
+    value = float(price or 0)
+    for key, low, high in PRICE_BUCKETS:
+        if value >= low and (high is None or value < high):
+            return key
+    return PRICE_BUCKETS[-1][0]
+
+
+def build_facets(product):
+    """Gera as linhas de faceta de um produto (variants devem estar pré-carregadas)"""
+    values = {}
+
+    def add(facet, value, in_stock):
+        if not value:
+            return
+        key = (facet, str(value)[:100])
+        values[key] = values.get(key, False) or in_stock
+
+    variants = list(product.variants.all())
+    any_stock = any(v.stock > 0 for v in variants)
+
+    add('category', product.category_id, any_stock)
+    add('fabric', product.fabric_type, any_stock)
+    add('price', price_bucket(product.base_price), any_stock)
+    if any_stock:
+        add('stock', 'in_stock', True)
+    for v in variants:
+        add('size', v.size, v.stock > 0)
+        add('color', v.color, v.stock > 0)
+
+    return [
+        ProductFacet(product_id=product.pk, facet=facet, value=value, in_stock=in_stock)
+        for (facet, value), in_stock in values.items()
+    ]
+
+
+@register_index
+def refresh_product_facets(product_ids):
+    """
+    Recalcula as facetas dos produtos informados.
+    Produtos inativos ou removidos ficam sem linhas.
+    """
+    from .models import Product
+
+    products = (
+        Product.objects.filter(pk__in=product_ids, is_active=True)
+        .prefetch_related('variants')
+    )
+    rows = []
+    for product in products:
+        rows.extend(build_facets(product))
+
+    with transaction.atomic():
+        ProductFacet.objects.filter(product_id__in=product_ids).delete()
+        ProductFacet.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def rebuild_facets(batch_size=500):
+    """Recalcula as facetas de todo o catálogo em lotes"""
+    from .models import Product
+
+    ProductFacet.objects.all().delete()
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        refresh_product_facets(ids[start:start + batch_size])
+    return len(ids)
+
+
+def products_with_facet(facet, values, in_stock_only=False):
+    """Subquery de ids de produtos que têm algum dos valores da faceta"""
+    qs = ProductFacet.objects.filter(facet=facet, value__in=list(values))
+    if in_stock_only:
+        qs = qs.filter(in_stock=True)
+    return qs.values('product_id')
+
+
+def compute_facet_counts(products):
+    """
+    Conta produtos por valor de faceta para o queryset informado,
+    em uma única consulta agregada.
+
+    Retorna {'size': [{'value': 'M', 'count': 3, 'in_stock_count': 2}, ...], ...}
+    """
+    rows = (
+        ProductFacet.objects.filter(product_id__in=products.order_by().values('id'))
+        .values('facet', 'value')
+        .annotate(
+            count=Count('product_id'),
+            in_stock_count=Count('product_id', filter=Q(in_stock=True)),
+        )
+        .order_by()
+    )
+
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row['facet']].append({
+            'value': row['value'],
+            'count': row['count'],
+            'in_stock_count': row['in_stock_count'],
+        })
+
+    size_rank = {s: i for i, s in enumerate(SIZE_ORDER)}
+    bucket_rank = {key: i for i, (key, _, _) in enumerate(PRICE_BUCKETS)}
+    for facet, items in grouped.items():
+        if facet == 'size':
+            items.sort(key=lambda i: (size_rank.get(i['value'], len(size_rank)), i['value']))
+        elif facet == 'price':
+            items.sort(key=lambda i: bucket_rank.get(i['value'], len(bucket_rank)))
+        else:
+            items.sort(key=lambda i: (-i['count'], i['value']))
+    return dict(grouped)
@@ -0,0 +1,197 @@
+"""
+Versões responsivas (WebP/AVIF) das imagens de produto
+
+Ao salvar uma ProductImage com imagem nova o id é agendado para depois do
+commit; o worker gera cada formato de CATALOG_IMAGE_FORMATS em cada largura
+de CATALOG_IMAGE_WIDTHS (sem ampliar) e grava ao lado do original:
+
+    products/camisa.jpg -> products/camisa.640w.webp, products/camisa.640w.avif, ...
+
+Os nomes ficam em ProductImage.derivatives junto com o nome do original
+('source'); o serializer só expõe o srcset enquanto o original for o mesmo.
+Ao gerar de novo, os arquivos novos são gravados e a linha atualizada antes
+de apagar os antigos: o srcset publicado nunca aponta para arquivos apagados.
+
+- CATALOG_IMAGE_DERIVATIVES = 'thread' (padrão; o deploy só tem o
+  gunicorn): thread em segundo plano no próprio processo.
+- 'celery': tarefa catalog.tasks.build_image_derivatives; sem broker, cai
+  no modo 'thread'.
+- 'sync': gera na hora, depois do commit (testes/scripts).
+
+O pool de processos (CATALOG_IMAGE_WORKERS, 0 = núcleos da CPU) só é usado
+pelo comando build_image_derivatives (imagens já existentes), pela tarefa
+do Celery e pelo modo 'sync'. No modo 'thread', o padrão, cada upload é
+processado com workers=1 na própria thread: não abre processos dentro do
+gunicorn, e um upload tem poucas imagens.
+"""
+import logging
+import multiprocessing
+import os
+import posixpath
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection
+from PIL import Image as PILImage, ImageOps, features
+
+from core.cache import CATALOG_TAG, invalidate_tags, product_tag
+from core.celery import try_apply_async
+
+from .indexing import AfterCommitIds
+from .models import ProductImage
+
+logger = logging.getLogger(__name__)
+
+QUALITY = {'webp': {'quality': 80, 'method': 4}, 'avif': {'quality': 55, 'speed': 6}}
+
+
+def widths():
+    return sorted(getattr(settings, 'CATALOG_IMAGE_WIDTHS', (320, 640, 960, 1280)))
+
+
+def formats():
+    # Pillow sem suporte a AVIF: só WebP
+    return [fmt for fmt in getattr(settings, 'CATALOG_IMAGE_FORMATS', ('avif', 'webp')) if features.check(fmt)]
+
+
+def _workers():
+    workers = getattr(settings, 'CATALOG_IMAGE_WORKERS', 0)
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def _flush_pending(image_ids):
+    mode = getattr(settings, 'CATALOG_IMAGE_DERIVATIVES', 'thread')
+    if mode == 'sync':
+        build_derivatives(image_ids)
+        return
+    if mode == 'celery':
+        from .tasks import build_image_derivatives as build_task
+        if try_apply_async(build_task, (image_ids,)):
+            return
+    threading.Thread(target=_run_thread, args=(image_ids,), daemon=True).start()
+
+
+_pending = AfterCommitIds(_flush_pending)
+
+
+def schedule_derivatives(image_id):
+    """Agenda a geração das versões da imagem para depois do commit"""
+    _pending.add(image_id)
+
+
+def _run_thread(image_ids):
+    try:
+        build_derivatives(image_ids, workers=1)
+    finally:
+        connection.close()
+
+
+def render_derivatives(data, target_widths, target_formats):
+    """
+    Bytes do original -> {formato: {largura: bytes}}. Roda nos processos do
+    pool: não usa Django.
+    """
+    with PILImage.open(BytesIO(data)) as im:
+        largest = max(target_widths)
+        im.draft('RGB', (largest, largest))  # JPEG: decodifica já reduzida
+        im = ImageOps.exif_transpose(im)
+        has_alpha = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+        im = im.convert('RGBA' if has_alpha else 'RGB')
+
+        rendered = {fmt: {} for fmt in target_formats}
+        current = im
+        # Da maior para a menor, reduzindo a anterior
+        for width in sorted({min(w, im.width) for w in target_widths}, reverse=True):
+            if current.width != width:
+                height = max(1, round(im.height * width / im.width))
+                current = current.resize((width, height), PILImage.LANCZOS)
+            for fmt in target_formats:
+                buf = BytesIO()
+                current.save(buf, fmt.upper(), **QUALITY.get(fmt, {}))
+                rendered[fmt][width] = buf.getvalue()
+    return rendered
+
+
+def derivative_names(derivatives):
+    return [name for fmt, by_width in derivatives.items() if fmt != 'source' for name in by_width.values()]
+
+
+def delete_derivatives(derivatives, keep=()):
+    for name in derivative_names(derivatives or {}):
+        if name in keep:
+            continue
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.warning(f"Could not delete derivative {name}: {e}")
+
+
+def _store(image, rendered):
+    stem = posixpath.splitext(image.image.name)[0]
+    derivatives = {'source': image.image.name}
+    for fmt, by_width in rendered.items():
+        derivatives[fmt] = {
+            str(width): default_storage.save(f"{stem}.{width}w.{fmt}", ContentFile(data))
+            for width, data in sorted(by_width.items())
+        }
+    # A imagem foi trocada enquanto renderizava: a troca já agendou outra geração
+    if not ProductImage.objects.filter(pk=image.pk, image=image.image.name).update(derivatives=derivatives):
+        delete_derivatives(derivatives)
+        return False
+    # Só agora o srcset deixa de citar os antigos (o storage pode ter reaproveitado um nome)
+    delete_derivatives(image.derivatives, keep=set(derivative_names(derivatives)))
+    return True
+
+
+def _executor(workers):
+    # Processo daemon (ex.: worker multiprocessing) não pode ter filhos
+    if workers > 1 and not multiprocessing.current_process().daemon:
+        return ProcessPoolExecutor(max_workers=workers)
+    return ThreadPoolExecutor(max_workers=1)
+
+
+def build_derivatives(image_ids, force=False, workers=None):
+    """
+    Gera as versões das imagens cujo original mudou (todas com force).
+    Retorna quantas imagens foram processadas.
+    """
+    images = [
+        image for image in ProductImage.objects.filter(pk__in=image_ids).order_by('pk')
+        if image.image and (force or image.derivatives.get('source') != image.image.name)
+    ]
+    target_formats = formats()
+    if not images or not target_formats:
+        return 0
+    target_widths = widths()
+    workers = min(workers or _workers(), len(images))
+
+    built = 0
+    product_ids = set()
+    with _executor(workers) as pool:
+        # Lotes pequenos: no máximo 2 originais por processo em memória
+        for start in range(0, len(images), workers * 2):
+            jobs = []
+            for image in images[start:start + workers * 2]:
+                try:
+                    with default_storage.open(image.image.name, 'rb') as f:
+                        data = f.read()
+                except Exception as e:
+                    logger.warning(f"Could not read image {image.image.name}: {e}")
+                    continue
+                jobs.append((image, pool.submit(render_derivatives, data, target_widths, target_formats)))
+            for image, job in jobs:
+                try:
+                    if _store(image, job.result()):
+                        built += 1
+                        product_ids.add(image.product_id)
+                except Exception as e:
+                    logger.warning(f"Derivatives failed for image {image.pk} ({image.image.name}): {e}")
+
+    if product_ids:
+        # Listagens e detalhes em cache trazem o srcset
+        invalidate_tags(CATALOG_TAG, *(product_tag(pk) for pk in product_ids))
+    return built
@@ -0,0 +1,67 @@
+"""
+Reindexação adiada de produtos
+
+Os sinais do catálogo apenas agendam o id do produto alterado. Depois do
+commit, cada índice registrado (busca, facetas, ...) recebe a lista de ids
+uma única vez, mesmo que o produto e várias variantes tenham sido salvos
+na mesma transação.
+
+AfterCommitIds é o mesmo mecanismo para outros trabalhos adiados
+(PDFs, versões das imagens).
+"""
+import logging
+import threading
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+_handlers = []
+
+
+class AfterCommitIds:
+    """
+    Junta os ids agendados na thread e chama flush(ids ordenados) uma vez
+    depois do commit.
+    """
+
+    def __init__(self, flush):
+        self._flush = flush
+        self._local = threading.local()
+
+    def add(self, item_id):
+        pending = self._local.__dict__.setdefault('ids', set())
+        pending.add(item_id)
+        transaction.on_commit(self._run)
+
+    def _run(self):
+        # Callbacks de transações revertidas são descartados pelo Django; ids
+        # que ficarem pendentes são processados no próximo commit.
+        pending = getattr(self._local, 'ids', None)
+        if not pending:
+            return
+        self._local.ids = set()
+        self._flush(sorted(pending))
+
+
+def register_index(handler):
+    """Registra uma função handler(product_ids) chamada após cada commit"""
+    if handler not in _handlers:
+        _handlers.append(handler)
+    return handler
+
+
+def _run_handlers(product_ids):
+    for handler in _handlers:
+        try:
+            handler(product_ids)
+        except Exception as e:
+            logger.warning(f"Reindex handler {handler.__module__}.{handler.__name__} failed for {product_ids}: {e}")
+
+
+_pending = AfterCommitIds(_run_handlers)
+
+
+def schedule_product_reindex(product_id):
+    """Agenda a reindexação do produto para depois do commit"""
+    _pending.add(product_id)
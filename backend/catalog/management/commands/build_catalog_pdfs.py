@@ -0,0 +1,69 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+
+def _init_worker():
+    # Com 'spawn' o processo filho começa sem Django configurado
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+    connections.close_all()
+
+
+def _build_chunk(product_ids, force):
+    from catalog.pdf_builds import build_product_pdfs
+    try:
+        return len(product_ids), build_product_pdfs(product_ids, force=force)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Gera os PDFs de todos os produtos ativos em paralelo e o catálogo completo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processos em paralelo (padrão: núcleos da CPU)')
+        parser.add_argument('--chunk-size', type=int, default=25, help='Produtos por tarefa de cada processo')
+        parser.add_argument('--force', action='store_true', help='Gera de novo mesmo se nada mudou')
+        parser.add_argument('--skip-catalog', action='store_true', help='Não gera o catálogo completo')
+
+    def handle(self, *args, **options):
+        from catalog.models import Product
+        from catalog.pdf import generate_catalog_pdf
+
+        workers = max(1, options['workers'])
+        chunk_size = max(1, options['chunk_size'])
+        force = options['force']
+        started = time.monotonic()
+
+        ids = list(Product.objects.filter(is_active=True).order_by('pk').values_list('pk', flat=True))
+        chunks = [ids[i:i + chunk_size] for i in range(0, len(ids), chunk_size)]
+
+        done = built = 0
+        if workers == 1 or len(chunks) <= 1:
+            for chunk in chunks:
+                count, rendered = _build_chunk(chunk, force)
+                done += count
+                built += rendered
+        else:
+            # Conexões abertas não podem ser herdadas pelos processos filhos
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                futures = [pool.submit(_build_chunk, chunk, force) for chunk in chunks]
+                for future in as_completed(futures):
+                    count, rendered = future.result()
+                    done += count
+                    built += rendered
+                    self.stdout.write(f'  {done}/{len(ids)} produto(s)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ {built} PDF(s) gerado(s), {len(ids) - built} sem mudanças ({time.monotonic() - started:.1f}s)'
+        ))
+
+        if not options['skip_catalog']:
+            self.stdout.write(self.style.SUCCESS(f'✓ Catálogo: {generate_catalog_pdf()}'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from catalog.image_derivatives import build_derivatives, formats, widths
+from catalog.models import ProductImage
+
+
+class Command(BaseCommand):
+    help = 'Gera as versões WebP/AVIF das imagens de produto que ainda não têm (ou de todas, com --force)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Gera de novo mesmo as imagens já processadas')
+        parser.add_argument('--workers', type=int, default=None, help='Processos em paralelo (padrão: CATALOG_IMAGE_WORKERS)')
+        parser.add_argument('--batch-size', type=int, default=100, help='Imagens por lote')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Formatos: {', '.join(formats()) or '(nenhum suportado)'}; larguras: {', '.join(map(str, widths()))}")
+        started = time.monotonic()
+        ids = list(ProductImage.objects.exclude(image='').order_by('pk').values_list('pk', flat=True))
+        batch_size = max(1, options['batch_size'])
+
+        built = 0
+        for start in range(0, len(ids), batch_size):
+            built += build_derivatives(ids[start:start + batch_size], force=options['force'], workers=options['workers'])
+            self.stdout.write(f'  {min(start + batch_size, len(ids))}/{len(ids)} imagem(ns)')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Versões geradas para {built} imagem(ns) ({time.monotonic() - started:.1f}s)'
+        ))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from catalog.sales import rebuild_sales_stats, refresh_sales_windows
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói as estatísticas de vendas por produto (ProductSalesStats) a partir dos pedidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--windows-only',
+            action='store_true',
+            help='Recalcula apenas as janelas de 7/30 dias',
+        )
+
+    def handle(self, *args, **options):
+        if options['windows_only']:
+            total = refresh_sales_windows()
+            self.stdout.write(self.style.SUCCESS(f'✓ Janelas de vendas recalculadas para {total} produto(s)'))
+            return
+        
+        total = rebuild_sales_stats()
+        self.stdout.write(self.style.SUCCESS(f'✓ Estatísticas de vendas reconstruídas para {total} produto(s)'))
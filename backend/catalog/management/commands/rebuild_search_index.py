@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from catalog.search import get_search_backend
+from catalog.facets import rebuild_facets
+from catalog.autocomplete import invalidate_autocomplete
+
+
+class Command(BaseCommand):
+    help = 'Reconstrói o índice de busca (ProductSearchDocument + FTS), as facetas e o autocomplete'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Quantidade de produtos indexados por transação',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        self.stdout.write(f'Backend de busca: {backend.name}')
+        total = backend.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ {total} produto(s) indexado(s)'))
+        
+        total = rebuild_facets(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Facetas recalculadas para {total} produto(s)'))
+        
+        invalidate_autocomplete()
+        self.stdout.write(self.style.SUCCESS('✓ Índice de autocomplete invalidado'))
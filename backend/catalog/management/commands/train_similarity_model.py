@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from catalog.similarity import DEFAULT_K, get_model_name, get_model_path, train_model
+
+
+class Command(BaseCommand):
+    help = 'Treina o modelo item-item de recomendações (vizinhos por produto) e publica o arquivo no storage lido pelos workers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--k',
+            type=int,
+            default=DEFAULT_K,
+            help='Vizinhos guardados por produto',
+        )
+        parser.add_argument(
+            '--path',
+            default=None,
+            help='Cópia local (padrão: RECOMMENDATIONS_MODEL_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_model_path()
+        total = train_model(k=options['k'], path=path)
+        self.stdout.write(self.style.SUCCESS(f'✓ Modelo treinado para {total} produto(s): {get_model_name()}'))
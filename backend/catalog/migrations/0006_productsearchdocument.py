@@ -0,0 +1,106 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:23
+
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'catalog_productsearch_fts'
+PG_INDEX = 'catalog_productsearch_gin'
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('portuguese'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('portuguese'::regconfig, category), 'B') || "
+    "setweight(to_tsvector('portuguese'::regconfig, body), 'C')"
+)
+
+
+def _normalize(text):
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def create_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX} "
+                f"ON catalog_productsearchdocument USING GIN (({PG_VECTOR_SQL}))"
+            )
+        elif vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    f"USING fts5(title, category, body, tokenize='unicode61 remove_diacritics 2')"
+                )
+            except Exception:
+                # SQLite sem FTS5: catalog.search usa o backend LIKE
+                pass
+
+
+def drop_text_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+        elif vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def backfill_documents(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    ProductSearchDocument = apps.get_model('catalog', 'ProductSearchDocument')
+    connection = schema_editor.connection
+
+    docs = []
+    for product in Product.objects.select_related('category').prefetch_related('variants'):
+        variants = list(product.variants.all())
+        colors = sorted({v.color for v in variants if v.color})
+        body_parts = [
+            product.description, product.fabric_type, product.composition,
+            ' '.join(colors), ' '.join(v.sku for v in variants if v.sku),
+        ]
+        docs.append(ProductSearchDocument(
+            product_id=product.pk,
+            title=_normalize(product.name),
+            category=_normalize(product.category.name if product.category_id else ''),
+            body=_normalize(' '.join(p for p in body_parts if p)),
+            is_active=product.is_active,
+        ))
+    ProductSearchDocument.objects.bulk_create(docs, batch_size=500)
+
+    if connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, category, body) VALUES (%s, %s, %s, %s)",
+                [(d.product_id, d.title, d.category, d.body) for d in docs if d.is_active],
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_alter_product_options_alter_productvariant_options_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='catalog.product')),
+                ('title', models.CharField(max_length=255)),
+                ('category', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+                ('is_active', models.BooleanField(db_index=True, default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Documento de Busca',
+                'verbose_name_plural': 'Documentos de Busca',
+            },
+        ),
+        migrations.RunPython(create_text_index, drop_text_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
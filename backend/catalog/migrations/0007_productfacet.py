@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+PRICE_BUCKETS = [('0-50', 0, 50), ('50-100', 50, 100), ('100-200', 100, 200), ('200+', 200, None)]
+
+
+def _price_bucket(price):
+    value = float(price or 0)
+    for key, low, high in PRICE_BUCKETS:
+        if value >= low and (high is None or value < high):
+            return key
+    return PRICE_BUCKETS[-1][0]
+
+
+def backfill_facets(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    ProductFacet = apps.get_model('catalog', 'ProductFacet')
+
+    rows = []
+    for product in Product.objects.filter(is_active=True).prefetch_related('variants'):
+        values = {}
+
+        def add(facet, value, in_stock):
+            if value:
+                key = (facet, str(value)[:100])
+                values[key] = values.get(key, False) or in_stock
+
+        variants = list(product.variants.all())
+        any_stock = any(v.stock > 0 for v in variants)
+        add('category', product.category_id, any_stock)
+        add('fabric', product.fabric_type, any_stock)
+        add('price', _price_bucket(product.base_price), any_stock)
+        if any_stock:
+            add('stock', 'in_stock', True)
+        for v in variants:
+            add('size', v.size, v.stock > 0)
+            add('color', v.color, v.stock > 0)
+        rows.extend(
+            ProductFacet(product_id=product.pk, facet=facet, value=value, in_stock=in_stock)
+            for (facet, value), in_stock in values.items()
+        )
+    ProductFacet.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_productsearchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet', models.CharField(choices=[('category', 'Categoria'), ('size', 'Tamanho'), ('color', 'Cor'), ('fabric', 'Tecido'), ('price', 'Faixa de Preço'), ('stock', 'Disponibilidade')], max_length=20)),
+                ('value', models.CharField(max_length=100)),
+                ('in_stock', models.BooleanField(default=False)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='catalog.product')),
+            ],
+            options={
+                'verbose_name': 'Faceta de Produto',
+                'verbose_name_plural': 'Facetas de Produtos',
+                'indexes': [models.Index(fields=['facet', 'value'], name='catalog_pro_facet_360841_idx')],
+                'unique_together': {('product', 'facet', 'value')},
+            },
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_productfacet'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'base_price', 'id'], name='catalog_pro_is_acti_5cca5b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', 'name', 'id'], name='catalog_pro_is_acti_34b130_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['is_active', '-created_at', '-id'], name='catalog_pro_is_acti_00404b_idx'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:30
+
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, Max, Q, Sum
+from django.utils import timezone
+
+SOLD_STATUSES = ('paid', 'shipped', 'delivered')
+
+
+def backfill_sales_stats(apps, schema_editor):
+    Product = apps.get_model('catalog', 'Product')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+    ProductSalesStats = apps.get_model('catalog', 'ProductSalesStats')
+
+    now = timezone.now()
+    money = DecimalField(max_digits=14, decimal_places=2)
+    annotations = {
+        'units': Sum('quantity'),
+        'revenue': Sum(F('quantity') * F('unit_price'), output_field=money),
+        'last_sold_at': Max('order__created_at'),
+    }
+    for days in (7, 30):
+        recent = Q(order__created_at__gte=now - timedelta(days=days))
+        annotations[f'units_{days}d'] = Sum('quantity', filter=recent)
+        annotations[f'revenue_{days}d'] = Sum(F('quantity') * F('unit_price'), filter=recent, output_field=money)
+
+    rows = {
+        row.pop('variant__product_id'): row
+        for row in OrderItem.objects.filter(order__status__in=SOLD_STATUSES, variant__isnull=False)
+        .values('variant__product_id').annotate(**annotations).order_by()
+    }
+    stats = []
+    for product_id in Product.objects.values_list('id', flat=True):
+        row = rows.get(product_id, {})
+        stats.append(ProductSalesStats(
+            product_id=product_id,
+            **{key: value or 0 for key, value in row.items() if key != 'last_sold_at'},
+            last_sold_at=row.get('last_sold_at'),
+        ))
+    ProductSalesStats.objects.bulk_create(stats, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_product_keyset_indexes'),
+        ('orders', '0005_alter_order_options_alter_order_coupon_code_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSalesStats',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='sales_stats', serialize=False, to='catalog.product')),
+                ('units_total', models.IntegerField(db_index=True, default=0)),
+                ('revenue_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units_7d', models.IntegerField(db_index=True, default=0)),
+                ('revenue_7d', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units_30d', models.IntegerField(db_index=True, default=0)),
+                ('revenue_30d', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('last_sold_at', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estatística de Vendas',
+                'verbose_name_plural': 'Estatísticas de Vendas',
+            },
+        ),
+        migrations.RunPython(backfill_sales_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0009_productsalesstats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='catalog_pdf_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+    ]
@@ -28,6 +28,8 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     catalog_pdf = models.FileField(upload_to='product_pdfs/', blank=True, null=True)
+    # Hash das entradas do último PDF gerado (catalog.pdf_builds)
+    catalog_pdf_hash = models.CharField(max_length=64, blank=True, editable=False)
     
     class Meta:
         ordering = ['-created_at']
@@ -36,6 +38,10 @@ class Product(models.Model):
             models.Index(fields=['is_active', '-created_at']),
             models.Index(fields=['base_price']),
             models.Index(fields=['slug']),
+            # Paginação por cursor (ordenação + desempate por id)
+            models.Index(fields=['is_active', 'base_price', 'id']),
+            models.Index(fields=['is_active', 'name', 'id']),
+            models.Index(fields=['is_active', '-created_at', '-id']),
         ]
 
     def __str__(self):
@@ -125,6 +131,8 @@ class ProductImage(models.Model):
     alt_text = models.CharField(max_length=255, blank=True)
     is_primary = models.BooleanField(default=False, db_index=True)
     sort_order = models.PositiveIntegerField(default=0)
+    # Versões reduzidas (catalog.image_derivatives): {'source': nome, 'webp': {'320': nome, ...}, ...}
+    derivatives = models.JSONField(default=dict, blank=True, editable=False)
 
     class Meta:
         ordering = ['sort_order', 'id']
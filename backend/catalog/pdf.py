@@ -1,13 +1,24 @@
+import hashlib
+import math
 import os
+import time
+from contextlib import contextmanager
 from django.conf import settings
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import cm
 from reportlab.pdfgen import canvas
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from PIL import Image as PILImage
-from reportlab.lib.utils import ImageReader
 from django.core.files.storage import default_storage
 
+# Imagens reduzidas para os PDFs: MEDIA_ROOT/pdf_image_cache, chave = nome + mtime + tamanho
+IMAGE_CACHE_DIR = 'pdf_image_cache'
+IMAGE_DPI = 150
+# Cópias não usadas há mais que isso são apagadas por prune_image_cache
+IMAGE_CACHE_MAX_AGE = 30 * 24 * 3600
+# Linhas de produto lidas do banco por vez no catálogo único (QuerySet.iterator)
+CATALOG_QUERY_BATCH = 100
+
 
 def _wrap_text(text, font_name, font_size, max_width):
     if not text:
@@ -28,6 +39,103 @@ def _wrap_text(text, font_name, font_size, max_width):
     return lines
 
 
+def _image_mtime(image_field):
+    try:
+        return os.path.getmtime(image_field.path)
+    except (NotImplementedError, OSError):
+        pass
+    try:
+        return default_storage.get_modified_time(image_field.name).timestamp()
+    except Exception:
+        return 0
+
+
+def downscaled_image(image_field, box):
+    """
+    Caminho local de uma cópia da imagem reduzida para caber em box x box
+    pontos a IMAGE_DPI (JPEG, ou PNG se tiver transparência).
+    A cópia fica em cache até a imagem original mudar (nome ou mtime); cada
+    uso renova o mtime da cópia, que prune_image_cache usa para descartá-la.
+    Retorna (caminho, largura, altura) em pixels.
+    """
+    max_px = math.ceil(box / 72 * IMAGE_DPI)
+    key = hashlib.sha1(f"{image_field.name}:{_image_mtime(image_field)}:{max_px}".encode()).hexdigest()
+    cache_dir = os.path.join(settings.MEDIA_ROOT, IMAGE_CACHE_DIR)
+    for ext in ('jpg', 'png'):
+        cached = os.path.join(cache_dir, f"{key}.{ext}")
+        try:
+            os.utime(cached)
+            with PILImage.open(cached) as im:
+                return cached, im.width, im.height
+        except FileNotFoundError:
+            continue
+
+    os.makedirs(cache_dir, exist_ok=True)
+    with default_storage.open(image_field.name, 'rb') as f:
+        with PILImage.open(f) as im:
+            im.draft('RGB', (max_px, max_px))  # JPEG: decodifica já reduzida
+            im.thumbnail((max_px, max_px))
+            has_alpha = im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info)
+            im = im.convert('RGBA' if has_alpha else 'RGB')
+            ext, fmt = ('png', 'PNG') if has_alpha else ('jpg', 'JPEG')
+            cached = os.path.join(cache_dir, f"{key}.{ext}")
+            tmp = f"{cached}.{os.getpid()}.tmp"
+            im.save(tmp, fmt, **({'quality': 85, 'optimize': True} if fmt == 'JPEG' else {}))
+            os.replace(tmp, cached)
+            return cached, im.width, im.height
+
+
+def prune_image_cache(max_age=IMAGE_CACHE_MAX_AGE):
+    """
+    Apaga as cópias reduzidas não usadas há mais de max_age segundos
+    (imagens trocadas ou removidas). Retorna quantos arquivos apagou.
+    """
+    cache_dir = os.path.join(settings.MEDIA_ROOT, IMAGE_CACHE_DIR)
+    cutoff = time.time() - max_age
+    removed = 0
+    try:
+        entries = list(os.scandir(cache_dir))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+@contextmanager
+def atomic_canvas(output_path, **kwargs):
+    """Canvas gravado num arquivo temporário e movido para output_path só no fim"""
+    tmp = f"{output_path}.{os.getpid()}.tmp"
+    c = canvas.Canvas(tmp, pagesize=A4, pageCompression=1, **kwargs)
+    try:
+        yield c
+        c.save()
+        os.replace(tmp, output_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def draw_image(c, image_field, x, top, box):
+    """Desenha a imagem (reduzida) em box x box com o topo em `top`; retorna a altura usada"""
+    path, iw, ih = downscaled_image(image_field, box)
+    ratio = min(box / iw, box / ih)
+    dw, dh = iw * ratio, ih * ratio
+    c.drawImage(path, x, top - dh, width=dw, height=dh, preserveAspectRatio=True, mask='auto')
+    return dh
+
+
+def primary_image(product):
+    # Lista (e não filter/first) para aproveitar prefetch_related('images')
+    images = list(product.images.all())
+    return next((img for img in images if img.is_primary), images[0] if images else None)
+
+
 def generate_product_pdf(product):
     output_dir = os.path.join(settings.MEDIA_ROOT, 'product_pdfs')
     os.makedirs(output_dir, exist_ok=True)
@@ -36,8 +144,13 @@ def generate_product_pdf(product):
 
     page_w, page_h = A4
     margin = 2 * cm
-    c = canvas.Canvas(output_path, pagesize=A4)
+    with atomic_canvas(output_path) as c:
+        _draw_product_page(c, product, page_w, page_h, margin)
+
+    return os.path.join('product_pdfs', filename)
+
 
+def _draw_product_page(c, product, page_w, page_h, margin):
     y = page_h - margin
 
     title = product.name
@@ -53,35 +166,15 @@ def generate_product_pdf(product):
     c.drawString(margin, y, f"Preço base: R$ {product.base_price}")
     y -= 1.0 * cm
 
-    primary_img = getattr(product, 'images', None)
-    img_obj = None
-    if primary_img is not None:
-        img_obj = primary_img.filter(is_primary=True).first() or primary_img.order_by('sort_order', 'id').first()
+    img_obj = primary_image(product)
 
     img_w = 8 * cm
-    img_h = 8 * cm
+    img_block_h = 0
     if img_obj and getattr(img_obj, 'image', None):
         try:
-            source = None
-            if hasattr(img_obj.image, 'path'):
-                source = img_obj.image.path
-                with PILImage.open(source) as im:
-                    iw, ih = im.size
-            else:
-                with default_storage.open(img_obj.image.name, 'rb') as f:
-                    with PILImage.open(f) as im:
-                        iw, ih = im.size
-                    f.seek(0)
-                    source = ImageReader(f)
-
-            ratio = min(img_w / iw, img_h / ih)
-            dw, dh = iw * ratio, ih * ratio
-            c.drawImage(source, margin, y - dh, width=dw, height=dh, preserveAspectRatio=True, mask='auto')
-            img_block_h = dh
+            img_block_h = draw_image(c, img_obj.image, margin, y, img_w)
         except Exception:
             img_block_h = 0
-    else:
-        img_block_h = 0
 
     text_x = margin + (img_w + 1 * cm if img_block_h else 0)
     text_width = page_w - margin - text_x
@@ -119,6 +212,77 @@ def generate_product_pdf(product):
     c.drawString(margin, 1.2 * cm, "Gerado automaticamente pela BASE CORPORATIVA")
 
     c.showPage()
-    c.save()
 
-    return os.path.join('product_pdfs', filename)
+
+def generate_catalog_pdf(output_path=None):
+    """
+    Catálogo único com todos os produtos ativos, desenhado com as imagens
+    reduzidas do cache. O Canvas do ReportLab guarda todas as páginas até o
+    save, então a memória cresce com o tamanho do catálogo; só a leitura do
+    banco é feita em lotes de CATALOG_QUERY_BATCH. Retorna o caminho gravado.
+    """
+    from .models import Product
+
+    if output_path is None:
+        output_dir = os.path.join(settings.MEDIA_ROOT, 'catalog')
+        os.makedirs(output_dir, exist_ok=True)
+        output_path = os.path.join(output_dir, 'catalogo.pdf')
+
+    page_w, page_h = A4
+    margin = 2 * cm
+    img_box = 6 * cm
+    gap = 1.0 * cm
+
+    products = (
+        Product.objects.filter(is_active=True)
+        .select_related('category')
+        .prefetch_related('images')
+        .order_by('category__name', 'name')
+    )
+
+    with atomic_canvas(output_path) as c:
+        y = page_h - margin
+        c.setFont("Helvetica-Bold", 22)
+        c.drawString(margin, y, "Catálogo de Produtos")
+        y -= 1.5 * cm
+
+        for p in products.iterator(chunk_size=CATALOG_QUERY_BATCH):
+            img = primary_image(p)
+
+            img_h = 0
+            if img and getattr(img, 'image', None):
+                try:
+                    img_h = draw_image(c, img.image, margin, y, img_box)
+                except Exception:
+                    img_h = 0
+
+            text_x = margin + (img_box + 0.8 * cm if img_h else 0)
+            text_w = page_w - margin - text_x
+
+            c.setFont("Helvetica-Bold", 14)
+            c.drawString(text_x, y, p.name)
+            y_line = y - 16
+
+            c.setFont("Helvetica", 11)
+            if p.category:
+                c.drawString(text_x, y_line, f"Categoria: {p.category.name}")
+                y_line -= 14
+            c.drawString(text_x, y_line, f"Preço base: R$ {p.base_price}")
+            y_line -= 16
+
+            for line in _wrap_text(p.description or "", "Helvetica", 11, text_w)[:6]:
+                c.drawString(text_x, y_line, line)
+                y_line -= 14
+
+            block_h = max(img_h, (y - y_line))
+            y -= block_h + gap
+
+            if y < margin + 6 * cm:
+                c.showPage()
+                y = page_h - margin
+
+        c.showPage()
+
+    # O catálogo acabou de usar a imagem de cada produto ativo
+    prune_image_cache()
+    return output_path
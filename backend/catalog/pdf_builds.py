@@ -0,0 +1,147 @@
+"""
+Geração adiada dos PDFs de produto (catalog.pdf)
+
+Os sinais só marcam o produto como pendente. Depois do commit os ids
+pendentes são enviados para um worker com atraso de CATALOG_PDF_DEBOUNCE
+segundos: enviar 6 imagens seguidas gera um único PDF, fora da requisição.
+
+- CATALOG_PDF_BUILD = 'thread' (padrão; o deploy só tem o gunicorn): timer
+  em segundo plano no próprio processo.
+- 'celery': tarefa catalog.tasks.build_product_pdfs com countdown; se o
+  broker não estiver disponível, cai no modo 'thread'.
+- 'sync': gera na hora, depois do commit (testes/scripts).
+
+Antes de renderizar compara o hash das entradas do PDF (textos, preço,
+categoria e imagem principal) com Product.catalog_pdf_hash e pula o
+render se nada mudou e o arquivo existe.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from core.celery import try_apply_async
+
+from .indexing import AfterCommitIds
+from .models import Product
+from .pdf import generate_product_pdf, primary_image, prune_image_cache
+
+logger = logging.getLogger(__name__)
+
+# Mudou o layout do PDF? Incrementar para invalidar os hashes gravados
+LAYOUT_VERSION = 1
+QUEUED_KEY = 'catalog:pdf:queued'
+PRUNE_KEY = 'catalog:pdf:image-cache-pruned'
+
+_timer_lock = threading.Lock()
+_timer_pending = set()
+_timer = None
+
+
+def _debounce():
+    return getattr(settings, 'CATALOG_PDF_DEBOUNCE', 10)
+
+
+def _flush_pending(product_ids):
+    mode = getattr(settings, 'CATALOG_PDF_BUILD', 'thread')
+    if mode == 'sync':
+        build_product_pdfs(product_ids)
+    elif mode == 'thread' or not _dispatch_celery(product_ids):
+        _start_timer(product_ids)
+
+
+_pending = AfterCommitIds(_flush_pending)
+
+
+def schedule_pdf_build(product_id):
+    """Agenda a geração do PDF do produto para depois do commit"""
+    _pending.add(product_id)
+
+
+def _dispatch_celery(product_ids):
+    # Produtos que já têm tarefa na fila (dentro da janela) não geram outra
+    timeout = _debounce() + 60
+    new_ids = [pid for pid in product_ids if cache.add(f'{QUEUED_KEY}:{pid}', 1, timeout)]
+    if not new_ids:
+        return True
+    from .tasks import build_product_pdfs as build_task
+    if try_apply_async(build_task, (new_ids,), countdown=_debounce()):
+        return True
+    cache.delete_many([f'{QUEUED_KEY}:{pid}' for pid in new_ids])
+    return False
+
+
+def _start_timer(product_ids):
+    global _timer
+    with _timer_lock:
+        _timer_pending.update(product_ids)
+        if _timer is None:
+            _timer = threading.Timer(_debounce(), _run_timer)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _run_timer():
+    global _timer
+    with _timer_lock:
+        product_ids = sorted(_timer_pending)
+        _timer_pending.clear()
+        _timer = None
+    try:
+        build_product_pdfs(product_ids)
+    finally:
+        connection.close()
+
+
+def content_hash(product):
+    """Hash de tudo que aparece no PDF do produto"""
+    image = primary_image(product)
+    data = [
+        LAYOUT_VERSION,
+        product.slug,
+        product.name,
+        product.category.name if product.category_id else '',
+        str(product.base_price),
+        product.description,
+        product.fabric_type,
+        product.composition,
+        product.care_instructions,
+        image.image.name if image and image.image else '',
+    ]
+    return hashlib.sha256(json.dumps(data, ensure_ascii=False).encode()).hexdigest()
+
+
+def build_product_pdf(product, force=False):
+    """
+    Gera o PDF se as entradas mudaram. Retorna True se renderizou.
+    product deve vir com category e images carregados.
+    """
+    digest = content_hash(product)
+    current = product.catalog_pdf.name if product.catalog_pdf else ''
+    # generate_product_pdf grava em MEDIA_ROOT
+    if not force and digest == product.catalog_pdf_hash and current and os.path.exists(os.path.join(settings.MEDIA_ROOT, current)):
+        return False
+    relative_path = generate_product_pdf(product)
+    Product.objects.filter(pk=product.pk).update(catalog_pdf=relative_path, catalog_pdf_hash=digest)
+    return True
+
+
+def build_product_pdfs(product_ids, force=False):
+    """Gera os PDFs dos produtos (ignora os que não existem mais). Retorna quantos renderizou."""
+    cache.delete_many([f'{QUEUED_KEY}:{pid}' for pid in product_ids])
+    products = Product.objects.filter(pk__in=product_ids).select_related('category').prefetch_related('images')
+    built = 0
+    for product in products:
+        try:
+            built += build_product_pdf(product, force=force)
+        except Exception as e:
+            logger.warning(f"PDF build failed for product {product.pk}: {e}")
+    # Limpa o cache de imagens reduzidas no máximo uma vez por dia
+    if built and cache.add(PRUNE_KEY, 1, 24 * 3600):
+        prune_image_cache()
+    return built
@@ -0,0 +1,236 @@
+"""
+Estatísticas de vendas por produto (ProductSalesStats)
+
+Ordenações por popularidade leem uma coluna indexada em vez de agregar
+todos os OrderItem a cada requisição.
+
+- apply_order_sale: soma (ou estorna) os itens de um pedido quando ele
+  entra (ou sai) dos status de venda; chamado pelos sinais de Order.
+- set_orders_status: queryset.update() de status que também ajusta as
+  estatísticas (update() não dispara os sinais).
+- refresh_sales_windows: recalcula as janelas de 7/30 dias.
+- schedule_windows_refresh: chamado nas leituras das janelas; no máximo a
+  cada SALES_WINDOWS_CHECK_INTERVAL segundos confere, em segundo plano, se
+  a linha mais antiga com vendas na janela passou de SALES_WINDOWS_MAX_AGE
+  e então recalcula (o deploy não roda o beat do Celery).
+- rebuild_sales_stats: reconstrói a tabela inteira a partir dos pedidos.
+"""
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.celery import try_apply_async
+
+from .indexing import register_index
+from .sales_models import ProductSalesStats
+
+logger = logging.getLogger(__name__)
+
+# Pedidos nesses status contam como venda
+SOLD_STATUSES = ('paid', 'shipped', 'delivered')
+WINDOWS = (7, 30)
+WINDOWS_CHECK_KEY = 'catalog:sales:windows-check'
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+
+
+def _revenue(filter=None):
+    return Coalesce(
+        Sum(F('quantity') * F('unit_price'), filter=filter, output_field=MONEY),
+        Value(0, output_field=MONEY),
+    )
+
+
+def _units(filter=None):
+    return Coalesce(Sum('quantity', filter=filter), 0)
+
+
+def _grouped_items(items, **extra):
+    """OrderItem agrupados por produto: {product_id: {'units', 'revenue', ...}}"""
+    rows = (
+        items.filter(variant__isnull=False)
+        .values('variant__product_id')
+        .annotate(units=_units(), revenue=_revenue(), **extra)
+        .order_by()
+    )
+    return {row.pop('variant__product_id'): row for row in rows}
+
+
+def apply_order_sale(order_id, sign=1):
+    """
+    Soma (sign=1) ou estorna (sign=-1) os itens do pedido nas estatísticas.
+    As janelas só são afetadas se o pedido estiver dentro delas.
+    """
+    from orders.models import Order, OrderItem
+
+    created_at = Order.objects.filter(pk=order_id).values_list('created_at', flat=True).first()
+    if created_at is None:
+        return 0
+    rows = _grouped_items(OrderItem.objects.filter(order_id=order_id))
+    if not rows:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        ProductSalesStats.objects.bulk_create(
+            [ProductSalesStats(product_id=pid) for pid in rows], ignore_conflicts=True
+        )
+        for product_id, row in rows.items():
+            units, revenue = sign * row['units'], sign * row['revenue']
+            updates = {
+                'units_total': F('units_total') + units,
+                'revenue_total': F('revenue_total') + revenue,
+                'updated_at': now,
+            }
+            for days in WINDOWS:
+                if now - created_at <= timedelta(days=days):
+                    updates[f'units_{days}d'] = F(f'units_{days}d') + units
+                    updates[f'revenue_{days}d'] = F(f'revenue_{days}d') + revenue
+            if sign > 0:
+                updates['last_sold_at'] = now
+            ProductSalesStats.objects.filter(product_id=product_id).update(**updates)
+    return len(rows)
+
+
+def set_orders_status(queryset, status, **extra):
+    """
+    Atualiza o status de vários pedidos em um UPDATE e soma (ou estorna) as
+    vendas dos que entram (ou saem) de SOLD_STATUSES. Retorna quantos mudaram.
+    """
+    sign = 1 if status in SOLD_STATUSES else -1
+    with transaction.atomic():
+        # Sem os joins do queryset original (FOR UPDATE não aceita outer joins)
+        orders = queryset.model.objects.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+        locked = orders.select_for_update()
+        moved = locked.exclude(status__in=SOLD_STATUSES) if sign > 0 else locked.filter(status__in=SOLD_STATUSES)
+        moved_ids = list(moved.values_list('id', flat=True))
+        updated = orders.update(status=status, **extra)
+        for order_id in moved_ids:
+            transaction.on_commit(lambda order_id=order_id: apply_order_sale(order_id, sign))
+    return updated
+
+
+def _window_annotations(now):
+    annotations = {}
+    for days in WINDOWS:
+        recent = Q(order__created_at__gte=now - timedelta(days=days))
+        annotations[f'units_{days}d'] = _units(recent)
+        annotations[f'revenue_{days}d'] = _revenue(recent)
+    return annotations
+
+
+def refresh_sales_windows():
+    """
+    Recalcula as janelas de 7/30 dias em uma consulta sobre os últimos
+    30 dias de pedidos (os totais não mudam).
+    """
+    from orders.models import OrderItem
+
+    now = timezone.now()
+    since = now - timedelta(days=max(WINDOWS))
+    rows = _grouped_items(
+        OrderItem.objects.filter(order__status__in=SOLD_STATUSES, order__created_at__gte=since),
+        **_window_annotations(now),
+    )
+    fields = [f'{kind}_{days}d' for days in WINDOWS for kind in ('units', 'revenue')]
+
+    with transaction.atomic():
+        # Produtos sem vendas recentes voltam a zero
+        ProductSalesStats.objects.exclude(product_id__in=list(rows)).filter(
+            Q(units_30d__gt=0) | Q(units_7d__gt=0)
+        ).update(**{field: 0 for field in fields}, updated_at=now)
+
+        stats = list(ProductSalesStats.objects.filter(product_id__in=list(rows)))
+        for item in stats:
+            for field in fields:
+                setattr(item, field, rows[item.product_id][field])
+            item.updated_at = now
+        ProductSalesStats.objects.bulk_update(stats, fields + ['updated_at'], batch_size=500)
+    return len(stats)
+
+
+def refresh_stale_windows():
+    """
+    Recalcula as janelas se a estatística mais antiga com vendas nelas tiver
+    mais de SALES_WINDOWS_MAX_AGE segundos. Retorna quantas linhas atualizou.
+    """
+    max_age = getattr(settings, 'SALES_WINDOWS_MAX_AGE', 3600)
+    oldest = ProductSalesStats.objects.filter(Q(units_30d__gt=0) | Q(units_7d__gt=0)).aggregate(
+        oldest=Min('updated_at')
+    )['oldest']
+    if oldest is None or timezone.now() - oldest < timedelta(seconds=max_age):
+        return 0
+    return refresh_sales_windows()
+
+
+def _run_thread():
+    try:
+        refresh_stale_windows()
+    except Exception as e:
+        logger.warning(f"Sales windows refresh failed: {e}")
+    finally:
+        connection.close()
+
+
+def schedule_windows_refresh():
+    """Confere (no máximo a cada SALES_WINDOWS_CHECK_INTERVAL) se as janelas estão velhas"""
+    if not cache.add(WINDOWS_CHECK_KEY, 1, getattr(settings, 'SALES_WINDOWS_CHECK_INTERVAL', 300)):
+        return
+    mode = getattr(settings, 'SALES_WINDOWS_REFRESH', 'thread')
+    if mode == 'sync':
+        refresh_stale_windows()
+        return
+    if mode == 'celery':
+        from .tasks import refresh_sales_stats_windows
+        if try_apply_async(refresh_sales_stats_windows, (False,)):
+            return
+    threading.Thread(target=_run_thread, daemon=True).start()
+
+
+def rebuild_sales_stats():
+    """Reconstrói ProductSalesStats para todos os produtos a partir dos pedidos"""
+    from orders.models import OrderItem
+    from .models import Product
+
+    now = timezone.now()
+    rows = _grouped_items(
+        OrderItem.objects.filter(order__status__in=SOLD_STATUSES),
+        last_sold_at=Max('order__created_at'),
+        **_window_annotations(now),
+    )
+    stats = []
+    for product_id in Product.objects.values_list('id', flat=True):
+        row = rows.get(product_id, {})
+        stats.append(ProductSalesStats(
+            product_id=product_id,
+            units_total=row.get('units', 0),
+            revenue_total=row.get('revenue', 0),
+            units_7d=row.get('units_7d', 0),
+            revenue_7d=row.get('revenue_7d', 0),
+            units_30d=row.get('units_30d', 0),
+            revenue_30d=row.get('revenue_30d', 0),
+            last_sold_at=row.get('last_sold_at'),
+        ))
+
+    with transaction.atomic():
+        ProductSalesStats.objects.all().delete()
+        ProductSalesStats.objects.bulk_create(stats, batch_size=500)
+    return len(stats)
+
+
+@register_index
+def ensure_sales_stats(product_ids):
+    """Garante uma linha (zerada) para produtos novos"""
+    from .models import Product
+
+    missing = Product.objects.filter(pk__in=product_ids, sales_stats__isnull=True).values_list('id', flat=True)
+    ProductSalesStats.objects.bulk_create(
+        [ProductSalesStats(product_id=pid) for pid in missing], ignore_conflicts=True
+    )
@@ -0,0 +1,30 @@
+from django.db import models
+from .models import Product
+
+
+class ProductSalesStats(models.Model):
+    """
+    Vendas agregadas por produto (unidades e receita), total e janelas
+    móveis de 7 e 30 dias.
+    Atualizada incrementalmente quando um pedido passa a pago (catalog.sales);
+    as janelas são recalculadas periodicamente e o comando
+    rebuild_sales_stats refaz tudo a partir dos pedidos.
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='sales_stats'
+    )
+    units_total = models.IntegerField(default=0, db_index=True)
+    revenue_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_7d = models.IntegerField(default=0, db_index=True)
+    revenue_7d = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units_30d = models.IntegerField(default=0, db_index=True)
+    revenue_30d = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_sold_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Estatística de Vendas'
+        verbose_name_plural = 'Estatísticas de Vendas'
+
+    def __str__(self):
+        return f"Vendas {self.product_id}: {self.units_total} un."
@@ -0,0 +1,386 @@
+"""
+Motor de busca de produtos com backends plugáveis
+
+- PostgreSQL: índice GIN sobre tsvector (config 'portuguese', com stemming)
+- SQLite: tabela virtual FTS5 com ranking BM25 (desenvolvimento)
+- Fallback: LIKE sobre os documentos normalizados
+
+Os documentos ficam em ProductSearchDocument e são atualizados
+incrementalmente pelos sinais de Product/ProductVariant (catalog.indexing).
+A normalização de acentos é feita em Python na indexação e na consulta,
+o que equivale ao unaccent sem depender da extensão no banco.
+"""
+import logging
+import operator
+import re
+import unicodedata
+from functools import reduce
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, FloatField, OuterRef, Q, Subquery, Value, When
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .indexing import register_index
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'catalog_productsearch_fts'
+
+# Precisa ser idêntica à expressão do índice GIN (migration 0006)
+PG_VECTOR_SQL = (
+    "setweight(to_tsvector('portuguese'::regconfig, title), 'A') || "
+    "setweight(to_tsvector('portuguese'::regconfig, category), 'B') || "
+    "setweight(to_tsvector('portuguese'::regconfig, body), 'C')"
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize_text(text):
+    """Converte para minúsculas e remove acentos ('Algodão' -> 'algodao')"""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(text))
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text):
+    """Quebra o texto normalizado em termos de busca"""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def build_document(product):
+    """Monta os campos do documento de busca de um produto"""
+    variants = list(product.variants.all())
+    colors = sorted({v.color for v in variants if v.color})
+    skus = [v.sku for v in variants if v.sku]
+    body_parts = [
+        product.description,
+        product.fabric_type,
+        product.composition,
+        ' '.join(colors),
+        ' '.join(skus),
+    ]
+    return {
+        'title': normalize_text(product.name),
+        'category': normalize_text(product.category.name if product.category_id else ''),
+        'body': normalize_text(' '.join(p for p in body_parts if p)),
+        'is_active': product.is_active,
+    }
+
+
+class BaseSearchBackend:
+    """
+    Interface comum dos backends de busca.
+    search() retorna uma lista [(product_id, score), ...] do mais relevante
+    para o menos relevante, considerando apenas produtos ativos, limitada a
+    CATALOG_SEARCH_MAX_RESULTS. filter_queryset() restringe um queryset de
+    produtos a todos os que casam (subconsulta, sem limite) e
+    rank_expression() é o mesmo score como expressão SQL por produto (para
+    ordenar e paginar por cursor no banco).
+    """
+    name = 'base'
+
+    def index_products(self, products):
+        from .search_models import ProductSearchDocument
+
+        docs = []
+        for product in products:
+            fields = build_document(product)
+            doc, _ = ProductSearchDocument.objects.update_or_create(
+                product_id=product.pk, defaults=fields
+            )
+            docs.append(doc)
+        self._write_index(docs)
+        return len(docs)
+
+    def remove_products(self, product_ids):
+        from .search_models import ProductSearchDocument
+
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        self._delete_index(product_ids)
+        ProductSearchDocument.objects.filter(product_id__in=product_ids).delete()
+
+    def rebuild(self, batch_size=500):
+        """Reindexa todo o catálogo (ver comando rebuild_search_index)"""
+        from .models import Product
+        from .search_models import ProductSearchDocument
+
+        self._clear_index()
+        ProductSearchDocument.objects.all().delete()
+
+        qs = Product.objects.select_related('category').prefetch_related('variants').order_by('id')
+        total = 0
+        last_id = 0
+        while True:
+            batch = list(qs.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                total += self.index_products(batch)
+            last_id = batch[-1].id
+        return total
+
+    def search(self, query, limit=None):
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query):
+        raise NotImplementedError
+
+    def rank_expression(self, query):
+        raise NotImplementedError
+
+    def _write_index(self, docs):
+        pass
+
+    def _delete_index(self, product_ids):
+        pass
+
+    def _clear_index(self):
+        pass
+
+    def _limit(self, limit):
+        return limit or getattr(settings, 'CATALOG_SEARCH_MAX_RESULTS', 1000)
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """
+    Fallback sem índice textual: LIKE sobre os documentos já normalizados.
+    Usado quando o banco não tem FTS5 nem tsvector.
+    """
+    name = 'simple'
+
+    @staticmethod
+    def _documents(terms):
+        from .search_models import ProductSearchDocument
+
+        qs = ProductSearchDocument.objects.filter(is_active=True)
+        for term in terms:
+            qs = qs.filter(
+                Q(title__contains=term) | Q(category__contains=term) | Q(body__contains=term)
+            )
+        return qs
+
+    def filter_queryset(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        return queryset.filter(id__in=self._documents(terms).values('product_id'))
+
+    def rank_expression(self, query):
+        from .search_models import ProductSearchDocument
+
+        # Mesmo score de search(): 2 por termo no título, 1 nos demais campos
+        score = reduce(operator.add, [
+            Case(When(title__contains=term, then=Value(2.0)), default=Value(1.0), output_field=FloatField())
+            for term in tokenize(query)
+        ] or [Value(0.0)])
+        docs = ProductSearchDocument.objects.filter(product_id=OuterRef('pk')).annotate(score=score)
+        return Subquery(docs.values('score')[:1], output_field=FloatField())
+
+    def search(self, query, limit=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        rows = self._documents(terms).values_list('product_id', 'title')[:self._limit(limit)]
+        results = []
+        for product_id, title in rows:
+            score = sum(2.0 if term in title else 1.0 for term in terms)
+            results.append((product_id, score))
+        results.sort(key=lambda r: (-r[1], -r[0]))
+        return results
+
+
+class SQLiteFTSSearchBackend(BaseSearchBackend):
+    """
+    Busca via SQLite FTS5 (tokenizer unicode61 sem diacríticos) com ranking BM25.
+    Pesos: título 10, categoria 4, corpo 1.
+    """
+    name = 'sqlite_fts5'
+    weights = (10.0, 4.0, 1.0)
+
+    def _write_index(self, docs):
+        if not docs:
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                [(doc.product_id,) for doc in docs],
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE} (rowid, title, category, body) VALUES (%s, %s, %s, %s)",
+                [(doc.product_id, doc.title, doc.category, doc.body) for doc in docs if doc.is_active],
+            )
+
+    def _delete_index(self, product_ids):
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s",
+                [(pk,) for pk in product_ids],
+            )
+
+    def _clear_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    @staticmethod
+    def _match(terms):
+        # Cada termo vira prefixo entre aspas: "camis"* "algod"*  (AND implícito)
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def filter_queryset(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [self._match(terms)]
+        ))
+
+    def rank_expression(self, query):
+        return RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, %s, %s, %s) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND rowid = catalog_product.id",
+            [*self.weights, self._match(tokenize(query))],
+            output_field=FloatField(),
+        )
+
+    def search(self, query, limit=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        match = self._match(terms)
+        w_title, w_category, w_body = self.weights
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, bm25({FTS_TABLE}, %s, %s, %s) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+                f"ORDER BY rank, rowid DESC LIMIT %s",
+                [w_title, w_category, w_body, match, self._limit(limit)],
+            )
+            # bm25() retorna valores negativos: menor = mais relevante
+            return [(row[0], -row[1]) for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend(BaseSearchBackend):
+    """
+    Busca via tsvector/GIN com stemming em português.
+    O índice GIN é de expressão sobre ProductSearchDocument, então basta
+    manter a tabela de documentos atualizada.
+    """
+    name = 'postgres'
+
+    @staticmethod
+    def _tsquery(terms):
+        # Busca por prefixo em todos os termos: camisa:* & algodao:*
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def filter_queryset(self, queryset, query):
+        terms = tokenize(query)
+        if not terms:
+            return queryset.none()
+        return queryset.filter(id__in=RawSQL(
+            f"SELECT product_id FROM catalog_productsearchdocument, "
+            f"to_tsquery('portuguese'::regconfig, %s) q "
+            f"WHERE is_active AND ({PG_VECTOR_SQL}) @@ q",
+            [self._tsquery(terms)],
+        ))
+
+    def rank_expression(self, query):
+        return RawSQL(
+            f"SELECT ts_rank_cd({PG_VECTOR_SQL}, to_tsquery('portuguese'::regconfig, %s), 32) "
+            f"FROM catalog_productsearchdocument WHERE product_id = catalog_product.id",
+            [self._tsquery(tokenize(query))],
+            output_field=FloatField(),
+        )
+
+    def search(self, query, limit=None):
+        terms = tokenize(query)
+        if not terms:
+            return []
+        tsquery = self._tsquery(terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT product_id, ts_rank_cd({PG_VECTOR_SQL}, q, 32) AS rank "
+                f"FROM catalog_productsearchdocument, "
+                f"to_tsquery('portuguese'::regconfig, %s) q "
+                f"WHERE is_active AND ({PG_VECTOR_SQL}) @@ q "
+                f"ORDER BY rank DESC, product_id DESC LIMIT %s",
+                [tsquery, self._limit(limit)],
+            )
+            return [(row[0], float(row[1])) for row in cursor.fetchall()]
+
+
+_backend = None
+
+
+def _fts5_available():
+    try:
+        with connection.cursor() as cursor:
+            return FTS_TABLE in connection.introspection.table_names(cursor)
+    except Exception:
+        return False
+
+
+def get_search_backend():
+    """
+    Retorna o backend configurado em CATALOG_SEARCH_BACKEND.
+    'auto' escolhe pelo banco em uso: PostgreSQL, SQLite+FTS5 ou LIKE.
+    """
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    path = getattr(settings, 'CATALOG_SEARCH_BACKEND', 'auto')
+    if path and path != 'auto':
+        backend_cls = import_string(path)
+    elif connection.vendor == 'postgresql':
+        backend_cls = PostgresSearchBackend
+    elif connection.vendor == 'sqlite' and _fts5_available():
+        backend_cls = SQLiteFTSSearchBackend
+    else:
+        backend_cls = SimpleSearchBackend
+
+    _backend = backend_cls()
+    logger.info(f"Catalog search backend: {_backend.name}")
+    return _backend
+
+
+def reset_search_backend():
+    """Descarta o backend em cache (usado em testes e após trocar settings)"""
+    global _backend
+    _backend = None
+
+
+@register_index
+def reindex_products(product_ids):
+    """Reindexa os produtos informados; ids inexistentes saem do índice"""
+    from .models import Product
+
+    products = list(
+        Product.objects.select_related('category')
+        .prefetch_related('variants')
+        .filter(pk__in=product_ids)
+    )
+    backend = get_search_backend()
+    backend.index_products(products)
+    found = {p.pk for p in products}
+    backend.remove_products([pk for pk in product_ids if pk not in found])
+
+
+def search_product_ids(query, limit=None):
+    """Ids de produtos ativos que casam com a busca, em ordem de relevância (até CATALOG_SEARCH_MAX_RESULTS)"""
+    return [product_id for product_id, _ in get_search_backend().search(query, limit=limit)]
+
+
+def annotate_rank(queryset, query, name='search_rank'):
+    """Anota o score de relevância da busca em cada produto (maior = mais relevante)"""
+    return queryset.annotate(**{name: get_search_backend().rank_expression(query)})
+
+
+def filter_products(queryset, query):
+    """Restringe o queryset a todos os produtos que casam com a busca, sem o limite do ranking"""
+    return get_search_backend().filter_queryset(queryset, query)
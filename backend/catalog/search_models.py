@@ -0,0 +1,59 @@
+from django.db import models
+from .models import Product
+
+
+class ProductSearchDocument(models.Model):
+    """
+    Documento de busca desnormalizado por produto.
+    Mantido incrementalmente pelos sinais de Product/ProductVariant e
+    consultado pelo backend de busca (FTS5 no SQLite, tsvector no PostgreSQL).
+    Os textos são gravados já normalizados (minúsculos e sem acentos).
+    """
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name='search_document'
+    )
+    title = models.CharField(max_length=255)
+    category = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+    is_active = models.BooleanField(default=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Documento de Busca'
+        verbose_name_plural = 'Documentos de Busca'
+
+    def __str__(self):
+        return f"Busca: {self.title}"
+
+
+class ProductFacet(models.Model):
+    """
+    Índice invertido produto -> valor de faceta (tamanho, cor, tecido,
+    categoria, faixa de preço, disponibilidade).
+    Atualizado incrementalmente por catalog.facets; permite contar todas as
+    facetas do resultado atual em uma única consulta agregada.
+    """
+    FACET_CHOICES = [
+        ('category', 'Categoria'),
+        ('size', 'Tamanho'),
+        ('color', 'Cor'),
+        ('fabric', 'Tecido'),
+        ('price', 'Faixa de Preço'),
+        ('stock', 'Disponibilidade'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='facets')
+    facet = models.CharField(max_length=20, choices=FACET_CHOICES)
+    value = models.CharField(max_length=100)
+    in_stock = models.BooleanField(default=False)
+
+    class Meta:
+        verbose_name = 'Faceta de Produto'
+        verbose_name_plural = 'Facetas de Produtos'
+        unique_together = ('product', 'facet', 'value')
+        indexes = [
+            models.Index(fields=['facet', 'value']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.facet}={self.value}"
@@ -1,52 +1,36 @@
 from rest_framework import serializers
 from .models import Category, Product, ProductVariant, ProductImage
 from django.utils.text import slugify
-from django.conf import settings
+from core.media import media_url
 import uuid
 from decimal import Decimal, InvalidOperation
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
     image = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
     
     class Meta:
         model = ProductImage
         fields = (
-            'id', 'image', 'alt_text', 'is_primary', 'sort_order', 'variant'
+            'id', 'image', 'srcset', 'alt_text', 'is_primary', 'sort_order', 'variant'
         )
     
     def get_image(self, obj):
-        name = getattr(obj.image, 'name', None)
-        if not name:
-            return None
-
-        # Build absolute URL robustly for Cloudflare R2
-        bucket = getattr(settings, 'AWS_STORAGE_BUCKET_NAME', '') or ''
-        domain = getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', '') or ''
-        endpoint = getattr(settings, 'AWS_S3_ENDPOINT_URL', '') or ''
-
-        if domain:
-            base = domain.strip()
-            if not base.startswith('http'):  # add scheme if missing
-                base = f"https://{base}"
-            base = base.rstrip('/')
-            # If domain path already ends with /<bucket>, strip it (bucket-bound dev domain)
-            if bucket and base.endswith('/' + bucket):
-                base = base[:-(len(bucket) + 1)]
-            return f"{base}/{name.lstrip('/')}"
-
-        # Fallback to endpoint + bucket
-        if endpoint:
-            base = endpoint.rstrip('/')
-            if bucket:
-                base = f"{base}/{bucket}"
-            return f"{base}/{name.lstrip('/')}"
-
-        # Last resort: storage-generated URL
-        try:
-            return obj.image.url
-        except Exception:
-            return None
+        return media_url(getattr(obj.image, 'name', None))
+
+    def get_srcset(self, obj):
+        """{'avif': 'url 320w, url 640w, ...', 'webp': ...}; vazio até as versões serem geradas"""
+        derivatives = obj.derivatives or {}
+        if not derivatives or derivatives.get('source') != getattr(obj.image, 'name', None):
+            return {}
+        return {
+            fmt: ', '.join(
+                f"{media_url(name)} {width}w"
+                for width, name in sorted(by_width.items(), key=lambda item: int(item[0]))
+            )
+            for fmt, by_width in derivatives.items() if fmt != 'source'
+        }
 
 
 class ProductVariantSerializer(serializers.ModelSerializer):
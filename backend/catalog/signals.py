@@ -1,37 +1,122 @@
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.db import transaction
 from django.dispatch import receiver
-from .models import Product, ProductImage
-from .pdf import generate_product_pdf
+from .models import Category, Product, ProductImage, ProductVariant
+from .pdf_builds import schedule_pdf_build
+from .image_derivatives import delete_derivatives, schedule_derivatives
+from .indexing import register_index, schedule_product_reindex
+from .autocomplete import invalidate_autocomplete, schedule_autocomplete_refresh
+from .sales import SOLD_STATUSES, apply_order_sale
+from . import search, facets  # noqa: F401 (registram os handlers de reindexação)
+from orders.models import Order
+from core.cache import CacheManager, CATALOG_TAG, invalidate_tags, product_tag
 
 
+# ====== PDFs de produto (catalog.pdf_builds): gerados depois do commit, agrupados por produto ======
+
 @receiver(post_save, sender=Product)
 def generate_pdf_on_product_save(sender, instance: Product, created, **kwargs):
-    try:
-        relative_path = generate_product_pdf(instance)
-        if instance.catalog_pdf.name != relative_path:
-            Product.objects.filter(pk=instance.pk).update(catalog_pdf=relative_path)
-    except Exception:
-        # Intencionalmente ignorado para não quebrar o fluxo de save
-        pass
+    schedule_pdf_build(instance.pk)
 
 
 @receiver(post_save, sender=ProductImage)
 def regenerate_pdf_on_image_save(sender, instance: ProductImage, created, **kwargs):
-    try:
-        product = instance.product
-        relative_path = generate_product_pdf(product)
-        if product.catalog_pdf.name != relative_path:
-            Product.objects.filter(pk=product.pk).update(catalog_pdf=relative_path)
-    except Exception:
-        pass
+    schedule_pdf_build(instance.product_id)
 
 
 @receiver(post_delete, sender=ProductImage)
 def regenerate_pdf_on_image_delete(sender, instance: ProductImage, **kwargs):
-    try:
-        product = instance.product
-        relative_path = generate_product_pdf(product)
-        if product.catalog_pdf.name != relative_path:
-            Product.objects.filter(pk=product.pk).update(catalog_pdf=relative_path)
-    except Exception:
-        pass
+    schedule_pdf_build(instance.product_id)
+
+
+# ====== Versões WebP/AVIF das imagens (catalog.image_derivatives) ======
+
+@receiver(post_save, sender=ProductImage)
+def build_derivatives_on_image_save(sender, instance: ProductImage, **kwargs):
+    if instance.image and instance.derivatives.get('source') != instance.image.name:
+        schedule_derivatives(instance.pk)
+
+
+@receiver(post_delete, sender=ProductImage)
+def delete_derivatives_on_image_delete(sender, instance: ProductImage, **kwargs):
+    derivatives = instance.derivatives
+    if derivatives:
+        transaction.on_commit(lambda: delete_derivatives(derivatives))
+
+
+# ====== Índices de busca, facetas e autocomplete (catalog.indexing) ======
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def reindex_product(sender, instance: Product, **kwargs):
+    schedule_product_reindex(instance.pk)
+    schedule_autocomplete_refresh(instance.pk)
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def reindex_product_on_variant_change(sender, instance: ProductVariant, **kwargs):
+    schedule_product_reindex(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def reindex_product_on_image_change(sender, instance: ProductImage, **kwargs):
+    schedule_product_reindex(instance.product_id)
+    # Autocomplete guarda a URL da imagem principal
+    schedule_autocomplete_refresh(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance: Category, created, **kwargs):
+    transaction.on_commit(invalidate_autocomplete)
+    if created:
+        return
+    for product_id in instance.products.values_list('id', flat=True):
+        schedule_product_reindex(product_id)
+
+
+@receiver(post_delete, sender=Category)
+def invalidate_category_autocomplete(sender, instance: Category, **kwargs):
+    transaction.on_commit(invalidate_autocomplete)
+
+
+# ====== Cache (tags de core.cache) ======
+
+@register_index
+def invalidate_product_caches(product_ids):
+    # Produtos alterados (inclusive variantes e imagens) + listagens do catálogo
+    invalidate_tags(CATALOG_TAG, *(product_tag(pk) for pk in product_ids))
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_caches(sender, instance: Category, **kwargs):
+    category_id = instance.pk
+    transaction.on_commit(lambda: CacheManager.invalidate_category(category_id))
+
+
+# ====== Estatísticas de vendas (catalog.sales) ======
+
+@receiver(pre_save, sender=Order)
+def remember_order_status(sender, instance: Order, **kwargs):
+    update_fields = kwargs.get('update_fields')
+    if update_fields is not None and 'status' not in update_fields:
+        return
+    instance._sales_previous_status = (
+        Order.objects.filter(pk=instance.pk).values_list('status', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Order)
+def update_sales_stats(sender, instance: Order, **kwargs):
+    if not hasattr(instance, '_sales_previous_status'):
+        return
+    was_sold = instance._sales_previous_status in SOLD_STATUSES
+    is_sold = instance.status in SOLD_STATUSES
+    del instance._sales_previous_status
+    if was_sold == is_sold:
+        return
+    order_id, sign = instance.pk, 1 if is_sold else -1
+    transaction.on_commit(lambda: apply_order_sale(order_id, sign))
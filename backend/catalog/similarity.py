@@ -0,0 +1,317 @@
+"""
+Modelo item-item de similaridade (treinado offline)
+
+Treino (train_similarity_model / tarefa Celery noturna):
+- bought_together: cosseno entre produtos sobre as cestas dos pedidos
+  vendidos (produtos comprados no mesmo pedido);
+- complete_look: cosseno sobre a matriz usuário x produto (compras com peso
+  1, visualizações com peso VIEW_WEIGHT), apenas produtos de outra categoria.
+
+O resultado é um arquivo binário com os K vizinhos de cada produto:
+
+    cabeçalho | ids (int64, ordenados) | por tipo: vizinhos int64[n*K], scores float32[n*K]
+
+O treino publica o arquivo no default_storage (RECOMMENDATIONS_MODEL_NAME),
+compartilhado entre os containers. Cada processo confere, em uma thread
+em segundo plano, a data de modificação do objeto a cada
+RECOMMENDATIONS_MODEL_CHECK_INTERVAL segundos, baixa uma cópia local (RECOMMENDATIONS_MODEL_PATH) quando ela muda e a abre
+com mmap; uma consulta é uma busca binária nos ids seguida da leitura de K
+posições, sem SQL.
+
+O deploy não roda o beat do Celery: agende
+`python manage.py train_similarity_model` (cron da plataforma) para
+retreinar. Sem modelo publicado as recomendações agregam os pedidos na hora.
+"""
+import heapq
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import default_storage
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'SIM2'
+HEADER = '<4sIII'  # magic, K, número de produtos, número de tipos
+KINDS = ('bought_together', 'complete_look')
+DEFAULT_K = 20
+VIEW_WEIGHT = 0.3
+# Limite de itens por usuário/cesta (evita custo quadrático com robôs)
+MAX_ITEMS_PER_USER = 200
+
+
+def get_model_path():
+    """Cópia local do modelo (lida com mmap)"""
+    return getattr(
+        settings, 'RECOMMENDATIONS_MODEL_PATH',
+        os.path.join(settings.BASE_DIR, 'var', 'item_similarity.bin'),
+    )
+
+
+def get_model_name():
+    """Nome do modelo publicado no default_storage"""
+    return getattr(settings, 'RECOMMENDATIONS_MODEL_NAME', 'recommendations/item_similarity.bin')
+
+
+# ---- treino ----
+
+def _cosine_neighbors(vectors, k, allowed=None):
+    """
+    vectors: {usuário/cesta: {produto: peso}}
+    Retorna {produto: [(vizinho, score), ...]} com os k maiores cossenos.
+    """
+    dot = defaultdict(lambda: defaultdict(float))
+    norm = defaultdict(float)
+    for items in vectors.values():
+        entries = sorted(items.items())
+        for i, (a, wa) in enumerate(entries):
+            norm[a] += wa * wa
+            for b, wb in entries[i + 1:]:
+                dot[a][b] += wa * wb
+                dot[b][a] += wa * wb
+
+    neighbors = {}
+    for a, row in dot.items():
+        candidates = (
+            (score / math.sqrt(norm[a] * norm[b]), b)
+            for b, score in row.items()
+            if allowed is None or allowed(a, b)
+        )
+        neighbors[a] = [(b, score) for score, b in heapq.nlargest(k, candidates)]
+    return neighbors
+
+
+def _basket_vectors():
+    from orders.models import OrderItem
+    from .sales import SOLD_STATUSES
+
+    baskets = defaultdict(dict)
+    rows = (
+        OrderItem.objects.filter(order__status__in=SOLD_STATUSES, variant__isnull=False)
+        .values_list('order_id', 'variant__product_id')
+        .order_by()
+    )
+    for order_id, product_id in rows.iterator():
+        if len(baskets[order_id]) < MAX_ITEMS_PER_USER:
+            baskets[order_id][product_id] = 1.0
+    return baskets
+
+
+def _user_vectors():
+    from orders.models import OrderItem
+    from recommendations.models import ProductView
+    from .sales import SOLD_STATUSES
+
+    users = defaultdict(dict)
+    purchases = (
+        OrderItem.objects.filter(order__status__in=SOLD_STATUSES, variant__isnull=False)
+        .values_list('order__user_id', 'order__email', 'variant__product_id')
+        .order_by()
+    )
+    for user_id, email, product_id in purchases.iterator():
+        key = f'u{user_id}' if user_id else f'e{email.lower()}'
+        if key != 'e' and len(users[key]) < MAX_ITEMS_PER_USER:
+            users[key][product_id] = 1.0
+
+    views = ProductView.objects.values_list('user_id', 'session_id', 'product_id').order_by('-viewed_at')
+    for user_id, session_id, product_id in views.iterator():
+        key = f'u{user_id}' if user_id else f's{session_id}'
+        items = users[key]
+        if key != 's' and product_id not in items and len(items) < MAX_ITEMS_PER_USER:
+            items[product_id] = VIEW_WEIGHT
+    return users
+
+
+def train_model(k=DEFAULT_K, path=None):
+    """Treina o modelo a partir de OrderItem e ProductView, grava e publica o arquivo"""
+    from .models import Product
+
+    started = time.monotonic()
+    categories = dict(Product.objects.filter(is_active=True).values_list('id', 'category_id'))
+
+    def active(a, b):
+        return b in categories
+
+    def other_category(a, b):
+        return b in categories and categories.get(a) != categories[b]
+
+    neighbors = {
+        'bought_together': _cosine_neighbors(_basket_vectors(), k, active),
+        'complete_look': _cosine_neighbors(_user_vectors(), k, other_category),
+    }
+    path = path or get_model_path()
+    save_model(path, sorted(categories), neighbors, k)
+    publish_model(path)
+    logger.info(f"Similarity model trained: {len(categories)} products in {time.monotonic() - started:.1f}s")
+    return len(categories)
+
+
+def save_model(path, product_ids, neighbors, k):
+    """Grava o arquivo de forma atômica (temporário + os.replace)"""
+    ids = array('q', product_ids)
+    n = len(ids)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(struct.pack(HEADER, MAGIC, k, n, len(KINDS)))
+            f.write(ids.tobytes())
+            for kind in KINDS:
+                targets = array('q', [-1]) * (n * k)
+                scores = array('f', [0.0]) * (n * k)
+                for idx, product_id in enumerate(ids):
+                    for j, (target, score) in enumerate(neighbors[kind].get(product_id, ())[:k]):
+                        targets[idx * k + j] = target
+                        scores[idx * k + j] = score
+                f.write(targets.tobytes())
+                f.write(scores.tobytes())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def publish_model(path):
+    """Envia o arquivo local para o default_storage, visível a todos os containers"""
+    name = get_model_name()
+    # Sem sobrescrita (AWS_S3_FILE_OVERWRITE=False) o storage geraria outro nome
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    with open(path, 'rb') as f:
+        saved = default_storage.save(name, File(f))
+    if saved != name:
+        raise RuntimeError(f'Similarity model saved as {saved}, expected {name}')
+    return name
+
+
+def _download_model(name, path):
+    """Copia o modelo publicado para o arquivo local (temporário + os.replace)"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out, default_storage.open(name, 'rb') as src:
+            for chunk in src.chunks():
+                out.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+# ---- leitura ----
+
+class SimilarityModel:
+    """Arquivo de vizinhos mapeado em memória (somente leitura)"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.k, self.size, kinds = struct.unpack_from(HEADER, self._mmap, 0)
+        if magic != MAGIC or kinds != len(KINDS):
+            raise ValueError(f'Invalid similarity model file: {path}')
+
+        view = memoryview(self._mmap)
+        offset = struct.calcsize(HEADER)
+        self.ids = view[offset:offset + self.size * 8].cast('q')
+        offset += self.size * 8
+        self._blocks = {}
+        for kind in KINDS:
+            targets = view[offset:offset + self.size * self.k * 8].cast('q')
+            offset += self.size * self.k * 8
+            scores = view[offset:offset + self.size * self.k * 4].cast('f')
+            offset += self.size * self.k * 4
+            self._blocks[kind] = (targets, scores)
+
+    def neighbors(self, product_id, kind, limit=None):
+        """[(produto, score), ...] em ordem decrescente de similaridade"""
+        idx = bisect_left(self.ids, product_id)
+        if idx >= self.size or self.ids[idx] != product_id:
+            return []
+        targets, scores = self._blocks[kind]
+        start = idx * self.k
+        result = []
+        for pos in range(start, start + min(limit or self.k, self.k)):
+            if targets[pos] < 0:
+                break
+            result.append((targets[pos], scores[pos]))
+        return result
+
+
+_model = None
+_model_stamp = None
+_model_checked = 0.0
+_model_lock = threading.Lock()
+_refreshing = False
+
+
+def refresh_similarity_model():
+    """
+    Confere o modelo publicado e, se mudou, baixa a cópia local e troca o
+    modelo do processo. Faz I/O no storage: roda fora das requisições.
+    """
+    global _model, _model_stamp
+
+    name = get_model_name()
+    try:
+        stamp = default_storage.get_modified_time(name)
+    except Exception:
+        # Ainda não publicado (ou storage fora do ar): mantém o que houver
+        return _model
+    if stamp != _model_stamp:
+        path = get_model_path()
+        try:
+            _download_model(name, path)
+            _model, _model_stamp = SimilarityModel(path), stamp
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Could not load similarity model {name}: {e}")
+    return _model
+
+
+def _run_background_refresh():
+    global _refreshing
+    try:
+        refresh_similarity_model()
+    except Exception as e:
+        logger.warning(f"Similarity model refresh failed: {e}")
+    finally:
+        _refreshing = False
+
+
+def get_similarity_model():
+    """
+    Modelo do processo (None enquanto nenhum foi carregado). A cada
+    RECOMMENDATIONS_MODEL_CHECK_INTERVAL segundos uma thread em segundo plano
+    confere o storage e baixa o modelo novo; a requisição nunca espera.
+    """
+    global _model_checked, _refreshing
+
+    now = time.monotonic()
+    interval = getattr(settings, 'RECOMMENDATIONS_MODEL_CHECK_INTERVAL', 60)
+    if _model_checked and now - _model_checked < interval:
+        return _model
+
+    with _model_lock:
+        if _refreshing or (_model_checked and now - _model_checked < interval):
+            return _model
+        _model_checked = now
+        _refreshing = True
+    threading.Thread(target=_run_background_refresh, daemon=True).start()
+    return _model
+
+
+def reset_similarity_model():
+    global _model, _model_stamp, _model_checked, _refreshing
+    _model, _model_stamp, _model_checked, _refreshing = None, None, 0.0, False
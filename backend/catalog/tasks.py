@@ -0,0 +1,30 @@
+from celery import shared_task
+
+from .sales import refresh_sales_windows, refresh_stale_windows
+
+
+@shared_task
+def refresh_sales_stats_windows(force=True):
+    """Recalcula as janelas de 7/30 dias de ProductSalesStats"""
+    return refresh_sales_windows() if force else refresh_stale_windows()
+
+
+@shared_task(ignore_result=True)
+def build_product_pdfs(product_ids):
+    """Gera os PDFs dos produtos alterados (catalog.pdf_builds)"""
+    from .pdf_builds import build_product_pdfs as build
+    return build(product_ids)
+
+
+@shared_task(ignore_result=True)
+def build_image_derivatives(image_ids):
+    """Gera as versões WebP/AVIF das imagens enviadas (catalog.image_derivatives)"""
+    from .image_derivatives import build_derivatives
+    return build_derivatives(image_ids)
+
+
+@shared_task
+def train_similarity_model():
+    """Treina o modelo item-item de recomendações (catalog.similarity)"""
+    from .similarity import train_model
+    return train_model()
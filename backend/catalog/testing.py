@@ -0,0 +1,20 @@
+"""
+Bases dos testes que criam produtos e imagens
+
+PDFs (catalog.pdf_builds) e versões das imagens (catalog.image_derivatives)
+rodam na hora, depois do commit: nenhum teste enfileira tarefas no Celery nem
+deixa threads em segundo plano usando o banco depois de terminar.
+"""
+from django.test import TestCase, TransactionTestCase, override_settings
+
+sync_catalog_jobs = override_settings(CATALOG_PDF_BUILD='sync', CATALOG_IMAGE_DERIVATIVES='sync')
+
+
+@sync_catalog_jobs
+class CatalogTestCase(TestCase):
+    pass
+
+
+@sync_catalog_jobs
+class CatalogTransactionTestCase(TransactionTestCase):
+    pass
@@ -1,3 +1,629 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import tempfile
+import time
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from PIL import Image as PILImage
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from core import media
+from core.media_sync import MULTIPART_THRESHOLD, MediaSync, local_files
+
+from .models import Category, Product, ProductImage, ProductVariant
+from .sales_models import ProductSalesStats
+from .facets import compute_facet_counts
+from .testing import CatalogTestCase
+from . import autocomplete, image_derivatives, pdf, pdf_builds, search, similarity
+from .serializers import ProductImageSerializer
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ProductPdfBuildTests(CatalogTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Camisetas', slug='camisetas')
+        self.render = mock.patch.object(pdf_builds, 'generate_product_pdf', wraps=pdf_builds.generate_product_pdf)
+        self.generate = self.render.start()
+        self.addCleanup(self.render.stop)
+
+    def test_changes_in_one_transaction_render_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(category=self.category, name='Camisa', slug='camisa', base_price='99.90')
+            for i in range(6):
+                ProductImage.objects.create(product=product, image=f'products/camisa-{i}.jpg', sort_order=i)
+        self.assertEqual(self.generate.call_count, 1)
+        product.refresh_from_db()
+        self.assertEqual(product.catalog_pdf.name, 'product_pdfs/camisa.pdf')
+        self.assertTrue(product.catalog_pdf_hash)
+
+    def test_unchanged_inputs_skip_render(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(category=self.category, name='Camisa', slug='camisa', base_price='99.90')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.get(pk=product.pk).save()
+        self.assertEqual(self.generate.call_count, 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=product.pk)
+            product.name = 'Camisa Polo'
+            product.save()
+        self.assertEqual(self.generate.call_count, 2)
+
+    @override_settings(CATALOG_PDF_BUILD='celery')
+    def test_queued_products_are_not_queued_again(self):
+        with mock.patch.object(pdf_builds, 'try_apply_async', return_value=True) as apply_async:
+            for _ in range(3):
+                with self.captureOnCommitCallbacks(execute=True):
+                    pdf_builds.schedule_pdf_build(42)
+            apply_async.assert_called_once()
+            self.assertEqual(apply_async.call_args.args[1], ([42],))
+
+            # Depois que a tarefa roda, uma nova alteração volta a ser enfileirada
+            pdf_builds.build_product_pdfs([42])
+            with self.captureOnCommitCallbacks(execute=True):
+                pdf_builds.schedule_pdf_build(42)
+            self.assertEqual(apply_async.call_count, 2)
+        self.generate.assert_not_called()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class PdfImageCacheTests(CatalogTestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Casacos', slug='casacos')
+        self.product = Product.objects.create(category=category, name='Jaqueta', slug='jaqueta', base_price='199.90')
+        buf = tempfile.SpooledTemporaryFile()
+        PILImage.new('RGB', (3000, 2000), 'navy').save(buf, 'JPEG')
+        buf.seek(0)
+        self.image = ProductImage(product=self.product, is_primary=True)
+        self.image.image.save('jaqueta.jpg', ContentFile(buf.read()), save=True)
+
+    def test_images_are_downscaled_once_and_outputs_written_atomically(self):
+        path, width, height = pdf.downscaled_image(self.image.image, 6 * 72)
+        self.assertEqual((width, height), (900, 600))
+        with mock.patch.object(pdf.PILImage, 'open', wraps=pdf.PILImage.open) as pil_open:
+            self.assertEqual(pdf.downscaled_image(self.image.image, 6 * 72)[0], path)
+        # Cache: abre só a cópia reduzida, nunca o original
+        self.assertEqual([c.args[0] for c in pil_open.call_args_list], [path])
+
+        catalog_path = pdf.generate_catalog_pdf()
+        product_path = os.path.join(MEDIA_ROOT, pdf.generate_product_pdf(self.product))
+        for output in (catalog_path, product_path):
+            with open(output, 'rb') as f:
+                self.assertEqual(f.read(5), b'%PDF-')
+            self.assertEqual([n for n in os.listdir(os.path.dirname(output)) if n.endswith('.tmp')], [])
+
+    def test_prune_removes_only_copies_unused_for_too_long(self):
+        used, _, _ = pdf.downscaled_image(self.image.image, 6 * 72)
+        stale, _, _ = pdf.downscaled_image(self.image.image, 3 * 72)
+        old = time.time() - pdf.IMAGE_CACHE_MAX_AGE - 60
+        os.utime(used, (old, old))
+        os.utime(stale, (old, old))
+
+        # Usar a cópia renova a data dela
+        pdf.downscaled_image(self.image.image, 6 * 72)
+        self.assertEqual(pdf.prune_image_cache(), 1)
+        self.assertTrue(os.path.exists(used))
+        self.assertFalse(os.path.exists(stale))
+
+
+@skipUnless(mock_aws, 'moto não instalado')
+class MediaSyncTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        os.makedirs(os.path.join(self.media_root, 'products'))
+        for name, size in [('a.jpg', 1000), ('b.png', 2000), ('grande.jpg', MULTIPART_THRESHOLD + 1)]:
+            with open(os.path.join(self.media_root, 'products', name), 'wb') as f:
+                f.write(os.urandom(size))
+        aws = mock_aws()
+        aws.start()
+        self.addCleanup(aws.stop)
+        self.s3 = boto3.client('s3', region_name='us-east-1')
+        self.s3.create_bucket(Bucket='media')
+
+    def sync(self, **kwargs):
+        return MediaSync(self.s3, 'media', media_root=self.media_root, workers=4, extra_args={}).run(
+            local_files(self.media_root, ['products/']) + ['products/sumiu.jpg'], **kwargs
+        )
+
+    def test_uploads_only_missing_or_changed_files(self):
+        result = self.sync(dry_run=True)
+        self.assertEqual((result['to_upload'], result['uploaded'], result['missing_local']), (3, 0, 1))
+        self.assertNotIn('Contents', self.s3.list_objects_v2(Bucket='media'))
+
+        result = self.sync()
+        self.assertEqual((result['uploaded'], result['failed']), (3, 0))
+        head = self.s3.head_object(Bucket='media', Key='products/b.png')
+        self.assertEqual(head['ContentType'], 'image/png')
+        self.assertIn('-', self.s3.head_object(Bucket='media', Key='products/grande.jpg')['ETag'])
+
+        # Segunda rodada: tudo igual (inclusive o multipart), nada é enviado
+        result = self.sync()
+        self.assertEqual((result['uploaded'], result['skipped']), (0, 3))
+
+        # Mesmo tamanho, conteúdo diferente: o ETag denuncia
+        with open(os.path.join(self.media_root, 'products', 'a.jpg'), 'wb') as f:
+            f.write(os.urandom(1000))
+        result = self.sync()
+        self.assertEqual((result['uploaded'], result['skipped']), (1, 2))
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    CATALOG_IMAGE_WIDTHS=[320, 640, 1280], CATALOG_IMAGE_FORMATS=['webp'], CATALOG_IMAGE_WORKERS=2,
+)
+class ImageDerivativeTests(CatalogTestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Calças', slug='calcas')
+        self.product = Product.objects.create(category=category, name='Calça', slug='calca', base_price='149.90')
+
+    def upload(self, name, size):
+        buf = tempfile.SpooledTemporaryFile()
+        PILImage.new('RGB', size, 'olive').save(buf, 'JPEG')
+        buf.seek(0)
+        image = ProductImage(product=self.product, is_primary=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image.save(name, ContentFile(buf.read()), save=True)
+        image.refresh_from_db()
+        return image
+
+    def test_upload_builds_srcset_without_upscaling(self):
+        image = self.upload('calca.jpg', (1000, 1500))
+        self.assertEqual(set(image.derivatives['webp']), {'320', '640', '1000'})
+        with PILImage.open(os.path.join(MEDIA_ROOT, image.derivatives['webp']['320'])) as im:
+            self.assertEqual((im.format, im.size), ('WEBP', (320, 480)))
+
+        srcset = ProductImageSerializer(image).data['srcset']['webp'].split(', ')
+        self.assertEqual([entry.split(' ')[1] for entry in srcset], ['320w', '640w', '1000w'])
+
+        # Salvar de novo sem trocar o original não gera outra vez
+        with mock.patch.object(image_derivatives, 'render_derivatives') as render:
+            with self.captureOnCommitCallbacks(execute=True):
+                image.alt_text = 'Calça'
+                image.save()
+            render.assert_not_called()
+
+        names = image_derivatives.derivative_names(image.derivatives)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.delete()
+        self.assertFalse(any(os.path.exists(os.path.join(MEDIA_ROOT, n)) for n in names))
+
+    def test_rebuild_deletes_old_files_only_after_switching(self):
+        image = self.upload('calca-preta.jpg', (700, 700))
+        old_names = image_derivatives.derivative_names(image.derivatives)
+        delete = image_derivatives.default_storage.delete
+        deleted = []
+
+        def checked_delete(name):
+            live = image_derivatives.derivative_names(ProductImage.objects.get(pk=image.pk).derivatives)
+            self.assertNotIn(name, live)
+            deleted.append(name)
+            delete(name)
+
+        with mock.patch.object(image_derivatives.default_storage, 'delete', side_effect=checked_delete):
+            self.assertEqual(image_derivatives.build_derivatives([image.pk], force=True), 1)
+        image.refresh_from_db()
+        new_names = image_derivatives.derivative_names(image.derivatives)
+        self.assertEqual(sorted(deleted), sorted(set(old_names) - set(new_names)))
+        self.assertTrue(all(os.path.exists(os.path.join(MEDIA_ROOT, n)) for n in new_names))
+
+    def test_srcset_is_hidden_while_original_is_stale(self):
+        image = self.upload('calca-azul.jpg', (800, 800))
+        image.image.name = 'products/outra.jpg'
+        self.assertEqual(ProductImageSerializer(image).data['srcset'], {})
+
+
+class MediaUrlTests(TestCase):
+    def test_base_is_cached_and_follows_settings(self):
+        with override_settings(AWS_STORAGE_BUCKET_NAME='media', AWS_S3_CUSTOM_DOMAIN='pub-1.r2.dev/media/'):
+            with mock.patch.object(media, '_compute_base', wraps=media._compute_base) as compute:
+                urls = [media.media_url(f'/products/{i}.jpg') for i in range(5)]
+            self.assertEqual(compute.call_count, 1)
+            self.assertEqual(urls[0], 'https://pub-1.r2.dev/products/0.jpg')
+            self.assertEqual(
+                ProductImageSerializer(ProductImage(image='products/a.jpg')).data['image'],
+                'https://pub-1.r2.dev/products/a.jpg',
+            )
+        with override_settings(AWS_S3_ENDPOINT_URL='https://conta.r2.cloudflarestorage.com', AWS_STORAGE_BUCKET_NAME='media'):
+            self.assertEqual(media.media_url('products/a.jpg'), 'https://conta.r2.cloudflarestorage.com/media/products/a.jpg')
+        self.assertIsNone(media.media_url(''))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SalesStatsTests(CatalogTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        from orders.models import Order, OrderItem
+
+        category = Category.objects.create(name='Camisetas', slug='camisetas')
+        cls.product = Product.objects.create(category=category, name='Básica', slug='basica', base_price='50.00')
+        variant = ProductVariant.objects.create(product=cls.product, sku='BAS-M', size='M', stock=10)
+        cls.orders = [Order.objects.create(email=f'c{i}@example.com') for i in range(2)]
+        for order in cls.orders:
+            OrderItem.objects.create(order=order, variant=variant, product_name='Básica', unit_price='50.00', quantity=2)
+        cls.admin = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'senha-forte-123')
+
+    def bulk_status(self, new_status):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post('/api/orders/bulk-update-status/', {
+                'order_ids': [order.id for order in self.orders], 'status': new_status,
+            }, format='json')
+        self.assertEqual(response.data['updated'], 2)
+        return ProductSalesStats.objects.get(product=self.product)
+
+    def test_bulk_status_update_keeps_stats(self):
+        stats = self.bulk_status('paid')
+        self.assertEqual((stats.units_total, stats.revenue_total, stats.units_7d), (4, Decimal('200.00'), 4))
+        # paid -> shipped não conta de novo
+        self.assertEqual(self.bulk_status('shipped').units_total, 4)
+        stats = self.bulk_status('canceled')
+        self.assertEqual((stats.units_total, stats.revenue_total, stats.units_30d), (0, Decimal('0.00'), 0))
+
+    @override_settings(SALES_WINDOWS_REFRESH='sync')
+    def test_windows_refresh_lazily_when_stale(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from orders.models import Order
+        from . import sales
+
+        cache.clear()
+        self.bulk_status('paid')
+        Order.objects.update(created_at=timezone.now() - timedelta(days=10))
+
+        # Estatísticas recentes: nada a recalcular
+        sales.schedule_windows_refresh()
+        self.assertEqual(ProductSalesStats.objects.get(product=self.product).units_7d, 4)
+
+        ProductSalesStats.objects.update(updated_at=timezone.now() - timedelta(hours=2))
+        # Verificação recente ainda vale (SALES_WINDOWS_CHECK_INTERVAL)
+        sales.schedule_windows_refresh()
+        self.assertEqual(ProductSalesStats.objects.get(product=self.product).units_7d, 4)
+
+        cache.delete(sales.WINDOWS_CHECK_KEY)
+        sales.schedule_windows_refresh()
+        stats = ProductSalesStats.objects.get(product=self.product)
+        self.assertEqual((stats.units_7d, stats.units_30d, stats.units_total), (0, 4, 4))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AutocompleteTests(CatalogTestCase):
+    def setUp(self):
+        cache.clear()
+        autocomplete.reset_autocomplete_index()
+        self.addCleanup(autocomplete.reset_autocomplete_index)
+        self.category = Category.objects.create(name='Calçados', slug='calcados')
+        self.tenis = Product.objects.create(category=self.category, name='Tênis Corrida', slug='tenis', base_price='299.90')
+        self.tenis_casual = Product.objects.create(category=self.category, name='Tênis Casual', slug='tenis-casual', base_price='199.90')
+        ProductSalesStats.objects.create(product=self.tenis_casual, units_total=30)
+        self.variant = ProductVariant.objects.create(product=self.tenis, sku='TEN-40', size='40', stock=5)
+
+    def names(self, query):
+        return [entry['name'] for entry in autocomplete.get_autocomplete_index().suggest(query)]
+
+    def test_prefix_matching_ignores_accents_and_ranks_by_sales(self):
+        self.assertEqual(self.names('ten'), ['Tênis Casual', 'Tênis Corrida'])
+        self.assertEqual(self.names('TENIS cor'), ['Tênis Corrida'])
+        self.assertEqual(self.names('calc'), ['Tênis Casual', 'Tênis Corrida'])
+        self.assertEqual(self.names('sapato'), [])
+        self.assertEqual(
+            [c['slug'] for c in autocomplete.get_autocomplete_index().suggest_categories('calç')], ['calcados']
+        )
+
+    def test_only_relevant_changes_publish_deltas(self):
+        autocomplete.get_autocomplete_index()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.variant.stock = 4
+            self.variant.save()
+            Product.objects.get(pk=self.tenis.pk).save()
+        self.assertEqual(autocomplete.current_sequence(), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenis.name = 'Tênis Trilha'
+            self.tenis.save()
+        self.assertEqual(autocomplete.current_sequence(), 1)
+        self.assertEqual(self.names('tri'), ['Tênis Trilha'])
+
+    def test_other_workers_apply_deltas_without_rebuilding(self):
+        stale = autocomplete.build_index(version=autocomplete.current_sequence())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tenis.name = 'Tênis Trilha'
+            self.tenis.save()
+
+        # Outro worker: índice antigo, vê a sequência nova na próxima verificação
+        autocomplete._index = stale
+        autocomplete._last_check = 0.0
+        with mock.patch.object(autocomplete, 'build_index') as build:
+            self.assertEqual(self.names('tri'), ['Tênis Trilha'])
+        build.assert_not_called()
+        self.assertEqual(stale.version, autocomplete.current_sequence())
+
+        autocomplete.invalidate_autocomplete()
+        autocomplete._last_check = 0.0
+        with mock.patch.object(autocomplete, '_rebuild_in_background') as rebuild:
+            self.assertEqual(self.names('tri'), ['Tênis Trilha'])
+        rebuild.assert_called_once()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class SearchTests(CatalogTestCase):
+    BACKENDS = ('catalog.search.SQLiteFTSSearchBackend', 'catalog.search.SimpleSearchBackend')
+
+    def setUp(self):
+        cache.clear()
+        search.reset_search_backend()
+        self.addCleanup(search.reset_search_backend)
+        category = Category.objects.create(name='Camisaria', slug='camisaria')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.algodao = Product.objects.create(category=category, name='Camisa Algodão', slug='camisa-algodao', base_price='120.00')
+            self.linho = Product.objects.create(category=category, name='Camisa Linho', slug='camisa-linho', base_price='90.00')
+            self.calca = Product.objects.create(
+                category=category, name='Calça Social', slug='calca-social', base_price='150.00',
+                description='Combina com camisa',
+            )
+
+    def test_backends_rank_title_matches_first(self):
+        for path in self.BACKENDS:
+            with self.subTest(backend=path), override_settings(CATALOG_SEARCH_BACKEND=path):
+                search.reset_search_backend()
+                ranked = search.search_product_ids('camisa')
+                self.assertEqual(set(ranked[:2]), {self.algodao.id, self.linho.id})
+                self.assertEqual(ranked[2:], [self.calca.id])
+                self.assertEqual(search.search_product_ids('ALGODAO camis'), [self.algodao.id])
+                matching = search.filter_products(Product.objects.all(), 'camisa linho')
+                self.assertEqual(list(matching.values_list('id', flat=True)), [self.linho.id])
+
+    @override_settings(CATALOG_SEARCH_MAX_RESULTS=1)
+    def test_result_cap_only_applies_to_relevance(self):
+        client = APIClient()
+        response = client.get('/api/advanced-search/', {'q': 'camisa', 'sort_by': 'price_asc'})
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(
+            [p['id'] for p in response.data['results']], [self.linho.id, self.algodao.id, self.calca.id]
+        )
+        response = client.get('/api/advanced-search/', {'q': 'camisa'})
+        self.assertEqual(response.data['count'], 1)
+
+    def walk(self, params):
+        """Percorre as páginas pelo next e volta pelo previous; retorna (ids, contagens)"""
+        client = APIClient()
+        pages, cursor = [], ''
+        while cursor is not None:
+            data = client.get('/api/advanced-search/', {**params, 'cursor': cursor, 'page_size': 1}).data
+            pages.append([p['id'] for p in data['results']])
+            cursor = data['next']
+        # Da última página, uma para trás
+        back = client.get('/api/advanced-search/', {**params, 'cursor': data['previous'], 'page_size': 1}).data
+        return pages, data['count'], back
+
+    def test_relevance_cursor_seeks_on_rank(self):
+        for path in self.BACKENDS:
+            with self.subTest(backend=path), override_settings(CATALOG_SEARCH_BACKEND=path):
+                search.reset_search_backend()
+                cache.clear()
+                pages, count, back = self.walk({'q': 'camisa'})
+                self.assertEqual(sum(pages, []), search.search_product_ids('camisa'))
+                self.assertEqual(count, 3)
+                self.assertEqual([p['id'] for p in back['results']], pages[1])
+                # O cursor carrega o score, não uma posição na lista
+                payload = json.loads(base64.urlsafe_b64decode(back['next'] + '=' * (-len(back['next']) % 4)))
+                self.assertEqual(payload['o'], '-search_rank,-id')
+
+    def test_price_cursor_round_trip(self):
+        pages, count, back = self.walk({'q': 'camisa', 'sort_by': 'price_desc'})
+        self.assertEqual(pages, [[self.calca.id], [self.algodao.id], [self.linho.id]])
+        self.assertEqual(count, 3)
+        self.assertEqual([p['id'] for p in back['results']], [self.algodao.id])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, RECOMMENDATIONS_MODEL_CHECK_INTERVAL=0)
+class SimilarityModelTests(TestCase):
+    # Ids acima de int32: a PK é BigAutoField
+    BIG = 2 ** 40
+
+    def setUp(self):
+        self.local = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.local, ignore_errors=True)
+        self.addCleanup(similarity.reset_similarity_model)
+        self.addCleanup(similarity.default_storage.delete, similarity.get_model_name())
+        similarity.reset_similarity_model()
+        self.neighbors = {
+            'bought_together': {1: [(self.BIG, 0.9), (3, 0.5)], self.BIG: [(1, 0.9)]},
+            'complete_look': {3: [(1, 0.25)]},
+        }
+
+    def publish(self, name='trained.bin', neighbors=None):
+        path = os.path.join(self.local, name)
+        similarity.save_model(path, [1, 3, self.BIG], neighbors or self.neighbors, k=2)
+        similarity.publish_model(path)
+
+    def test_neighbors_are_read_from_the_file(self):
+        path = os.path.join(self.local, 'model.bin')
+        similarity.save_model(path, [1, 3, self.BIG], self.neighbors, k=2)
+        model = similarity.SimilarityModel(path)
+
+        self.assertEqual(model.neighbors(1, 'bought_together'), [(self.BIG, mock.ANY), (3, 0.5)])
+        self.assertAlmostEqual(model.neighbors(1, 'bought_together')[0][1], 0.9, places=5)
+        self.assertEqual([pk for pk, _ in model.neighbors(self.BIG, 'bought_together')], [1])
+        self.assertEqual(model.neighbors(1, 'bought_together', limit=1)[0][0], self.BIG)
+        self.assertEqual(model.neighbors(3, 'complete_look'), [(1, 0.25)])
+        self.assertEqual(model.neighbors(3, 'bought_together'), [])
+        self.assertEqual(model.neighbors(2, 'bought_together'), [])
+
+    def test_workers_load_the_published_model_from_storage(self):
+        self.assertIsNone(similarity.refresh_similarity_model())
+
+        self.publish()
+        with override_settings(RECOMMENDATIONS_MODEL_PATH=os.path.join(self.local, 'worker', 'copy.bin')):
+            model = similarity.refresh_similarity_model()
+        self.assertIsNotNone(model)
+        self.assertEqual(model.neighbors(3, 'complete_look'), [(1, 0.25)])
+        self.assertTrue(os.path.exists(os.path.join(self.local, 'worker', 'copy.bin')))
+
+        # Sem mudança no storage o modelo carregado é reaproveitado
+        self.assertIs(similarity.refresh_similarity_model(), model)
+
+    def test_republished_model_replaces_the_loaded_one(self):
+        self.publish()
+        self.assertEqual(similarity.refresh_similarity_model().neighbors(3, 'complete_look'), [(1, 0.25)])
+
+        with mock.patch.object(similarity.default_storage, 'get_modified_time', return_value=object()):
+            self.publish(neighbors={'bought_together': {}, 'complete_look': {3: [(self.BIG, 0.5)]}})
+            self.assertEqual(similarity.refresh_similarity_model().neighbors(3, 'complete_look'), [(self.BIG, 0.5)])
+
+    @override_settings(RECOMMENDATIONS_MODEL_CHECK_INTERVAL=60)
+    def test_requests_never_touch_the_storage(self):
+        self.publish()
+        with mock.patch.object(similarity.threading, 'Thread') as thread, \
+                mock.patch.object(similarity.default_storage, 'get_modified_time') as modified:
+            self.assertIsNone(similarity.get_similarity_model())
+            self.assertIsNone(similarity.get_similarity_model())
+        modified.assert_not_called()
+        thread.assert_called_once_with(target=similarity._run_background_refresh, daemon=True)
+        thread.return_value.start.assert_called_once()
+
+        # A thread carrega o modelo; as requisições seguintes já o recebem
+        similarity._run_background_refresh()
+        self.assertEqual(similarity.get_similarity_model().neighbors(3, 'complete_look'), [(1, 0.25)])
+
+    def test_old_format_is_rejected(self):
+        path = os.path.join(self.local, 'old.bin')
+        with open(path, 'wb') as f:
+            f.write(similarity.struct.pack(similarity.HEADER, b'SIM1', 2, 0, len(similarity.KINDS)))
+        with self.assertRaises(ValueError):
+            similarity.SimilarityModel(path)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class BoughtTogetherFallbackTests(CatalogTestCase):
+    def test_products_missing_from_the_model_use_the_orders(self):
+        from orders.models import Order, OrderItem
+        from .recommendations import ProductRecommendations
+
+        cache.clear()
+        category = Category.objects.create(name='Meias', slug='meias')
+        sock, shoe = (
+            Product.objects.create(category=category, name=name, slug=name.lower(), base_price='20.00')
+            for name in ('Meia', 'Sapato')
+        )
+        order = Order.objects.create(status='paid')
+        for product in (sock, shoe):
+            variant = ProductVariant.objects.create(product=product, sku=f'{product.slug}-U', size='U', stock=3)
+            OrderItem.objects.create(order=order, variant=variant, product_name=product.name, unit_price='20.00')
+
+        # Modelo carregado, mas treinado antes do produto existir
+        model = mock.Mock(**{'neighbors.return_value': []})
+        with mock.patch('catalog.recommendations.get_similarity_model', return_value=model):
+            self.assertEqual(ProductRecommendations.get_frequently_bought_together(sock.id), [shoe])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ProductListCacheTests(CatalogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name='Bonés', slug='bones')
+        self.product = Product.objects.create(category=self.category, name='Boné Aba Reta', slug='bone', base_price='59.90')
+        self.related = Product.objects.create(category=self.category, name='Boné Dad Hat', slug='dad-hat', base_price='49.90')
+        self.url = f'/api/products/{self.product.pk}/related/'
+
+    def test_etag_revalidates_and_catalog_changes_invalidate(self):
+        first = self.client.get(self.url)
+        self.assertEqual((first.status_code, first['X-Cache']), (200, 'MISS'))
+        etag = first['ETag']
+
+        # Uma única camada de cache: a segunda requisição não consulta o banco
+        with self.assertNumQueries(0):
+            cached = self.client.get(self.url)
+        self.assertEqual((cached['X-Cache'], cached['ETag']), ('HIT', etag))
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.related.name = 'Boné Trucker'
+            self.related.save()
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((changed.status_code, changed['X-Cache']), (200, 'MISS'))
+        self.assertNotEqual(changed['ETag'], etag)
+        self.assertEqual([p['name'] for p in changed.json()], ['Boné Trucker'])
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FacetTests(CatalogTestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Polos', slug='polos')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.piquet = Product.objects.create(
+                category=self.category, name='Polo Piquet', slug='polo-piquet', base_price='89.90', fabric_type='Piquet',
+            )
+            ProductVariant.objects.create(product=self.piquet, sku='PIQ-M', size='M', color='Azul', stock=2)
+            ProductVariant.objects.create(product=self.piquet, sku='PIQ-L', size='L', color='Azul', stock=0)
+            self.malha = Product.objects.create(
+                category=self.category, name='Polo Malha', slug='polo-malha', base_price='149.90', fabric_type='Malha',
+            )
+            ProductVariant.objects.create(product=self.malha, sku='MAL-S', size='S', color='Preto', stock=0)
+            ProductVariant.objects.create(product=self.malha, sku='MAL-M', size='M', color='Branco', stock=3)
+            inactive = Product.objects.create(
+                category=self.category, name='Polo Antiga', slug='polo-antiga', base_price='10.00', is_active=False,
+            )
+            ProductVariant.objects.create(product=inactive, sku='ANT-M', size='M', color='Azul', stock=9)
+
+    def test_counts_cover_the_filtered_products_only(self):
+        facets = compute_facet_counts(Product.objects.filter(is_active=True))
+        self.assertEqual(facets['size'], [
+            {'value': 'S', 'count': 1, 'in_stock_count': 0},
+            {'value': 'M', 'count': 2, 'in_stock_count': 2},
+            {'value': 'L', 'count': 1, 'in_stock_count': 0},
+        ])
+        self.assertEqual([i['value'] for i in facets['price']], ['50-100', '100-200'])
+        self.assertEqual(facets['stock'], [{'value': 'in_stock', 'count': 2, 'in_stock_count': 2}])
+
+        azul = compute_facet_counts(Product.objects.filter(pk=self.piquet.pk))
+        self.assertEqual([i['value'] for i in azul['color']], ['Azul'])
+
+    def test_variant_changes_refresh_the_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.filter(sku='PIQ-L').first().delete()
+            variant = ProductVariant.objects.get(sku='MAL-S')
+            variant.stock = 4
+            variant.save()
+        facets = compute_facet_counts(Product.objects.filter(is_active=True))
+        self.assertEqual(facets['size'], [
+            {'value': 'S', 'count': 1, 'in_stock_count': 1},
+            {'value': 'M', 'count': 2, 'in_stock_count': 2},
+        ])
+
+    def test_filter_options_use_the_facet_index(self):
+        response = APIClient().get('/api/filter-options/', {'size': 'S'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sizes'], ['M'])
+        self.assertEqual(response.data['colors'], ['Branco'])
+        self.assertEqual(response.data['fabric_types'], ['Malha'])
+
+        response = APIClient().get('/api/advanced-search/', {'size': 'L', 'in_stock': 'true', 'facets': 'true'})
+        self.assertEqual([p['id'] for p in response.data['results']], [self.piquet.id])
+        self.assertEqual(response.data['facets']['fabric'], [{'value': 'Piquet', 'count': 1, 'in_stock_count': 1}])
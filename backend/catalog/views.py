@@ -7,6 +7,7 @@ from django_filters.rest_framework import DjangoFilterBackend
 from .models import Category, Product, ProductImage, ProductVariant
 from .serializers import CategorySerializer, ProductSerializer, ProductWriteSerializer, ProductImageSerializer
 from django.shortcuts import get_object_or_404
+from core.pagination import ProductKeysetPagination
 
 
 class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -52,6 +53,13 @@ class ProductViewSet(viewsets.ModelViewSet):
     search_fields = ['name', 'description', 'fabric_type']
     ordering_fields = ['created_at', 'base_price', 'name']
     ordering = ['-created_at']
+    pagination_class = ProductKeysetPagination
+
+    def paginate_queryset(self, queryset):
+        # Sem ?cursor= a listagem continua completa (compatível com o frontend atual)
+        if self.paginator is None or 'cursor' not in self.request.query_params:
+            return None
+        return super().paginate_queryset(queryset)
 
     @action(detail=True, methods=['post'], url_path='upload-image', parser_classes=[MultiPartParser, FormParser])
     def upload_image(self, request, pk=None):
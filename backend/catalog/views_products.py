@@ -7,91 +7,73 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Count, Avg, Q, F
 from .models import Product, ProductVariant
+from .sales import schedule_windows_refresh
 from .serializers import ProductSerializer
 from orders.models import OrderItem
 from django.core.cache import cache
+from core.cache import CATALOG_TAG, cache_response
 
 
+@cache_response(timeout=300, key_prefix='featured_products', tags=[CATALOG_TAG], vary_on_user=False, stale_timeout=300)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def featured_products(request):
     """
     Retorna produtos em destaque
     """
-    cache_key = 'featured_products'
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        return Response(cached_data)
-    
     # Produtos com is_featured=True ou mais vendidos
     products = Product.objects.filter(
         is_active=True
     ).select_related('category').prefetch_related(
         'variants', 'images'
-    ).annotate(
-        total_sold=Count('variants__orderitem')
-    ).order_by('-total_sold')[:12]
-    
-    serializer = ProductSerializer(products, many=True)
-    cache.set(cache_key, serializer.data, 300)  # Cache por 5 minutos
-    
-    return Response(serializer.data)
+    ).order_by(
+        F('sales_stats__units_total').desc(nulls_last=True), '-created_at'
+    )[:12]
+    return Response(ProductSerializer(products, many=True).data)
 
 
+@cache_response(timeout=600, key_prefix='bestsellers', tags=[CATALOG_TAG], vary_on_user=False, stale_timeout=600)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def bestsellers(request):
     """
     Retorna produtos mais vendidos
-    """
-    cache_key = 'bestseller_products'
-    cached_data = cache.get(cache_key)
     
-    if cached_data:
-        return Response(cached_data)
+    Query param:
+    - period: all (padrão), 30d ou 7d
+    """
+    period = request.GET.get('period', 'all')
+    units_field = {'7d': 'units_7d', '30d': 'units_30d'}.get(period, 'units_total')
+    if units_field != 'units_total':
+        # Sem beat no deploy: as janelas são renovadas a partir das leituras
+        schedule_windows_refresh()
     
-    # Produtos com mais vendas
+    # Produtos com mais vendas (ProductSalesStats, ver catalog.sales)
     products = Product.objects.filter(
-        is_active=True
+        is_active=True,
+        **{f'sales_stats__{units_field}__gt': 0}
     ).select_related('category').prefetch_related(
         'variants', 'images'
-    ).annotate(
-        total_sold=Count('variants__orderitem')
-    ).filter(
-        total_sold__gt=0
-    ).order_by('-total_sold')[:12]
-    
-    serializer = ProductSerializer(products, many=True)
-    cache.set(cache_key, serializer.data, 600)  # Cache por 10 minutos
-    
-    return Response(serializer.data)
+    ).order_by(f'-sales_stats__{units_field}', '-created_at')[:12]
+    return Response(ProductSerializer(products, many=True).data)
 
 
+@cache_response(timeout=300, key_prefix='new_arrivals', tags=[CATALOG_TAG], vary_on_user=False, stale_timeout=300)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def new_arrivals(request):
     """
     Retorna produtos mais recentes
     """
-    cache_key = 'new_arrivals'
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        return Response(cached_data)
-    
     products = Product.objects.filter(
         is_active=True
     ).select_related('category').prefetch_related(
         'variants', 'images'
     ).order_by('-created_at')[:12]
-    
-    serializer = ProductSerializer(products, many=True)
-    cache.set(cache_key, serializer.data, 300)
-    
-    return Response(serializer.data)
+    return Response(ProductSerializer(products, many=True).data)
 
 
+@cache_response(timeout=600, key_prefix='related_products', tags=[CATALOG_TAG], vary_on_user=False, stale_timeout=600)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def related_products(request, product_id):
@@ -106,12 +88,6 @@ def related_products(request, product_id):
             status=status.HTTP_404_NOT_FOUND
         )
     
-    cache_key = f'related_products_{product_id}'
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        return Response(cached_data)
-    
     # Produtos da mesma categoria, excluindo o produto atual
     related = Product.objects.filter(
         category=product.category,
@@ -121,11 +97,7 @@ def related_products(request, product_id):
     ).select_related('category').prefetch_related(
         'variants', 'images'
     ).order_by('?')[:6]  # Aleatório
-    
-    serializer = ProductSerializer(related, many=True)
-    cache.set(cache_key, serializer.data, 600)
-    
-    return Response(serializer.data)
+    return Response(ProductSerializer(related, many=True).data)
 
 
 @api_view(['POST'])
@@ -174,7 +146,7 @@ def personalized_recommendations(request):
     
     if not purchased_categories:
         # Se não tem compras, retorna bestsellers
-        return bestsellers(request)
+        return bestsellers(request._request)
     
     # Produtos das categorias que o usuário já comprou
     recommendations = Product.objects.filter(
@@ -3,47 +3,49 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Q, Min, Max, Count, Avg
-from .models import Product, ProductVariant, Category
+from django.db.models.functions import Coalesce
+from .models import Product, Category
 from .serializers import ProductSerializer
+from .search import annotate_rank, filter_products, search_product_ids
+from .facets import compute_facet_counts, products_with_facet
+from .autocomplete import get_autocomplete_index
+from core.pagination import KeysetPagination
+from core.cache import CATALOG_TAG, cache_response
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Ordenações de advanced_search; o id desempata para paginação estável
+SORT_ORDERINGS = {
+    'price_asc': ['base_price', 'id'],
+    'price_desc': ['-base_price', '-id'],
+    'name': ['name', 'id'],
+    'newest': ['-created_at', '-id'],
+    'popular': ['-sales_count', '-id'],
+}
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def advanced_search(request):
+
+def _split_param(params, name):
+    raw = params.get(name, '').strip()
+    return [v.strip() for v in raw.split(',') if v.strip()]
+
+
+def _filter_products(params):
     """
-    Busca avançada de produtos com múltiplos filtros
-    
-    Query params:
-    - q: termo de busca (nome, descrição, categoria)
-    - category: ID da categoria
-    - min_price: preço mínimo
-    - max_price: preço máximo
-    - size: tamanhos (pode ser múltiplo, separado por vírgula)
-    - color: cores (pode ser múltiplo, separado por vírgula)
-    - in_stock: apenas produtos em estoque (true/false)
-    - sort_by: ordenação (price_asc, price_desc, name, newest, popular)
-    - limit: limite de resultados (default: 20)
-    - offset: offset para paginação (default: 0)
+    Aplica os filtros de busca (q, category, preço, size, color, in_stock).
+    Retorna (queryset, termo de busca); o termo é '' quando não há busca.
+    Tamanho, cor e estoque usam o índice de facetas em vez de joins + DISTINCT.
     """
+    products = Product.objects.filter(is_active=True)
     
-    # Base queryset
-    products = Product.objects.filter(is_active=True).prefetch_related('variants', 'images', 'category')
-    
-    # 1. Busca por texto
-    search_query = request.GET.get('q', '').strip()
+    # 1. Busca por texto (índice full-text, ver catalog.search): subconsulta
+    # sem limite; o ranking (limitado) só é buscado para ordenar por relevância
+    search_query = params.get('q', '').strip()
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query) |
-            Q(fabric_type__icontains=search_query)
-        )
+        products = filter_products(products, search_query)
     
     # 2. Filtro por categoria
-    category_id = request.GET.get('category')
+    category_id = params.get('category')
     if category_id:
         try:
             products = products.filter(category_id=int(category_id))
@@ -51,8 +53,8 @@ def advanced_search(request):
             pass
     
     # 3. Filtro por faixa de preço
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
+    min_price = params.get('min_price')
+    max_price = params.get('max_price')
     
     if min_price:
         try:
@@ -67,46 +69,80 @@ def advanced_search(request):
             pass
     
     # 4. Filtro por tamanho
-    sizes = request.GET.get('size', '').strip()
-    if sizes:
-        size_list = [s.strip() for s in sizes.split(',') if s.strip()]
-        if size_list:
-            products = products.filter(variants__size__in=size_list).distinct()
+    size_list = _split_param(params, 'size')
+    if size_list:
+        products = products.filter(id__in=products_with_facet('size', size_list))
     
     # 5. Filtro por cor
-    colors = request.GET.get('color', '').strip()
-    if colors:
-        color_list = [c.strip() for c in colors.split(',') if c.strip()]
-        if color_list:
-            products = products.filter(variants__color__in=color_list).distinct()
+    color_list = _split_param(params, 'color')
+    if color_list:
+        products = products.filter(id__in=products_with_facet('color', color_list))
     
     # 6. Filtro por disponibilidade em estoque
-    in_stock = request.GET.get('in_stock', '').lower()
-    if in_stock == 'true':
-        products = products.filter(variants__stock__gt=0).distinct()
-    
-    # 7. Ordenação
-    sort_by = request.GET.get('sort_by', 'newest')
-    
-    if sort_by == 'price_asc':
-        products = products.order_by('base_price')
-    elif sort_by == 'price_desc':
-        products = products.order_by('-base_price')
-    elif sort_by == 'name':
-        products = products.order_by('name')
-    elif sort_by == 'newest':
-        products = products.order_by('-created_at')
-    elif sort_by == 'popular':
-        # Ordenar por número de vendas (requer join com OrderItem)
-        from orders.models import OrderItem
-        products = products.annotate(
-            sales_count=Count('variants__orderitem', filter=Q(variants__orderitem__order__status='paid'))
-        ).order_by('-sales_count')
-    
-    # Total antes da paginação
-    total_count = products.count()
-    
-    # 8. Paginação
+    if params.get('in_stock', '').lower() == 'true':
+        products = products.filter(id__in=products_with_facet('stock', ['in_stock']))
+    
+    return products, search_query
+
+
+@cache_response(timeout=60, key_prefix='advanced_search', tags=[CATALOG_TAG], vary_on_user=False, stale_timeout=300)
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def advanced_search(request):
+    """
+    Busca avançada de produtos com múltiplos filtros
+    
+    Query params:
+    - q: termo de busca (nome, descrição, categoria)
+    - category: ID da categoria
+    - min_price: preço mínimo
+    - max_price: preço máximo
+    - size: tamanhos (pode ser múltiplo, separado por vírgula)
+    - color: cores (pode ser múltiplo, separado por vírgula)
+    - in_stock: apenas produtos em estoque (true/false)
+    - sort_by: ordenação (relevance, price_asc, price_desc, name, newest, popular)
+    - limit: limite de resultados (default: 20)
+    - offset: offset para paginação (default: 0)
+    - cursor: paginação por cursor (keyset); vazio na primeira página, depois
+      o valor de next/previous. Substitui offset e aceita page_size
+    - count: com cursor, exact (padrão), approx (contagem em cache) ou none
+    - facets: incluir contagens por faceta do resultado (true/false)
+    """
+    products, search_query = _filter_products(request.GET)
+    products = products.prefetch_related('variants', 'images', 'category')
+    
+    # 7. Ordenação (com termo de busca, o padrão é relevância)
+    sort_by = request.GET.get('sort_by') or ('relevance' if search_query else 'newest')
+    if sort_by == 'relevance' and not search_query:
+        sort_by = 'newest'
+    
+    if sort_by not in SORT_ORDERINGS and sort_by != 'relevance':
+        sort_by = 'newest'
+    if sort_by == 'popular':
+        # Unidades vendidas vêm da tabela desnormalizada (catalog.sales)
+        products = products.annotate(sales_count=Coalesce('sales_stats__units_total', 0))
+    if sort_by != 'relevance':
+        products = products.order_by(*SORT_ORDERINGS[sort_by])
+    
+    # 8a. Paginação por cursor: custo constante por página
+    if 'cursor' in request.GET:
+        paginator = KeysetPagination()
+        if sort_by == 'relevance':
+            # Score calculado no banco: o cursor guarda (score, id) e a próxima página busca a partir dele
+            products = annotate_rank(products, search_query).order_by('-search_rank', '-id')
+        page = paginator.paginate_queryset(products, request)
+        
+        data = {
+            'count': paginator.count,
+            'next': paginator.next_cursor,
+            'previous': paginator.previous_cursor,
+            'results': ProductSerializer(page, many=True).data,
+        }
+        if request.GET.get('facets', '').lower() == 'true':
+            data['facets'] = compute_facet_counts(products)
+        return Response(data)
+    
+    # 8b. Paginação por offset
     try:
         limit = int(request.GET.get('limit', 20))
         offset = int(request.GET.get('offset', 0))
@@ -116,17 +152,37 @@ def advanced_search(request):
     
     # Limitar resultados
     limit = min(limit, 100)  # Máximo 100 por requisição
-    paginated_products = products[offset:offset + limit]
+    
+    if sort_by == 'relevance':
+        # Ordem vem do ranking do índice (até CATALOG_SEARCH_MAX_RESULTS); filtros restantes apenas recortam a lista
+        ranked_ids = search_product_ids(search_query)
+        matching_ids = set(products.values_list('id', flat=True))
+        ordered_ids = [pk for pk in ranked_ids if pk in matching_ids]
+        total_count = len(ordered_ids)
+        page_ids = ordered_ids[offset:offset + limit]
+        position = {pk: idx for idx, pk in enumerate(page_ids)}
+        paginated_products = sorted(
+            products.filter(id__in=page_ids),
+            key=lambda p: position[p.id]
+        )
+    else:
+        # Total antes da paginação
+        total_count = products.count()
+        paginated_products = products[offset:offset + limit]
     
     # Serializar
     serializer = ProductSerializer(paginated_products, many=True)
     
-    return Response({
+    data = {
         'count': total_count,
         'next': offset + limit if offset + limit < total_count else None,
         'previous': offset - limit if offset > 0 else None,
         'results': serializer.data
-    })
+    }
+    if request.GET.get('facets', '').lower() == 'true':
+        data['facets'] = compute_facet_counts(products)
+    
+    return Response(data)
 
 
 @api_view(['GET'])
@@ -144,62 +200,55 @@ def autocomplete_search(request):
     if len(search_query) < 2:
         return Response({'suggestions': []})
     
-    limit = min(int(request.GET.get('limit', 10)), 20)
-    
-    # Buscar produtos
-    products = Product.objects.filter(
-        is_active=True
-    ).filter(
-        Q(name__icontains=search_query) |
-        Q(category__name__icontains=search_query)
-    )[:limit]
-    
-    suggestions = []
-    for product in products:
-        suggestions.append({
-            'id': product.id,
-            'name': product.name,
-            'category': product.category.name if product.category else '',
-            'price': float(product.base_price),
-            'image': product.images.first().image.url if product.images.exists() else None
-        })
-    
-    return Response({'suggestions': suggestions})
+    try:
+        limit = min(int(request.GET.get('limit', 10)), 20)
+    except ValueError:
+        limit = 10
+    
+    # Índice em memória (catalog.autocomplete): sem consultas ao banco
+    index = get_autocomplete_index()
+    suggestions = [
+        {
+            'id': entry['id'],
+            'name': entry['name'],
+            'category': entry['category'],
+            'price': entry['price'],
+            'image': entry['image'],
+        }
+        for entry in index.suggest(search_query, limit=limit)
+    ]
+    categories = [
+        {'id': entry['id'], 'name': entry['name'], 'slug': entry['slug']}
+        for entry in index.suggest_categories(search_query, limit=5)
+    ]
+    
+    return Response({'suggestions': suggestions, 'categories': categories})
 
 
+@cache_response(timeout=300, key_prefix='filter_options', tags=[CATALOG_TAG], vary_on_user=False, stale_timeout=600)
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_filter_options(request):
     """
     Retorna todas as opções disponíveis para filtros
     Útil para popular dropdowns e checkboxes no frontend
+    
+    Aceita os mesmos query params de filtro de advanced_search (q, category,
+    size, ...); 'facets' traz a contagem de produtos por valor no resultado atual.
     """
+    products, _ = _filter_products(request.GET)
+    
     # Categorias
     categories = Category.objects.all().values('id', 'name')
     
     # Faixa de preços (min e max)
-    price_range = Product.objects.filter(is_active=True).aggregate(
+    price_range = products.aggregate(
         min_price=Min('base_price'),
         max_price=Max('base_price')
     )
     
-    # Tamanhos disponíveis
-    sizes = ProductVariant.objects.filter(
-        product__is_active=True,
-        stock__gt=0
-    ).values_list('size', flat=True).distinct().order_by('size')
-    
-    # Cores disponíveis
-    colors = ProductVariant.objects.filter(
-        product__is_active=True,
-        stock__gt=0
-    ).values_list('color', flat=True).distinct().order_by('color')
-    
-    # Tipos de tecido
-    fabric_types = Product.objects.filter(
-        is_active=True,
-        fabric_type__isnull=False
-    ).exclude(fabric_type='').values_list('fabric_type', flat=True).distinct()
+    # Tamanhos, cores e tecidos a partir do índice de facetas (uma consulta)
+    facets = compute_facet_counts(products)
     
     return Response({
         'categories': list(categories),
@@ -207,10 +256,12 @@ def get_filter_options(request):
             'min': float(price_range['min_price'] or 0),
             'max': float(price_range['max_price'] or 0)
         },
-        'sizes': list(filter(None, sizes)),
-        'colors': list(filter(None, colors)),
-        'fabric_types': list(fabric_types),
+        'sizes': [i['value'] for i in facets.get('size', []) if i['in_stock_count']],
+        'colors': [i['value'] for i in facets.get('color', []) if i['in_stock_count']],
+        'fabric_types': [i['value'] for i in facets.get('fabric', [])],
+        'facets': facets,
         'sort_options': [
+            {'value': 'relevance', 'label': 'Mais Relevantes'},
             {'value': 'newest', 'label': 'Mais Recentes'},
             {'value': 'popular', 'label': 'Mais Populares'},
             {'value': 'price_asc', 'label': 'Menor Preço'},
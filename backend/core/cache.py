@@ -1,13 +1,42 @@
 """
 Sistema de cache para melhorar performance do e-commerce
 Implementa cache em memória e decorators para views
+
+Invalidação por tags: cada tag (product:<id>, category:<id>, catalog, ...)
+tem um contador de geração no cache. Chaves gravadas com tags levam no nome
+as gerações atuais; invalidar uma tag é só incrementar o contador, e as
+entradas antigas deixam de ser encontradas (expiram pelo próprio TTL).
+Funciona igual em LocMem, arquivo, banco e Redis.
 """
 
 from functools import wraps
 from django.core.cache import cache
 from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
 import hashlib
 import json
+import logging
+import math
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TAG_KEY_PREFIX = 'cache_tag'
+
+# Listagens do catálogo (destaques, mais vendidos, listas de produtos...)
+CATALOG_TAG = 'catalog'
+CATEGORIES_TAG = 'categories'
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'category:{category_id}'
 
 
 def generate_cache_key(prefix, *args, **kwargs):
@@ -21,52 +50,289 @@ def generate_cache_key(prefix, *args, **kwargs):
     return f"{prefix}:{key_hash}"
 
 
-def cache_response(timeout=300, key_prefix='view'):
+def _vary_fingerprint(request, vary_on_user):
+    """Partes da requisição que mudam a resposta (Accept e, opcionalmente, autenticação)"""
+    parts = [request.META.get('HTTP_ACCEPT', '')]
+    if vary_on_user:
+        parts.append(request.META.get('HTTP_AUTHORIZATION', ''))
+        parts.append(request.COOKIES.get(settings.SESSION_COOKIE_NAME, ''))
+    return hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH', '')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    return etag in [tag.strip() for tag in header.split(',')]
+
+
+def _build_response(entry, request, cache_status):
+    if _etag_matches(request, entry['etag']):
+        response = HttpResponseNotModified()
+        for header, value in entry['headers']:
+            if header.lower() in ('etag', 'vary', 'cache-control'):
+                response[header] = value
+    else:
+        response = HttpResponse(entry['content'], status=entry['status'])
+        for header, value in entry['headers']:
+            response[header] = value
+    response['X-Cache'] = cache_status
+    return response
+
+
+def cache_response(timeout=300, key_prefix='view', tags=None, vary_on_user=True, stale_timeout=0):
     """
-    Decorator para cachear respostas de views
+    Decorator que cacheia a resposta HTTP já renderizada (bytes + headers)
+    
+    - ETag forte (sha256 do corpo); If-None-Match correspondente recebe 304
+    - vary_on_user: a chave inclui Authorization e o cookie de sessão, e a
+      resposta leva Vary: Authorization, Cookie. Use False para endpoints
+      públicos cujo conteúdo não depende do usuário
+    - tags: tags de invalidação (lista ou função(request, *args, **kwargs))
+    - stale_timeout: depois de expirar, a resposta antiga continua sendo
+      servida por até stale_timeout segundos enquanto uma única requisição
+      recalcula (stale-while-revalidate)
+    
+    Deve ficar acima de @api_view, para receber a resposta já finalizada:
     
     Usage:
-        @cache_response(timeout=600, key_prefix='products')
+        @cache_response(timeout=600, key_prefix='products', tags=[CATALOG_TAG], vary_on_user=False)
+        @api_view(['GET'])
         def my_view(request):
             ...
     """
     def decorator(view_func):
         @wraps(view_func)
         def wrapper(request, *args, **kwargs):
-            # Gera chave única baseada na URL e query params
-            cache_key = generate_cache_key(
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            
+            # Gera chave única baseada na URL, query params e headers relevantes
+            base_key = generate_cache_key(
                 key_prefix,
                 request.path,
-                request.GET.dict(),
-                request.user.id if request.user.is_authenticated else None
+                sorted(request.GET.lists()),
+                _vary_fingerprint(request, vary_on_user),
             )
+            key_tags = tags(request, *args, **kwargs) if callable(tags) else tags
+            cache_key = tagged_key(base_key, key_tags)
             
-            # Tenta buscar do cache
-            cached_response = cache.get(cache_key)
-            if cached_response is not None:
-                return cached_response
+            entry = cache.get(cache_key)
+            now = time.time()
+            if entry is not None:
+                if now < entry['fresh_until']:
+                    return _build_response(entry, request, 'HIT')
+                # Expirada: só quem pegar o lock recalcula, os demais recebem a cópia antiga
+                if not cache.add(f'{cache_key}:lock', 1, 30):
+                    return _build_response(entry, request, 'STALE')
             
-            # Executa a view e cacheia o resultado
-            response = view_func(request, *args, **kwargs)
-            cache.set(cache_key, response, timeout)
+            try:
+                response = view_func(request, *args, **kwargs)
+            except Exception:
+                cache.delete(f'{cache_key}:lock')
+                raise
+            if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                response.render()
             
+            cacheable = (
+                response.status_code == 200
+                and not response.cookies
+                and not getattr(response, 'streaming', False)
+            )
+            if not cacheable:
+                cache.delete(f'{cache_key}:lock')
+                return response
+            
+            etag = f'"{hashlib.sha256(response.content).hexdigest()[:32]}"'
+            response['ETag'] = etag
+            visibility = 'private' if vary_on_user else 'public'
+            cache_control = f'{visibility}, max-age={timeout}'
+            if stale_timeout:
+                cache_control += f', stale-while-revalidate={stale_timeout}'
+            response['Cache-Control'] = cache_control
+            patch_vary_headers(response, ('Accept', 'Authorization', 'Cookie') if vary_on_user else ('Accept',))
+            
+            entry = {
+                'status': response.status_code,
+                'content': response.content,
+                'headers': list(response.items()),
+                'etag': etag,
+                'fresh_until': now + timeout,
+            }
+            cache.set(cache_key, entry, timeout + stale_timeout)
+            cache.delete(f'{cache_key}:lock')
+            
+            if _etag_matches(request, etag):
+                return _build_response(entry, request, 'MISS')
+            response['X-Cache'] = 'MISS'
             return response
         return wrapper
     return decorator
 
 
+def _tag_key(tag):
+    return f'{TAG_KEY_PREFIX}:{tag}'
+
+
+def _new_generation():
+    # Baseada no relógio: uma tag despejada do cache nunca volta a uma geração antiga
+    return time.time_ns() // 1000
+
+
+def get_tag_versions(tags):
+    """Retorna {tag: geração}, criando as tags ausentes (uma ida ao cache)"""
+    keys = {tag: _tag_key(tag) for tag in tags}
+    found = cache.get_many(list(keys.values()))
+    versions = {}
+    for tag, key in keys.items():
+        version = found.get(key)
+        if version is None:
+            version = _new_generation()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+        versions[tag] = version
+    return versions
+
+
+def tagged_key(key, tags):
+    """Chave carimbada com as gerações atuais das tags"""
+    if not tags:
+        return key
+    versions = get_tag_versions(sorted(set(tags)))
+    stamp = ','.join(f'{tag}={versions[tag]}' for tag in sorted(versions))
+    return f"{key}@{hashlib.md5(stamp.encode()).hexdigest()[:12]}"
+
+
+def get_tagged(key, tags, default=None):
+    """cache.get para chaves gravadas com set_tagged"""
+    return cache.get(tagged_key(key, tags), default)
+
+
+def set_tagged(key, value, tags, timeout=300):
+    """cache.set associando a chave às tags (invalidada por invalidate_tags)"""
+    cache.set(tagged_key(key, tags), value, timeout)
+
+
+def invalidate_tags(*tags):
+    """
+    Invalida todas as chaves associadas às tags em O(1) por tag
+    
+    Usage:
+        invalidate_tags(product_tag(10), CATALOG_TAG)
+    """
+    for tag in set(tags):
+        key = _tag_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Tag ainda não existe (ou foi despejada): nova geração
+            cache.set(key, _new_generation(), None)
+
+
 def invalidate_cache(pattern):
     """
     Invalida cache baseado em padrão
     
+    O prefixo do padrão é tratado como tag ('products_list:*' -> tag
+    'products_list'); backends com delete_pattern (django-redis) também
+    removem as chaves físicas. Nunca limpa o cache inteiro.
+    
     Usage:
         invalidate_cache('products:*')
     """
-    try:
-        cache.delete_pattern(pattern)
-    except AttributeError:
-        # Fallback se delete_pattern não estiver disponível
-        cache.clear()
+    invalidate_tags(pattern.split(':', 1)[0].rstrip('*'))
+    delete_pattern = getattr(cache, 'delete_pattern', None)
+    if delete_pattern is not None:
+        delete_pattern(pattern)
+
+
+# Locks em processo por chave (pool fixo, evita crescer sem limite; reentrantes
+# para cálculos que chamam get_or_compute de outra chave)
+_COMPUTE_LOCKS = [threading.RLock() for _ in range(64)]
+
+
+def _compute_lock(key):
+    return _COMPUTE_LOCKS[int(hashlib.md5(key.encode()).hexdigest()[:8], 16) % len(_COMPUTE_LOCKS)]
+
+
+def get_or_compute(key, compute, timeout=300, tags=None, stale_timeout=None, beta=1.0,
+                   lock_timeout=30, wait_timeout=5):
+    """
+    cache.get -> compute() -> cache.set com proteção contra dogpile
+    
+    - Expiração antecipada probabilística (XFetch): perto do fim do TTL, uma
+      requisição ocasional recalcula antes de a chave expirar para todos
+    - Single-flight: só uma thread por processo (lock local) e um processo por
+      chave (lock no cache, cache.add) recalculam ao mesmo tempo
+    - Enquanto alguém recalcula, os demais recebem o valor antigo, que fica
+      guardado por mais stale_timeout segundos (padrão: o próprio timeout)
+    - Sem valor algum no cache, os demais esperam até wait_timeout segundos
+      pelo resultado antes de calcular por conta própria
+    
+    Valores falsos (lista vazia, 0, None) também são cacheados.
+    
+    Usage:
+        data = get_or_compute('featured_products', build_featured, 300, tags=[CATALOG_TAG])
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    cache_key = tagged_key(key, tags)
+    lock_key = f'{cache_key}:lock'
+    
+    def is_fresh(entry):
+        # -delta * beta * log(rand) cresce quanto mais caro o cálculo
+        early = -entry['delta'] * beta * math.log(random.random() or 1e-12)
+        return time.time() + early < entry['expires']
+    
+    entry = cache.get(cache_key)
+    if entry is not None and is_fresh(entry):
+        return entry['value']
+    
+    local_lock = _compute_lock(cache_key)
+    if not local_lock.acquire(blocking=entry is None, timeout=wait_timeout if entry is None else -1):
+        # Outra thread deste processo já está recalculando
+        if entry is not None:
+            return entry['value']
+    else:
+        try:
+            # Pode ter sido calculado enquanto esperávamos o lock
+            current = cache.get(cache_key)
+            if current is not None and (entry is None or current['expires'] > entry['expires']) \
+                    and time.time() < current['expires']:
+                return current['value']
+            
+            if not cache.add(lock_key, 1, lock_timeout):
+                if entry is not None:
+                    return entry['value']
+                # Outro processo calculando: aguarda o resultado
+                deadline = time.time() + wait_timeout
+                while time.time() < deadline:
+                    time.sleep(0.05)
+                    current = cache.get(cache_key)
+                    if current is not None:
+                        return current['value']
+                logger.warning(f"get_or_compute: timeout waiting for {key}, computing anyway")
+            
+            try:
+                started = time.time()
+                value = compute()
+                delta = time.time() - started
+                cache.set(cache_key, {
+                    'value': value,
+                    'delta': delta,
+                    'expires': time.time() + timeout,
+                }, timeout + stale_timeout)
+                return value
+            finally:
+                cache.delete(lock_key)
+        finally:
+            local_lock.release()
+    
+    # Lock local esgotou o tempo sem valor disponível
+    current = cache.get(cache_key)
+    return current['value'] if current is not None else compute()
 
 
 class CacheManager:
@@ -82,46 +348,50 @@ class CacheManager:
     def get_products_list(filters=None):
         """Cache para lista de produtos"""
         key = generate_cache_key('products_list', filters or {})
-        return cache.get(key)
+        return get_tagged(key, [CATALOG_TAG])
     
     @staticmethod
     def set_products_list(data, filters=None, timeout=TIMEOUT_MEDIUM):
         """Salva lista de produtos no cache"""
         key = generate_cache_key('products_list', filters or {})
-        cache.set(key, data, timeout)
+        set_tagged(key, data, [CATALOG_TAG], timeout)
     
     @staticmethod
     def get_product_detail(product_id):
         """Cache para detalhes de produto"""
         key = f'product_detail:{product_id}'
-        return cache.get(key)
+        return get_tagged(key, [product_tag(product_id)])
     
     @staticmethod
     def set_product_detail(product_id, data, timeout=TIMEOUT_LONG):
         """Salva detalhes de produto no cache"""
         key = f'product_detail:{product_id}'
-        cache.set(key, data, timeout)
+        set_tagged(key, data, [product_tag(product_id)], timeout)
     
     @staticmethod
     def invalidate_product(product_id):
-        """Invalida cache de um produto específico"""
-        cache.delete(f'product_detail:{product_id}')
-        invalidate_cache('products_list:*')
+        """Invalida cache de um produto específico e as listagens do catálogo"""
+        invalidate_tags(product_tag(product_id), CATALOG_TAG)
     
     @staticmethod
     def get_categories():
         """Cache para categorias"""
-        return cache.get('categories_list')
+        return get_tagged('categories_list', [CATEGORIES_TAG])
     
     @staticmethod
     def set_categories(data, timeout=TIMEOUT_VERY_LONG):
         """Salva categorias no cache"""
-        cache.set('categories_list', data, timeout)
+        set_tagged('categories_list', data, [CATEGORIES_TAG], timeout)
     
     @staticmethod
     def invalidate_categories():
         """Invalida cache de categorias"""
-        cache.delete('categories_list')
+        invalidate_tags(CATEGORIES_TAG)
+    
+    @staticmethod
+    def invalidate_category(category_id):
+        """Invalida uma categoria, a lista de categorias e as listagens do catálogo"""
+        invalidate_tags(category_tag(category_id), CATEGORIES_TAG, CATALOG_TAG)
     
     @staticmethod
     def get_cart(cart_id):
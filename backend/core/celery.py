@@ -1,4 +1,6 @@
+import logging
 import os
+import time
 from celery import Celery
 from celery.schedules import crontab
 
@@ -18,8 +20,58 @@ app.conf.beat_schedule = {
         'task': 'abandoned_cart.tasks.send_post_purchase_emails',
         'schedule': crontab(hour=10, minute=0),  # Diariamente às 10h
     },
+    'refresh-sales-stats-windows': {
+        'task': 'catalog.tasks.refresh_sales_stats_windows',
+        'schedule': crontab(hour=3, minute=0),  # Diariamente às 3h
+    },
+    'generate-recommendations': {
+        'task': 'recommendations.tasks.generate_recommendations_batch',
+        'schedule': crontab(hour=3, minute=30),  # Diariamente às 3h30
+    },
+    'train-similarity-model': {
+        'task': 'catalog.tasks.train_similarity_model',
+        'schedule': crontab(hour=4, minute=0),  # Diariamente às 4h
+    },
+    'flush-hot-carts': {
+        'task': 'cart.tasks.flush_hot_carts',
+        'schedule': crontab(),  # A cada minuto (no-op com CART_STORAGE = 'db')
+    },
+    'reap-expired-reservations': {
+        'task': 'cart.tasks.reap_expired_reservations',
+        'schedule': crontab(minute='*/5'),  # A cada 5 minutos
+    },
+    'process-webhook-events': {
+        'task': 'payments.tasks.process_webhook_events',
+        'schedule': crontab(),  # A cada minuto (rede de segurança do disparo pelo webhook)
+    },
 }
 
+logger = logging.getLogger(__name__)
+
+# Depois de uma falha ao falar com o broker, não tenta de novo por este tempo
+BROKER_RETRY_AFTER = 60
+_broker_down_until = 0.0
+
+
+def try_apply_async(task, args=(), **options):
+    """
+    Enfileira a tarefa sem nunca levantar exceção; retorna False se o broker
+    estiver fora (e por BROKER_RETRY_AFTER segundos após a falha, sem tentar
+    de novo: conectar num broker fora do ar leva segundos e não pode pesar em
+    cada requisição). Quem chama decide o plano B.
+    """
+    global _broker_down_until
+    if time.monotonic() < _broker_down_until:
+        return False
+    try:
+        task.apply_async(args, retry=False, **options)
+        return True
+    except Exception as e:
+        _broker_down_until = time.monotonic() + BROKER_RETRY_AFTER
+        logger.warning(f"Could not queue {task.name}: {e}")
+        return False
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -0,0 +1,216 @@
+"""
+Cliente HTTP de saída (Mercado Pago, Melhor Envio)
+
+Cada integração tem uma requests.Session por processo (keep-alive e pool de
+conexões) com política própria em settings.OUTBOUND_HTTP:
+
+- timeout (conexão, leitura) curto, para um parceiro lento não prender os
+  workers web;
+- retentativas com backoff exponencial e jitter ("full jitter") em erros de
+  conexão, timeout e status transitórios (429/5xx) — só em chamadas
+  idempotentes, a menos que o chamador peça retry=True;
+- circuit breaker: depois de failure_threshold falhas seguidas as chamadas
+  falham na hora com CircuitOpen durante reset_timeout segundos; então uma
+  chamada de teste decide se o circuito fecha de novo.
+
+Latência e contadores ficam em memória por processo (stats()).
+"""
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'timeout': (3.05, 10),
+    'retries': 2,
+    'backoff': 0.2,
+    'max_backoff': 2.0,
+    'retry_statuses': (429, 500, 502, 503, 504),
+    'failure_threshold': 5,
+    'reset_timeout': 30,
+    'pool_size': 10,
+    'slow_threshold': 2.0,
+}
+
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+
+class CircuitOpen(requests.RequestException):
+    """O circuito da integração está aberto: a chamada nem foi feita"""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            # Meio aberto: deixa passar uma chamada de teste
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+class OutboundClient:
+    def __init__(self, name, **config):
+        self.name = name
+        self.config = {**DEFAULTS, **config}
+        self.breaker = CircuitBreaker(self.config['failure_threshold'], self.config['reset_timeout'])
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=500)
+        self._counters = {'requests': 0, 'errors': 0, 'retries': 0, 'short_circuited': 0}
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.config['pool_size'],
+                        pool_maxsize=self.config['pool_size'],
+                        max_retries=0,
+                    )
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def _count(self, counter):
+        with self._stats_lock:
+            self._counters[counter] += 1
+
+    def _record(self, latency, error=False):
+        with self._stats_lock:
+            self._counters['requests'] += 1
+            self._counters['errors'] += error
+            self._latencies.append(latency)
+
+    def _sleep_before_retry(self, attempt):
+        self._count('retries')
+        cap = min(self.config['max_backoff'], self.config['backoff'] * (2 ** attempt))
+        time.sleep(random.uniform(0, cap))
+
+    def request(self, method, url, retry=None, **kwargs):
+        """
+        Igual a requests.request, com a política da integração.
+        Levanta CircuitOpen (subclasse de requests.RequestException) se o
+        circuito estiver aberto; devolve a última resposta mesmo com status
+        de erro.
+        """
+        method = method.upper()
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        kwargs.setdefault('timeout', self.config['timeout'])
+        attempts = 1 + (self.config['retries'] if retry else 0)
+
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            if not self.breaker.allow():
+                self._count('short_circuited')
+                raise CircuitOpen(f"{self.name}: circuit open")
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(time.monotonic() - started, error=True)
+                self.breaker.record_failure()
+                logger.warning(f"{self.name}: {method} {url} failed ({e.__class__.__name__}), attempt {attempt + 1}/{attempts}")
+                if last:
+                    raise
+                self._sleep_before_retry(attempt)
+                continue
+
+            elapsed = time.monotonic() - started
+            if elapsed >= self.config['slow_threshold']:
+                logger.warning(f"{self.name}: slow response {method} {url} {response.status_code} in {elapsed:.2f}s")
+            if response.status_code in self.config['retry_statuses']:
+                self._record(elapsed, error=True)
+                self.breaker.record_failure()
+                if last:
+                    return response
+                self._sleep_before_retry(attempt)
+                continue
+            self._record(elapsed)
+            self.breaker.record_success()
+            return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            counters = dict(self._counters)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000, 1)
+
+        return {
+            **counters,
+            'circuit': self.breaker.state,
+            'latency_ms': {'p50': percentile(0.5), 'p95': percentile(0.95), 'p99': percentile(0.99)},
+        }
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Cliente compartilhado (por processo) da integração `name`"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                config = getattr(settings, 'OUTBOUND_HTTP', {}).get(name, {})
+                client = _clients[name] = OutboundClient(name, **config)
+    return client
+
+
+def stats():
+    return {name: client.stats() for name, client in list(_clients.items())}
@@ -1,8 +1,7 @@
-from django.core.management.base import BaseCommand
-from django.core.files.storage import default_storage
-from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from catalog.models import ProductImage, Product
+from core.media_sync import MediaSync, get_s3_client, local_files
 import os
 import logging
 
@@ -13,77 +12,61 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('--dry-run', action='store_true', help='Only print actions, do not upload')
+        parser.add_argument('--workers', type=int, default=8, help='Parallel uploads')
+        parser.add_argument(
+            '--prefix', action='append', default=[],
+            help='Sync every file under MEDIA_ROOT/<prefix> instead of the files referenced in the database (repeatable)',
+        )
+        parser.add_argument('--size-only', action='store_true', help='Compare by size only (skip local MD5)')
+        parser.add_argument('--cache-control', default=None, help='Cache-Control for uploaded objects')
 
     def handle(self, *args, **options):
-        dry_run = options.get('dry_run', False)
+        dry_run = options['dry_run']
         media_root = str(getattr(settings, 'MEDIA_ROOT', 'media'))
         bucket = getattr(settings, 'AWS_STORAGE_BUCKET_NAME', '')
         domain = getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', '')
         self.stdout.write(self.style.NOTICE(f"MEDIA_ROOT: {media_root}"))
         self.stdout.write(self.style.NOTICE(f"Bucket: {bucket}"))
         self.stdout.write(self.style.NOTICE(f"Domain: {domain}"))
+        if not bucket:
+            raise CommandError("AWS_STORAGE_BUCKET_NAME is not configured")
 
         # Ensure media_root exists
         if not os.path.isdir(media_root):
             self.stdout.write(self.style.WARNING(f"MEDIA_ROOT not found: {media_root}"))
 
-        uploaded = 0
-        skipped = 0
-        missing_local = 0
-
-        # Sync product images
-        for img in ProductImage.objects.all():
-            name = getattr(img.image, 'name', '') or ''
-            if not name:
-                continue
-            local_path = os.path.join(media_root, name.replace('..', '').lstrip('/'))
-            exists_remote = False
-            try:
-                exists_remote = default_storage.exists(name)
-            except Exception:
-                # If the backend errors, try to upload anyway
-                exists_remote = False
-
-            if exists_remote:
-                skipped += 1
-                continue
-
-            if not os.path.isfile(local_path):
-                missing_local += 1
-                logger.warning(f"Local file not found for {name}: {local_path}")
-                continue
-
-            if dry_run:
+        prefixes = [p.strip('/') + '/' for p in options['prefix']]
+        if prefixes:
+            names = local_files(media_root, prefixes)
+        else:
+            names = [n for n in ProductImage.objects.values_list('image', flat=True) if n]
+            names += [n for n in Product.objects.exclude(catalog_pdf='').values_list('catalog_pdf', flat=True) if n]
+
+        extra_args = dict(getattr(settings, 'AWS_S3_OBJECT_PARAMETERS', {}))
+        if options['cache_control']:
+            extra_args['CacheControl'] = options['cache_control']
+
+        sync = MediaSync(
+            get_s3_client(options['workers']), bucket,
+            media_root=media_root,
+            workers=options['workers'],
+            size_only=options['size_only'],
+            extra_args=extra_args,
+        )
+
+        def progress(name, ok):
+            if ok is None:
                 self.stdout.write(f"Would upload: {name}")
-                uploaded += 1
-                continue
-
-            with open(local_path, 'rb') as f:
-                default_storage.save(name, File(f))
-                uploaded += 1
+            elif ok:
                 self.stdout.write(self.style.SUCCESS(f"Uploaded: {name}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"Failed: {name}"))
 
-        # Sync product PDFs
-        for p in Product.objects.exclude(catalog_pdf=''):
-            name = getattr(p.catalog_pdf, 'name', '') or ''
-            if not name:
-                continue
-            local_path = os.path.join(media_root, name.replace('..', '').lstrip('/'))
-            try:
-                exists_remote = default_storage.exists(name)
-            except Exception:
-                exists_remote = False
-
-            if exists_remote:
-                continue
-
-            if not os.path.isfile(local_path):
-                logger.warning(f"Local PDF not found for {name}: {local_path}")
-                continue
-
-            if not dry_run:
-                with open(local_path, 'rb') as f:
-                    default_storage.save(name, File(f))
-                    self.stdout.write(self.style.SUCCESS(f"Uploaded PDF: {name}"))
+        # Um único prefixo: lista só essa parte do bucket
+        result = sync.run(names, prefix=prefixes[0] if len(prefixes) == 1 else '', dry_run=dry_run, on_progress=progress)
 
-        self.stdout.write(self.style.SUCCESS(f"Sync complete. Uploaded: {uploaded}, Skipped (already remote): {skipped}, Missing local: {missing_local}"))
+        self.stdout.write(self.style.SUCCESS(
+            f"Sync complete. Uploaded: {result['uploaded']}, Skipped (already remote): {result['skipped']}, "
+            f"Missing local: {result['missing_local']}, Failed: {result['failed']}"
+            + (f", Would upload: {result['to_upload']}" if dry_run else '')
+        ))
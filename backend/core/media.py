@@ -0,0 +1,69 @@
+"""
+URLs públicas dos arquivos de mídia
+
+A base das URLs (domínio próprio do R2, endpoint + bucket, ou o próprio
+storage) depende só do settings: é calculada uma vez por processo e cada
+media_url(name) só concatena. Usado pelos serializers do catálogo, do
+carrinho e dos vale-presentes e pelos snapshots de imagem do carrinho.
+
+A base é recalculada quando o settings muda (override_settings nos testes).
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+SETTINGS = {'AWS_STORAGE_BUCKET_NAME', 'AWS_S3_CUSTOM_DOMAIN', 'AWS_S3_ENDPOINT_URL', 'MEDIA_URL', 'STORAGES'}
+
+
+def _compute_base():
+    """Prefixo das URLs ('https://.../'), ou None para usar default_storage.url"""
+    bucket = getattr(settings, 'AWS_STORAGE_BUCKET_NAME', '') or ''
+    domain = getattr(settings, 'AWS_S3_CUSTOM_DOMAIN', '') or ''
+    endpoint = getattr(settings, 'AWS_S3_ENDPOINT_URL', '') or ''
+
+    if domain:
+        base = domain.strip()
+        if not base.startswith('http'):  # add scheme if missing
+            base = f"https://{base}"
+        base = base.rstrip('/')
+        # If domain path already ends with /<bucket>, strip it (bucket-bound dev domain)
+        if bucket and base.endswith('/' + bucket):
+            base = base[:-(len(bucket) + 1)]
+        return f"{base}/"
+
+    # Fallback to endpoint + bucket
+    if endpoint:
+        base = endpoint.rstrip('/')
+        if bucket:
+            base = f"{base}/{bucket}"
+        return f"{base}/"
+
+    return None
+
+
+@lru_cache(maxsize=None)
+def media_base_url():
+    return _compute_base()
+
+
+@receiver(setting_changed)
+def _reset_media_base_url(setting, **kwargs):
+    if setting in SETTINGS:
+        media_base_url.cache_clear()
+
+
+def media_url(name):
+    """URL pública do arquivo `name` (relativo ao storage); None se não houver nome"""
+    if not name:
+        return None
+    base = media_base_url()
+    if base is not None:
+        return base + name.lstrip('/')
+    # Last resort: storage-generated URL
+    try:
+        return default_storage.url(name)
+    except Exception:
+        return None
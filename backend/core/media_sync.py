@@ -0,0 +1,219 @@
+"""
+Sincronização de MEDIA_ROOT com o bucket S3/R2
+
+Em vez de um HEAD por arquivo, o bucket é listado uma vez (list_objects_v2
+paginado) num manifesto {chave: (tamanho, ETag)}. Cada arquivo local é
+comparado com o manifesto:
+
+- não existe no bucket ou o tamanho é diferente -> envia;
+- mesmo tamanho -> compara o ETag com o MD5 local (ou o ETag de multipart,
+  calculado com o mesmo tamanho de parte usado no envio). Se o ETag remoto
+  veio de outro tamanho de parte não dá para comparar, e o tamanho basta.
+
+Os envios rodam num pool de threads limitado (workers), com multipart
+acima de MULTIPART_THRESHOLD. Os hashes locais ficam em STATE_FILE
+(tamanho + mtime -> ETag), então rodar de novo depois de uma interrupção
+só refaz o que falta, sem reler todos os arquivos.
+"""
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MULTIPART_THRESHOLD = 8 * 1024 * 1024
+MULTIPART_CHUNKSIZE = 8 * 1024 * 1024
+STATE_FILE = '.media_sync_state.json'
+
+
+def get_s3_client(workers=8):
+    """Cliente boto3 com as credenciais AWS_* do settings"""
+    import boto3
+    from botocore.config import Config
+
+    config = Config(
+        signature_version=getattr(settings, 'AWS_S3_SIGNATURE_VERSION', 's3v4'),
+        s3={'addressing_style': getattr(settings, 'AWS_S3_ADDRESSING_STYLE', 'virtual')},
+        max_pool_connections=workers * 2,
+        retries={'max_attempts': 5, 'mode': 'standard'},
+    )
+    return boto3.client(
+        's3',
+        endpoint_url=getattr(settings, 'AWS_S3_ENDPOINT_URL', '') or None,
+        aws_access_key_id=getattr(settings, 'AWS_ACCESS_KEY_ID', '') or None,
+        aws_secret_access_key=getattr(settings, 'AWS_SECRET_ACCESS_KEY', '') or None,
+        region_name=getattr(settings, 'AWS_S3_REGION_NAME', None),
+        config=config,
+    )
+
+
+def list_remote(client, bucket, prefix=''):
+    """Manifesto do bucket: {chave: (tamanho, etag)}"""
+    manifest = {}
+    paginator = client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            manifest[obj['Key']] = (obj['Size'], obj['ETag'].strip('"'))
+    return manifest
+
+
+def file_etags(path, chunksize=MULTIPART_CHUNKSIZE):
+    """(MD5, ETag de multipart com partes de `chunksize`) do arquivo, numa leitura só"""
+    whole = hashlib.md5()
+    parts = []
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunksize), b''):
+            whole.update(chunk)
+            parts.append(hashlib.md5(chunk).digest())
+    return whole.hexdigest(), f"{hashlib.md5(b''.join(parts)).hexdigest()}-{len(parts)}"
+
+
+def local_files(media_root, prefixes):
+    """Nomes (relativos a MEDIA_ROOT, com /) de todos os arquivos sob os prefixos"""
+    names = []
+    for prefix in prefixes:
+        base = os.path.join(media_root, prefix)
+        for dirpath, _, filenames in os.walk(base):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                rel = os.path.relpath(os.path.join(dirpath, filename), media_root)
+                names.append(rel.replace(os.sep, '/'))
+    return sorted(names)
+
+
+class MediaSync:
+    def __init__(self, client, bucket, media_root=None, workers=8, size_only=False, extra_args=None, state_path=None):
+        self.client = client
+        self.bucket = bucket
+        self.media_root = str(media_root or settings.MEDIA_ROOT)
+        self.workers = max(1, workers)
+        self.size_only = size_only
+        self.extra_args = extra_args if extra_args is not None else dict(getattr(settings, 'AWS_S3_OBJECT_PARAMETERS', {}))
+        self.state_path = state_path or os.path.join(self.media_root, STATE_FILE)
+        self.state = self._load_state()
+        self._state_lock = threading.Lock()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp = f"{self.state_path}.{os.getpid()}.tmp"
+        with self._state_lock:
+            data = json.dumps(self.state)
+        with open(tmp, 'w') as f:
+            f.write(data)
+        os.replace(tmp, self.state_path)
+
+    def local_etags(self, name, path, stat):
+        signature = [stat.st_size, stat.st_mtime_ns]
+        with self._state_lock:
+            cached = self.state.get(name)
+        if cached and cached[:2] == signature:
+            return cached[2:]
+        etags = list(file_etags(path))
+        with self._state_lock:
+            self.state[name] = signature + etags
+        return etags
+
+    def _path(self, name):
+        return os.path.join(self.media_root, name.replace('..', '').lstrip('/'))
+
+    def plan(self, names, manifest):
+        """Separa os nomes em (a enviar, já no bucket, sem arquivo local)"""
+        to_upload, skipped, missing = [], [], []
+        for name in dict.fromkeys(names):
+            path = self._path(name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                missing.append(name)
+                continue
+            remote = manifest.get(name)
+            if remote is None or remote[0] != stat.st_size:
+                to_upload.append((name, path, stat.st_size))
+            elif self.size_only or self._same_content(name, path, stat, remote[1]):
+                skipped.append(name)
+            else:
+                to_upload.append((name, path, stat.st_size))
+        return to_upload, skipped, missing
+
+    def _same_content(self, name, path, stat, remote_etag):
+        md5, multipart_etag = self.local_etags(name, path, stat)
+        if '-' not in remote_etag:
+            return remote_etag == md5
+        if remote_etag == multipart_etag:
+            return True
+        # Multipart enviado com outro tamanho de parte: não dá para comparar
+        return remote_etag.split('-')[1] != multipart_etag.split('-')[1]
+
+    def upload(self, name, path):
+        from boto3.s3.transfer import TransferConfig
+
+        transfer = TransferConfig(
+            multipart_threshold=MULTIPART_THRESHOLD,
+            multipart_chunksize=MULTIPART_CHUNKSIZE,
+            max_concurrency=4,
+        )
+        extra_args = dict(self.extra_args)
+        content_type = mimetypes.guess_type(name)[0]
+        if content_type:
+            extra_args.setdefault('ContentType', content_type)
+        self.client.upload_file(path, self.bucket, name, ExtraArgs=extra_args, Config=transfer)
+
+    def run(self, names, prefix='', dry_run=False, on_progress=None):
+        """
+        Sincroniza os nomes (relativos a MEDIA_ROOT). Retorna os contadores.
+        on_progress(nome, ok) é chamado a cada envio concluído.
+        """
+        manifest = list_remote(self.client, self.bucket, prefix)
+        to_upload, skipped, missing = self.plan(names, manifest)
+        result = {
+            'remote': len(manifest),
+            'to_upload': len(to_upload),
+            'uploaded': 0,
+            'skipped': len(skipped),
+            'missing_local': len(missing),
+            'failed': 0,
+            'bytes': 0,
+        }
+        for name in missing:
+            logger.warning(f"Local file not found for {name}")
+        if dry_run:
+            for name, _, _ in to_upload:
+                if on_progress:
+                    on_progress(name, None)
+            self.save_state()
+            return result
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self.upload, name, path): (name, size) for name, path, size in to_upload}
+                for future in as_completed(futures):
+                    name, size = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        logger.error(f"Upload failed for {name}: {e}")
+                        result['failed'] += 1
+                        ok = False
+                    else:
+                        result['uploaded'] += 1
+                        result['bytes'] += size
+                        ok = True
+                    if on_progress:
+                        on_progress(name, ok)
+        finally:
+            self.save_state()
+        return result
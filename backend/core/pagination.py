@@ -3,8 +3,18 @@ Sistema de paginação otimizado para o e-commerce
 Implementa paginação com cursor e performance melhorada
 """
 
-from rest_framework.pagination import PageNumberPagination, CursorPagination
+import base64
+import datetime
+import decimal
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination, CursorPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from collections import OrderedDict
 
 
@@ -65,6 +75,177 @@ class OptimizedCursorPagination(CursorPagination):
         ]))
 
 
+class KeysetPagination(BasePagination):
+    """
+    Paginação por chave (seek) com desempate por id
+    
+    O cursor guarda os valores das colunas de ordenação do último item da
+    página; a próxima página é buscada com WHERE (col, id) > (valor, id),
+    sem OFFSET, então o custo não cresce com a profundidade.
+    
+    Query params:
+    - cursor: token devolvido em next/previous (vazio na primeira página)
+    - page_size: itens por página
+    - count: exact (padrão), approx (contagem em cache) ou none
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    default_count_mode = 'exact'
+    approx_count_timeout = 300
+    invalid_cursor_message = 'Cursor inválido'
+    
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except (TypeError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+    
+    def get_ordering(self, queryset):
+        """Ordenação do queryset com id como desempate final"""
+        fields = [str(f) for f in (queryset.query.order_by or queryset.model._meta.ordering)]
+        ordering = []
+        for field in fields:
+            ordering.append(field)
+            if field.lstrip('-') in ('id', 'pk'):
+                # Colunas após o id nunca desempatam nada
+                return ordering
+        ordering.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+        return ordering
+    
+    # ---- cursor ----
+    
+    @staticmethod
+    def _encode_value(value):
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if isinstance(value, decimal.Decimal):
+            return str(value)
+        return value
+    
+    def encode_cursor(self, values, reverse=False):
+        payload = {'o': ','.join(self.ordering), 'v': [self._encode_value(v) for v in values]}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+    
+    def decode_cursor(self, request):
+        """Retorna (valores, reverse) ou None para a primeira página"""
+        token = request.query_params.get(self.cursor_query_param, '').strip()
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            payload = json.loads(raw.decode('utf-8'))
+            values = payload['v']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        # Cursor gerado para outra ordenação não vale para esta
+        if payload.get('o') != ','.join(self.ordering) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, bool(payload.get('r'))
+    
+    def _row_values(self, obj):
+        values = []
+        for field in self.ordering:
+            value = obj
+            for attr in field.lstrip('-').split('__'):
+                value = getattr(value, 'pk' if attr == 'pk' else attr)
+            values.append(value)
+        return values
+    
+    def _seek_filter(self, values, reverse):
+        # (a > x) OR (a = x AND b > y) OR ... com a direção de cada coluna
+        condition = None
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            clause = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for prev_field, prev_value in zip(self.ordering[:i], values[:i]):
+                clause &= Q(**{prev_field.lstrip('-'): prev_value})
+            condition = clause if condition is None else condition | clause
+        return condition
+    
+    # ---- paginação ----
+    
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        
+        qs = queryset.order_by(*self.ordering)
+        reverse = False
+        if cursor is not None:
+            values, reverse = cursor
+            qs = qs.filter(self._seek_filter(values, reverse))
+            if reverse:
+                qs = qs.reverse()
+        
+        # Um item a mais indica se há próxima página, sem COUNT
+        rows = list(qs[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+        
+        has_next = True if reverse else has_more
+        has_previous = has_more if reverse else cursor is not None
+        self.next_cursor = self.encode_cursor(self._row_values(rows[-1])) if rows and has_next else None
+        self.previous_cursor = (
+            self.encode_cursor(self._row_values(rows[0]), reverse=True) if rows and has_previous else None
+        )
+        self.count = self.get_count(queryset, request)
+        return rows
+    
+    def get_count(self, queryset, request):
+        mode = request.query_params.get(self.count_query_param, self.default_count_mode)
+        if mode == 'none':
+            return None
+        if mode == 'approx':
+            # Mesma consulta filtrada -> mesma contagem por alguns minutos
+            sql = str(queryset.order_by().query)
+            key = 'pagination:count:' + hashlib.md5(sql.encode('utf-8')).hexdigest()
+            count = cache.get(key)
+            if count is None:
+                count = queryset.order_by().count()
+                cache.set(key, count, self.approx_count_timeout)
+            return count
+        return queryset.order_by().count()
+    
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+    
+    def get_previous_link(self):
+        if not self.previous_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.previous_cursor)
+    
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.count),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class ProductKeysetPagination(KeysetPagination):
+    """
+    Paginação por cursor para o catálogo (scroll infinito)
+    """
+    page_size = 24
+    max_page_size = 48
+
+
 class ReviewPagination(PageNumberPagination):
     """
     Paginação para reviews
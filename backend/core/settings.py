@@ -70,6 +70,7 @@ INSTALLED_APPS = [
     'abandoned_cart',
     'giftcards',
     'wishlist',
+    'core',  # comandos de manutenção (sync_media_to_s3)
 ]
 
 MIDDLEWARE = [
@@ -130,6 +131,10 @@ else:
                 'check_same_thread': False,  # Permite múltiplas threads
             },
             'CONN_MAX_AGE': 0,
+            'TEST': {
+                # Arquivo (e não memória compartilhada) para que testes com threads usem o busy_timeout
+                'NAME': os.environ.get('SQLITE_TEST_PATH', str(BASE_DIR / 'test_db.sqlite3')),
+            },
         }
     }
 
@@ -331,6 +336,9 @@ if AWS_STORAGE_BUCKET_NAME:
 MERCADOPAGO_ACCESS_TOKEN = os.environ.get('MERCADOPAGO_ACCESS_TOKEN', '')
 MERCADOPAGO_PUBLIC_KEY = os.environ.get('MERCADOPAGO_PUBLIC_KEY', '')
 MERCADOPAGO_NOTIFICATION_URL = os.environ.get('MERCADOPAGO_NOTIFICATION_URL', 'http://localhost:8000/api/payments/webhook/')
+# Onde os webhooks do MP são processados (payments.webhooks): 'thread', 'celery' ou 'sync'.
+# 'thread' por padrão: o deploy roda só o gunicorn, sem worker nem beat do Celery.
+MERCADOPAGO_WEBHOOK_PROCESSING = os.environ.get('MERCADOPAGO_WEBHOOK_PROCESSING', 'thread')
 
 # Shipping configuration (Melhor Envio)
 SHIPPING_ORIGIN_ZIP = os.environ.get('SHIPPING_ORIGIN_ZIP', '01000-000')
@@ -346,6 +354,74 @@ MELHORENVIO_CLIENT_ID = os.environ.get('MELHORENVIO_CLIENT_ID', '')
 MELHORENVIO_CLIENT_SECRET = os.environ.get('MELHORENVIO_CLIENT_SECRET', '')
 MELHORENVIO_REDIRECT_URI = os.environ.get('MELHORENVIO_REDIRECT_URI', 'http://localhost:8000/api/shipping/oauth/callback/')
 
+# Cache de cotações (shipping.quotes): validade total e idade a partir da qual renova em segundo plano
+SHIPPING_QUOTE_CACHE_TTL = int(os.environ.get('SHIPPING_QUOTE_CACHE_TTL', str(6 * 3600)))
+SHIPPING_QUOTE_REFRESH_AFTER = int(os.environ.get('SHIPPING_QUOTE_REFRESH_AFTER', '3600'))
+# Usa a cotação de outro CEP com o mesmo prefixo de 5 dígitos enquanto o CEP exato não foi cotado
+SHIPPING_QUOTE_PREFIX_ESTIMATES = os.environ.get('SHIPPING_QUOTE_PREFIX_ESTIMATES', 'True') == 'True'
+# Onde a renovação roda: 'thread' (padrão, sem worker do Celery no deploy), 'celery' ou 'sync'
+SHIPPING_QUOTE_REFRESH = os.environ.get('SHIPPING_QUOTE_REFRESH', 'thread')
+
+# Outbound HTTP (core.http): timeout (conexão, leitura), retentativas e circuit breaker por integração
+OUTBOUND_HTTP = {
+    'mercadopago': {
+        'timeout': (3.05, float(os.environ.get('MERCADOPAGO_READ_TIMEOUT', '15'))),
+        'retries': 2,
+        'failure_threshold': 5,
+        'reset_timeout': 30,
+    },
+    'melhor_envio': {
+        'timeout': (3.05, float(os.environ.get('MELHORENVIO_READ_TIMEOUT', '5'))),
+        'retries': 1,
+        'failure_threshold': 3,
+        'reset_timeout': 60,
+    },
+}
+
+# Catalog search (catalog.search)
+# 'auto' = PostgreSQL tsvector/GIN, SQLite FTS5 ou LIKE conforme o banco em uso
+CATALOG_SEARCH_BACKEND = os.environ.get('CATALOG_SEARCH_BACKEND', 'auto')
+CATALOG_SEARCH_MAX_RESULTS = int(os.environ.get('CATALOG_SEARCH_MAX_RESULTS', '1000'))
+
+# Janelas de 7/30 dias de ProductSalesStats (catalog.sales): renovadas a partir das leituras de
+# bestsellers quando a estatística mais antiga passa de MAX_AGE; 'thread', 'celery' ou 'sync'
+SALES_WINDOWS_REFRESH = os.environ.get('SALES_WINDOWS_REFRESH', 'thread')
+SALES_WINDOWS_MAX_AGE = int(os.environ.get('SALES_WINDOWS_MAX_AGE', '3600'))
+SALES_WINDOWS_CHECK_INTERVAL = int(os.environ.get('SALES_WINDOWS_CHECK_INTERVAL', '300'))
+
+# PDFs de produto (catalog.pdf_builds): 'thread', 'celery' ou 'sync'; espera antes de gerar (agrupa alterações)
+# 'thread' por padrão: o deploy não roda worker do Celery
+CATALOG_PDF_BUILD = os.environ.get('CATALOG_PDF_BUILD', 'thread')
+CATALOG_PDF_DEBOUNCE = int(os.environ.get('CATALOG_PDF_DEBOUNCE', '10'))
+
+# Versões WebP/AVIF das imagens de produto (catalog.image_derivatives): 'thread', 'celery' ou 'sync'
+CATALOG_IMAGE_DERIVATIVES = os.environ.get('CATALOG_IMAGE_DERIVATIVES', 'thread')
+CATALOG_IMAGE_WIDTHS = [int(w) for w in os.environ.get('CATALOG_IMAGE_WIDTHS', '320,640,960,1280').split(',')]
+CATALOG_IMAGE_FORMATS = os.environ.get('CATALOG_IMAGE_FORMATS', 'avif,webp').split(',')
+# Processos do pool de geração (0 = núcleos da CPU), usado pelo comando build_image_derivatives,
+# Celery e 'sync'; o modo 'thread' gera cada upload numa thread só (workers=1)
+CATALOG_IMAGE_WORKERS = int(os.environ.get('CATALOG_IMAGE_WORKERS', '0'))
+
+# Modelo item-item de recomendações (catalog.similarity), gerado por train_similarity_model.
+# Sem beat do Celery no deploy, rode o comando por um cron da plataforma; o arquivo é
+# publicado no default_storage (NAME) e cada container baixa uma cópia local (PATH).
+RECOMMENDATIONS_MODEL_NAME = os.environ.get('RECOMMENDATIONS_MODEL_NAME', 'recommendations/item_similarity.bin')
+RECOMMENDATIONS_MODEL_PATH = os.environ.get('RECOMMENDATIONS_MODEL_PATH', str(BASE_DIR / 'var' / 'item_similarity.bin'))
+
+# Armazenamento do carrinho (cart.hot): 'db' grava direto nas tabelas;
+# 'cache' mantém os carrinhos ativos no cache e persiste em segundo plano
+CART_STORAGE = os.environ.get('CART_STORAGE', 'db')
+CART_CACHE_ALIAS = os.environ.get('CART_CACHE_ALIAS', 'default')
+CART_HOT_FLUSH_DELAY = int(os.environ.get('CART_HOT_FLUSH_DELAY', '60'))
+# Onde os carrinhos sujos são gravados: 'thread' (padrão, sem worker do Celery no deploy) ou 'celery'
+CART_HOT_FLUSH = os.environ.get('CART_HOT_FLUSH', 'thread')
+
+# Reaper de reservas de estoque vencidas (cart.reservations.reap_expired): lotes curtos com pausa entre eles
+RESERVATION_REAPER_BATCH_SIZE = int(os.environ.get('RESERVATION_REAPER_BATCH_SIZE', '500'))
+RESERVATION_REAPER_SLEEP = float(os.environ.get('RESERVATION_REAPER_SLEEP', '0.05'))
+# Lotes por chamada do endpoint cleanup-reservations (o reaper do Celery não tem limite)
+RESERVATION_REAPER_MAX_BATCHES = int(os.environ.get('RESERVATION_REAPER_MAX_BATCHES', '10'))
+
 # Security headers (adjusted by environment)
 SECURE_HSTS_SECONDS = int(os.environ.get('SECURE_HSTS_SECONDS', '0' if DEBUG else '31536000'))
 SECURE_SSL_REDIRECT = os.environ.get('SECURE_SSL_REDIRECT', 'False' if DEBUG else 'True') == 'True'
@@ -0,0 +1,107 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from .cache import (
+    CATALOG_TAG, CacheManager, _tag_key, get_or_compute, get_tagged, invalidate_cache, invalidate_tags,
+    product_tag, set_tagged, tagged_key,
+)
+
+
+class CacheTagTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_invalidating_a_tag_hides_only_its_keys(self):
+        set_tagged('detail:1', 'um', [product_tag(1)])
+        set_tagged('detail:2', 'dois', [product_tag(2)])
+        set_tagged('listing', ['um', 'dois'], [CATALOG_TAG, product_tag(1)])
+
+        invalidate_tags(product_tag(1))
+        self.assertIsNone(get_tagged('detail:1', [product_tag(1)]))
+        self.assertIsNone(get_tagged('listing', [CATALOG_TAG, product_tag(1)]))
+        self.assertEqual(get_tagged('detail:2', [product_tag(2)]), 'dois')
+
+        # A nova geração volta a aceitar gravações
+        set_tagged('detail:1', 'um v2', [product_tag(1)])
+        self.assertEqual(get_tagged('detail:1', [product_tag(1)]), 'um v2')
+
+    def test_evicted_tag_never_reuses_an_old_generation(self):
+        set_tagged('listing', 'antiga', [CATALOG_TAG])
+        cache.delete(_tag_key(CATALOG_TAG))
+        self.assertIsNone(get_tagged('listing', [CATALOG_TAG]))
+
+        set_tagged('listing', 'nova', [CATALOG_TAG])
+        cache.delete(_tag_key(CATALOG_TAG))
+        invalidate_tags(CATALOG_TAG)
+        self.assertIsNone(get_tagged('listing', [CATALOG_TAG]))
+
+    def test_invalidate_cache_pattern_does_not_clear_everything(self):
+        CacheManager.set_products_list(['p1'], {'page': 1})
+        cache.set('unrelated', 'kept')
+        set_tagged('products_list:legacy', 'x', ['products_list'])
+
+        invalidate_cache('products_list:*')
+        self.assertIsNone(get_tagged('products_list:legacy', ['products_list']))
+        self.assertEqual(cache.get('unrelated'), 'kept')
+
+        CacheManager.invalidate_product(1)
+        self.assertIsNone(CacheManager.get_products_list({'page': 1}))
+
+
+class GetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_concurrent_misses_compute_once(self):
+        calls = []
+        started = threading.Barrier(8)
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['featured']
+
+        results = []
+
+        def worker():
+            started.wait()
+            results.append(get_or_compute('featured', compute, 60, tags=[CATALOG_TAG]))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['featured']] * 8)
+
+    def test_expired_value_is_served_while_another_process_recomputes(self):
+        get_or_compute('bestsellers', lambda: 'old', 60)
+        key = tagged_key('bestsellers', None)
+        entry = cache.get(key)
+        entry['expires'] = time.time() - 1
+        cache.set(key, entry, 60)
+        # Outro processo segura o lock de recálculo
+        cache.add(f'{key}:lock', 1, 30)
+
+        compute = mock.Mock(return_value='new')
+        self.assertEqual(get_or_compute('bestsellers', compute, 60), 'old')
+        compute.assert_not_called()
+
+        cache.delete(f'{key}:lock')
+        self.assertEqual(get_or_compute('bestsellers', compute, 60), 'new')
+        compute.assert_called_once()
+
+    def test_falsy_values_are_cached_and_tags_invalidate(self):
+        compute = mock.Mock(return_value=[])
+        self.assertEqual(get_or_compute('empty', compute, 60, tags=[CATALOG_TAG]), [])
+        self.assertEqual(get_or_compute('empty', compute, 60, tags=[CATALOG_TAG]), [])
+        compute.assert_called_once()
+
+        invalidate_tags(CATALOG_TAG)
+        get_or_compute('empty', compute, 60, tags=[CATALOG_TAG])
+        self.assertEqual(compute.call_count, 2)
@@ -20,9 +20,13 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.http import JsonResponse, HttpResponse
 from django.contrib.sitemaps.views import sitemap
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
 from rest_framework_simplejwt.views import (
     TokenRefreshView,
 )
+from core.http import stats as outbound_http_stats
 from users.views import EmailOrUsernameTokenObtainPairView
 from .sitemaps import sitemaps
 
@@ -33,6 +37,12 @@ def root_health(_request):
         "version": "v1"
     })
 
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def outbound_health(_request):
+    """Latência, erros e estado do circuito das integrações externas (neste processo)"""
+    return Response(outbound_http_stats())
+
 def robots_txt(request):
     """Gera robots.txt dinamicamente"""
     lines = [
@@ -52,6 +62,7 @@ def robots_txt(request):
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', root_health, name='root'),
+    path('api/health/outbound/', outbound_health, name='outbound_health'),
     
     # SEO - Sitemap e Robots
     path('sitemap.xml', sitemap, {'sitemaps': sitemaps}, name='django.contrib.sitemaps.views.sitemap'),
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from core.media import media_url
 from .models import GiftCard, GiftCardDesign, GiftCardTransaction
 
 
@@ -10,9 +11,7 @@ class GiftCardDesignSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'description', 'image', 'occasion']
     
     def get_image(self, obj):
-        if obj.image:
-            return obj.image.url
-        return None
+        return media_url(obj.image.name) if obj.image else None
 
 
 class GiftCardSerializer(serializers.ModelSerializer):
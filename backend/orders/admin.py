@@ -97,7 +97,8 @@ class OrderAdmin(admin.ModelAdmin):
         return qs.select_related('user', 'shipping_address').prefetch_related('items')
     
     def mark_as_paid(self, request, queryset):
-        updated = queryset.update(status='paid')
+        from catalog.sales import set_orders_status
+        updated = set_orders_status(queryset, 'paid')
         self.message_user(request, f'{updated} pedido(s) marcado(s) como pago.')
     mark_as_paid.short_description = "Marcar como PAGO"
     
@@ -121,7 +122,8 @@ class OrderAdmin(admin.ModelAdmin):
     mark_as_delivered.short_description = "Marcar como ENTREGUE"
     
     def cancel_orders(self, request, queryset):
-        updated = queryset.update(status='canceled')
+        from catalog.sales import set_orders_status
+        updated = set_orders_status(queryset, 'canceled')
         self.message_user(request, f'{updated} pedido(s) cancelado(s).')
     cancel_orders.short_description = "Cancelar pedidos selecionados"
 
@@ -6,6 +6,7 @@ from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.utils import timezone
+from catalog.sales import set_orders_status
 from .models import Order
 
 
@@ -180,8 +181,10 @@ def bulk_update_order_status(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    updated = Order.objects.filter(id__in=order_ids).update(
-        status=new_status,
+    # Via catalog.sales: update() não dispara os sinais das estatísticas de vendas
+    updated = set_orders_status(
+        Order.objects.filter(id__in=order_ids),
+        new_status,
         updated_at=timezone.now()
     )
     
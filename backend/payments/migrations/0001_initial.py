@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=30)),
+                ('resource_id', models.CharField(max_length=64)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('status', models.CharField(choices=[('pending', 'Pendente'), ('processing', 'Processando'), ('done', 'Processado'), ('failed', 'Falhou')], default='pending', max_length=20)),
+                ('received_count', models.PositiveIntegerField(default=1)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('claim_token', models.CharField(blank=True, max_length=32)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Evento de Webhook',
+                'verbose_name_plural': 'Eventos de Webhook',
+                'indexes': [models.Index(fields=['status', 'updated_at'], name='payments_we_status_212d63_idx'), models.Index(fields=['claim_token'], name='payments_we_claim_t_600c12_idx')],
+                'constraints': [models.UniqueConstraint(fields=('topic', 'resource_id'), name='unique_webhook_event_resource')],
+            },
+        ),
+    ]
@@ -1,3 +1,44 @@
 from django.db import models
 
-# Create your models here.
+
+class WebhookEvent(models.Model):
+    """
+    Caixa de entrada das notificações do Mercado Pago
+
+    Uma linha por (topic, resource_id): notificações repetidas do mesmo
+    recurso só incrementam received_count e voltam o evento para 'pending'.
+    O processamento (payments.webhooks.process_pending) é feito pelos
+    workers, fora da requisição do webhook.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pendente'),
+        ('processing', 'Processando'),
+        ('done', 'Processado'),
+        ('failed', 'Falhou'),
+    ]
+
+    topic = models.CharField(max_length=30)
+    resource_id = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    received_count = models.PositiveIntegerField(default=1)
+    attempts = models.PositiveIntegerField(default=0)
+    claim_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Evento de Webhook'
+        verbose_name_plural = 'Eventos de Webhook'
+        constraints = [
+            models.UniqueConstraint(fields=['topic', 'resource_id'], name='unique_webhook_event_resource'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+            models.Index(fields=['claim_token']),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} {self.resource_id} ({self.status})"
@@ -0,0 +1,41 @@
+"""
+SDK do Mercado Pago sobre o cliente HTTP compartilhado (core.http)
+
+O HttpClient padrão do SDK abre uma sessão nova a cada chamada e usa
+timeout de 60s; este usa a sessão com pool da integração 'mercadopago',
+com os timeouts, retentativas e circuit breaker de settings.OUTBOUND_HTTP.
+O SDK manda X-Idempotency-Key em toda chamada, então repetir POST é seguro.
+"""
+import mercadopago
+from django.conf import settings
+from mercadopago.errors.exceptions import MPServerError
+from mercadopago.http.http_client import HttpClient
+
+from core.http import get_client
+
+_sdk = None
+
+
+class PooledHttpClient(HttpClient):
+    def request(self, method, url, maxretries=None, retry_on=None, backoff_factor=None, **kwargs):
+        # Timeout e retentativas vêm da política da integração, não das opções do SDK
+        kwargs.pop('timeout', None)
+        result = get_client('mercadopago').request(method, url, retry=True, **kwargs)
+        response = {'status': result.status_code, 'response': None}
+        if result.status_code != 204 and result.content:
+            try:
+                response['response'] = result.json()
+            except ValueError as exc:
+                raise MPServerError(
+                    result.status_code,
+                    {'message': 'Invalid JSON in response body', 'error': 'invalid_response'},
+                ) from exc
+        return response
+
+
+def get_sdk():
+    """SDK compartilhado (por processo)"""
+    global _sdk
+    if _sdk is None:
+        _sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN, http_client=PooledHttpClient())
+    return _sdk
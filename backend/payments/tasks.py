@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .webhooks import process_all
+
+
+@shared_task(ignore_result=True)
+def process_webhook_events(max_batches=10):
+    """Processa a caixa de entrada de webhooks do Mercado Pago em lotes"""
+    return process_all(max_batches)
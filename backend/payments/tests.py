@@ -0,0 +1,144 @@
+from unittest import mock
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from discounts.models import DiscountCode
+from orders.models import Order
+
+from .models import WebhookEvent
+from . import webhooks
+from .webhooks import MAX_ATTEMPTS, RETRY_DELAY, THREAD_DELAY, process_pending
+
+
+class StubResource:
+    def __init__(self, data, calls):
+        self.data = data
+        self.calls = calls
+
+    def get(self, resource_id):
+        self.calls.append(str(resource_id))
+        if str(resource_id) not in self.data:
+            return {'status': 404, 'response': {}}
+        return {'status': 200, 'response': self.data[str(resource_id)]}
+
+
+class StubSDK:
+    """Substitui mercadopago.SDK: respostas fixas e registro das chamadas"""
+
+    def __init__(self, payments=None, merchant_orders=None):
+        self.payments = payments or {}
+        self.merchant_orders = merchant_orders or {}
+        self.payment_calls = []
+        self.merchant_order_calls = []
+
+    def payment(self):
+        return StubResource(self.payments, self.payment_calls)
+
+    def merchant_order(self):
+        return StubResource(self.merchant_orders, self.merchant_order_calls)
+
+
+class WebhookInboxTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.order = Order.objects.create(external_reference='ref-1', coupon_code='PROMO')
+        self.coupon = DiscountCode.objects.create(code='PROMO', percent_off=10)
+
+    def notify(self, payment_id, topic='payment', execute=False):
+        with self.captureOnCommitCallbacks(execute=execute):
+            return self.client.post(
+                f'/api/payments/webhook/?type={topic}', {'data': {'id': payment_id}}, format='json'
+            )
+
+    def test_retries_are_deduplicated_and_acknowledged_without_calling_mp(self):
+        sdk = StubSDK()
+        for _ in range(3):
+            response = self.notify('123')
+            self.assertEqual(response.status_code, 200)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.topic, event.resource_id, event.status), ('payment', '123', 'pending'))
+        self.assertEqual(event.received_count, 3)
+        self.assertEqual(sdk.payment_calls, [])
+
+    def test_batch_fetches_each_payment_once_and_reconciles_idempotently(self):
+        sdk = StubSDK(
+            payments={'123': {'id': 123, 'status': 'approved', 'external_reference': 'ref-1'}},
+            merchant_orders={'900': {'external_reference': 'ref-1', 'payments': [{'id': 123, 'status': 'approved'}]}},
+        )
+        self.notify('123')
+        self.notify('900', topic='merchant_order')
+
+        self.assertEqual(process_pending(sdk=sdk), 2)
+        self.assertEqual(sdk.payment_calls, ['123'])
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.mp_status, self.order.mp_payment_id), ('paid', 'approved', '123'))
+        self.assertEqual(set(WebhookEvent.objects.values_list('status', flat=True)), {'done'})
+
+        # Reenvio depois de processado: consulta de novo, mas não grava nem conta o cupom outra vez
+        self.notify('123')
+        self.assertEqual(process_pending(sdk=sdk), 1)
+        self.coupon.refresh_from_db()
+        self.assertEqual(self.coupon.times_used, 1)
+
+    def test_failed_lookups_are_retried_then_given_up(self):
+        sdk = StubSDK()
+        self.notify('404')
+        for _ in range(MAX_ATTEMPTS):
+            self.assertEqual(process_pending(sdk=sdk), 1)
+        event = WebhookEvent.objects.get()
+        self.assertEqual(event.status, 'failed')
+        self.assertIn('404', event.last_error)
+        self.assertEqual(process_pending(sdk=sdk), 0)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_redelivery_keeps_attempts_until_done(self):
+        sdk = StubSDK()
+        self.notify('404')
+        for _ in range(MAX_ATTEMPTS - 1):
+            process_pending(sdk=sdk)
+            self.notify('404')  # o MP reenvia a notificação que falhou
+        process_pending(sdk=sdk)
+        event = WebhookEvent.objects.get()
+        self.assertEqual((event.status, event.attempts), ('failed', MAX_ATTEMPTS))
+
+        # Evento já processado volta do zero
+        WebhookEvent.objects.update(status='done')
+        self.notify('404')
+        self.assertEqual(WebhookEvent.objects.get().attempts, 0)
+
+    @override_settings(MERCADOPAGO_WEBHOOK_PROCESSING='sync')
+    def test_sync_mode_reconciles_after_commit(self):
+        sdk = StubSDK(payments={'123': {'id': 123, 'status': 'approved', 'external_reference': 'ref-1'}})
+        with mock.patch.object(webhooks, 'get_sdk', return_value=sdk):
+            self.notify('123', execute=True)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'paid')
+
+    @override_settings(MERCADOPAGO_WEBHOOK_PROCESSING='celery')
+    def test_celery_mode_falls_back_to_thread_without_broker(self):
+        with mock.patch.object(webhooks, 'try_apply_async', return_value=False), \
+                mock.patch.object(webhooks, '_start_timer') as start_timer:
+            self.notify('123', execute=True)
+        start_timer.assert_called_once()
+        with mock.patch.object(webhooks, 'try_apply_async', return_value=True), \
+                mock.patch.object(webhooks, '_start_timer') as start_timer:
+            self.notify('124', execute=True)
+        start_timer.assert_not_called()
+
+    def test_thread_timer_rearms_with_backoff_until_given_up(self):
+        self.notify('404')
+        delays = []
+        with mock.patch.object(webhooks, 'get_sdk', return_value=StubSDK()), \
+                mock.patch.object(webhooks, 'connection'), \
+                mock.patch.object(webhooks, '_start_timer', side_effect=delays.append):
+            for _ in range(MAX_ATTEMPTS):
+                webhooks._run_timer()
+        # Uma espera a menos que as tentativas: a última marca o evento como 'failed'
+        self.assertEqual(delays, [RETRY_DELAY * 2 ** n for n in range(MAX_ATTEMPTS - 1)])
+        self.assertEqual(WebhookEvent.objects.get().status, 'failed')
+
+        # Notificação nova na fila: volta para a espera curta
+        self.notify('123')
+        self.assertEqual(webhooks._retry_delay(), THREAD_DELAY)
@@ -1,4 +1,3 @@
-import mercadopago
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
@@ -7,10 +6,11 @@ from django.conf import settings
 import uuid
 import time
 from orders.models import Order, OrderItem
-from discounts.models import DiscountCode
+from .sdk import get_sdk
+from .webhooks import TOPICS as WEBHOOK_TOPICS, enqueue, parse_notification, schedule_processing
 
-# Configurar SDK do Mercado Pago com credenciais reais
-sdk = mercadopago.SDK(settings.MERCADOPAGO_ACCESS_TOKEN)
+# SDK do Mercado Pago com credenciais reais (sessão com pool, ver payments.sdk)
+sdk = get_sdk()
 
 @api_view(['GET'])
 @permission_classes([IsAdminUser])
@@ -703,62 +703,23 @@ def create_pix_payment(request):
 def webhook(request):
     """
     Webhook para receber notificações do Mercado Pago
+    
+    Só enfileira o pagamento (payments.webhooks); a consulta ao MP e a
+    reconciliação do pedido ficam com os workers.
     """
     try:
-        # Tentar obter o ID do pagamento da notificação
-        payload = request.data or {}
-        payment_id = None
-        if isinstance(payload, dict):
-            payment_id = (
-                (payload.get('data') or {}).get('id') or
-                payload.get('id') or
-                request.query_params.get('id')
-            )
+        payload = request.data if isinstance(request.data, dict) else {}
+        payment_id = (
+            (payload.get('data') or {}).get('id') or
+            payload.get('id') or
+            request.query_params.get('id')
+        )
 
         if not payment_id:
             return Response({'status': 'ignored', 'reason': 'no payment id'}, status=status.HTTP_200_OK)
 
-        # Buscar detalhes do pagamento no MP
-        try:
-            pay_resp = sdk.payment().get(payment_id)
-        except Exception as e:
-            return Response({'status': 'error', 'detail': str(e)}, status=status.HTTP_200_OK)
-
-        if not isinstance(pay_resp, dict) or pay_resp.get('status') not in (200, 201):
-            return Response({'status': 'ignored', 'reason': 'mp api status'}, status=status.HTTP_200_OK)
-
-        pay_data = pay_resp.get('response') or {}
-        mp_status = (pay_data.get('status') or '').lower()
-        external_reference = pay_data.get('external_reference')
-
-        if not external_reference:
-            return Response({'status': 'ignored', 'reason': 'no external_reference'}, status=status.HTTP_200_OK)
-
-        # Reconciliar com pedido local
-        try:
-            order = Order.objects.get(external_reference=external_reference)
-        except Order.DoesNotExist:
-            return Response({'status': 'ignored', 'reason': 'order not found'}, status=status.HTTP_200_OK)
-
-        order.mp_payment_id = str(payment_id)
-        order.mp_status = mp_status
-        if mp_status == 'approved':
-            order.status = 'paid'
-            # increment discount usage
-            try:
-                if order.coupon_code:
-                    d = DiscountCode.objects.filter(code__iexact=order.coupon_code).first()
-                    if d:
-                        d.times_used = (d.times_used or 0) + 1
-                        d.save(update_fields=["times_used"])
-            except Exception:
-                pass
-        elif mp_status in ('rejected', 'cancelled', 'charged_back'):  # ajustar conforme necessidade
-            order.status = 'failed'
-        elif mp_status in ('in_process', 'in_mediation', 'pending'):
-            order.status = 'pending'
-        order.save()
-
+        enqueue('payment', payment_id, _notification_payload(request))
+        schedule_processing()
         return Response({'status': 'ok'})
         
     except Exception as e:
@@ -767,147 +728,40 @@ def webhook(request):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def _notification_payload(request):
+    data = request.data.dict() if hasattr(request.data, 'dict') else request.data
+    return {
+        'body': data if isinstance(data, dict) else {},
+        'query': request.query_params.dict(),
+    }
+
 @api_view(['GET', 'POST'])
 @permission_classes([AllowAny])
 def mercadopago_webhook(request):
     """
     Webhook do Mercado Pago para notificações de pagamento
+    
+    Grava a notificação na caixa de entrada (deduplicada por topic + id) e
+    responde na hora; o processamento é feito por
+    payments.tasks.process_webhook_events.
     """
+    import logging
+    logger = logging.getLogger(__name__)
     try:
-        import logging
-        logger = logging.getLogger(__name__)
-        
         # Log da notificação recebida
         logger.info(f"Webhook MP recebido: body={request.data} query={getattr(request, 'query_params', {})}")
         
-        # Extrair dados da notificação (POST e/ou GET)
-        topic = (
-            request.data.get('topic') or
-            request.data.get('type') or
-            request.query_params.get('topic') or
-            request.query_params.get('type')
-        )
-        resource_id = (
-            (request.data.get('data', {}) or {}).get('id') or
-            request.data.get('id') or
-            request.query_params.get('id')
-        )
-        resource_url = request.data.get('resource') or request.query_params.get('resource')
-
-        # Fallback: quando vem apenas 'resource' (IPN antigo), tentar extrair topic e id
-        if (not topic or not resource_id) and resource_url:
-            try:
-                if 'payments' in resource_url:
-                    topic = topic or 'payment'
-                    resource_id = resource_id or resource_url.rstrip('/').split('/')[-1]
-                elif 'merchant_orders' in resource_url or 'merchant_order' in resource_url:
-                    topic = topic or 'merchant_order'
-                    resource_id = resource_id or resource_url.rstrip('/').split('/')[-1]
-            except Exception:
-                pass
-        
+        topic, resource_id = parse_notification(request.data, request.query_params)
         if not topic or not resource_id:
             logger.warning(f"Webhook inválido: topic={topic}, id={resource_id}")
             return Response({'status': 'ok'}, status=status.HTTP_200_OK)
+        if topic not in WEBHOOK_TOPICS:
+            return Response({'status': 'ok'}, status=status.HTTP_200_OK)
         
-        # Processar notificações de pagamento
-        if topic == 'payment':
-            # Buscar informações do pagamento no Mercado Pago
-            try:
-                payment_info = sdk.payment().get(resource_id)
-                payment = payment_info.get('response', {})
-                
-                # Extrair informações
-                payment_status = payment.get('status')
-                external_reference = payment.get('external_reference')
-                payment_id = payment.get('id')
-                
-                logger.info(f"Pagamento {payment_id}: status={payment_status}, ref={external_reference}")
-                
-                # Atualizar pedido
-                if external_reference:
-                    try:
-                        order = Order.objects.get(external_reference=external_reference)
-                        order.mp_payment_id = str(payment_id)
-                        order.mp_status = (payment_status or '').lower()
-                        mp_status3 = (payment_status or '').lower()
-                        if mp_status3 == 'approved':
-                            order.status = 'paid'
-                        elif mp_status3 in ('rejected', 'cancelled', 'charged_back'):
-                            order.status = 'failed'
-                        elif mp_status3 in ('in_process', 'in_mediation', 'pending'):
-                            order.status = 'pending'
-                        else:
-                            order.status = 'pending'
-                        order.save(update_fields=['mp_payment_id', 'mp_status', 'status'])
-                        logger.info(f"Pedido {order.id} atualizado: {payment_status}")
-                    except Order.DoesNotExist:
-                        logger.error(f"Pedido não encontrado: {external_reference}")
-                        
-            except Exception as e:
-                logger.error(f"Erro ao processar pagamento {resource_id}: {str(e)}")
-        elif topic == 'merchant_order':
-            # Alguns envios do MP usam merchant_order; buscar e extrair payment(s)
-            try:
-                mo_info = sdk.merchant_order().get(resource_id)
-                merchant_order = mo_info.get('response', {})
-                external_reference = merchant_order.get('external_reference')
-                payments = merchant_order.get('payments') or []
-
-                # Tentar achar um pagamento aprovado, senão usar o primeiro
-                payment_id = None
-                for p in payments:
-                    if (p.get('status') or '').lower() == 'approved':
-                        payment_id = p.get('id')
-                        break
-                if not payment_id and payments:
-                    payment_id = payments[0].get('id')
-
-                logger.info(f"MerchantOrder {resource_id}: ref={external_reference}, payment_id={payment_id}")
-
-                # Se temos payment_id, reusar fluxo de payment para obter status e ref definitivos
-                if payment_id:
-                    try:
-                        payment_info = sdk.payment().get(payment_id)
-                        payment = payment_info.get('response', {})
-                        payment_status = payment.get('status')
-                        external_reference = payment.get('external_reference') or external_reference
-
-                        if external_reference:
-                            try:
-                                order = Order.objects.get(external_reference=external_reference)
-                                order.mp_payment_id = str(payment_id)
-                                order.mp_status = (payment_status or '').lower()
-                                mp_status4 = (payment_status or '').lower()
-                                if mp_status4 == 'approved':
-                                    order.status = 'paid'
-                                elif mp_status4 in ('rejected', 'cancelled', 'charged_back'):
-                                    order.status = 'failed'
-                                elif mp_status4 in ('in_process', 'in_mediation', 'pending'):
-                                    order.status = 'pending'
-                                else:
-                                    order.status = 'pending'
-                                order.save(update_fields=['mp_payment_id', 'mp_status', 'status'])
-                                logger.info(f"Pedido {order.id} atualizado via merchant_order: {payment_status}")
-                            except Order.DoesNotExist:
-                                logger.error(f"Pedido não encontrado (merchant_order): {external_reference}")
-                    except Exception as e:
-                        logger.error(f"Erro ao buscar pagamento {payment_id} via merchant_order: {str(e)}")
-                elif external_reference:
-                    # Sem payment_id: ainda tentar marcar pelo external_reference com status pending
-                    try:
-                        order = Order.objects.get(external_reference=external_reference)
-                        order.mp_status = 'pending'
-                        order.save(update_fields=['mp_status'])
-                    except Order.DoesNotExist:
-                        logger.error(f"Pedido não encontrado (merchant_order sem payment): {external_reference}")
-            except Exception as e:
-                logger.error(f"Erro ao processar merchant_order {resource_id}: {str(e)}")
-        
+        enqueue(topic, resource_id, _notification_payload(request))
+        schedule_processing()
         return Response({'status': 'ok'}, status=status.HTTP_200_OK)
         
     except Exception as e:
-        import logging
-        logger = logging.getLogger(__name__)
         logger.error(f"Erro no webhook: {str(e)}")
         return Response({'status': 'error'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -0,0 +1,343 @@
+"""
+Processamento das notificações do Mercado Pago
+
+O webhook só grava o evento na caixa de entrada (WebhookEvent, único por
+topic + resource_id) e responde 200 na hora; o Mercado Pago reenvia a
+mesma notificação várias vezes e cada reenvio apenas volta o evento para
+'pending'. O processamento pega lotes de eventos pendentes, consulta cada
+pagamento no MP uma única vez por lote e reconcilia os pedidos com uma
+consulta só.
+
+Onde o lote roda (MERCADOPAGO_WEBHOOK_PROCESSING):
+- 'thread' (padrão; o deploy só tem o gunicorn): timer curto em segundo
+  plano no próprio processo, depois do commit; se sobrar evento pendente
+  (MP fora do ar), o timer se rearma com backoff exponencial até o evento
+  chegar a MAX_ATTEMPTS e virar 'failed';
+- 'celery': tarefa payments.tasks.process_webhook_events (com o beat
+  varrendo a fila); se o broker não estiver disponível, cai no modo 'thread';
+- 'sync': processa na hora, depois do commit (testes/scripts).
+
+Reconciliar é idempotente: pedidos sem mudança não são gravados e o uso do
+cupom só é contado na transição para 'paid'.
+"""
+import logging
+import threading
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, Min, PositiveIntegerField, Q, When
+from django.utils import timezone
+
+from core.celery import try_apply_async
+from discounts.models import DiscountCode
+from orders.models import Order
+
+from .models import WebhookEvent
+from .sdk import get_sdk
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ('payment', 'merchant_order')
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 5
+# Eventos presos em 'processing' (worker morreu) voltam para a fila depois disso
+PROCESSING_TIMEOUT = timedelta(minutes=10)
+# Espera do modo 'thread': agrupa as notificações que chegam juntas num lote
+THREAD_DELAY = 1.0
+# Backoff do modo 'thread' para eventos que falharam: RETRY_DELAY * 2 ** (tentativas - 1)
+RETRY_DELAY = 5.0
+
+_timer_lock = threading.Lock()
+_timer = None
+
+
+class MercadoPagoError(Exception):
+    pass
+
+
+def parse_notification(data, query_params):
+    """Extrai (topic, resource_id) de uma notificação (webhook novo ou IPN antigo)"""
+    data = data if hasattr(data, 'get') else {}
+    body_data = data.get('data') if isinstance(data.get('data'), dict) else {}
+    topic = (
+        data.get('topic') or
+        data.get('type') or
+        query_params.get('topic') or
+        query_params.get('type')
+    )
+    resource_id = (
+        body_data.get('id') or
+        data.get('id') or
+        query_params.get('id') or
+        query_params.get('data.id')
+    )
+    resource_url = data.get('resource') or query_params.get('resource')
+
+    # Fallback: quando vem apenas 'resource' (IPN antigo), extrair topic e id da URL
+    if (not topic or not resource_id) and isinstance(resource_url, str):
+        if 'payments' in resource_url:
+            topic = topic or 'payment'
+        elif 'merchant_order' in resource_url:
+            topic = topic or 'merchant_order'
+        if topic:
+            resource_id = resource_id or resource_url.rstrip('/').split('/')[-1]
+
+    return topic, str(resource_id) if resource_id else None
+
+
+def enqueue(topic, resource_id, payload=None):
+    """
+    Grava (ou reativa) o evento. Retorna True se o evento é novo.
+    Reenvios do mesmo recurso só incrementam received_count; as tentativas
+    só zeram se o evento já tinha sido processado (senão um evento que
+    sempre falha nunca chegaria a MAX_ATTEMPTS com os reenvios do MP).
+    """
+    lookup = {'topic': topic, 'resource_id': str(resource_id)[:64]}
+    changes = {
+        'status': 'pending',
+        'attempts': Case(When(status='done', then=0), default=F('attempts'), output_field=PositiveIntegerField()),
+        'received_count': F('received_count') + 1,
+        'payload': payload or {},
+        'updated_at': timezone.now(),
+    }
+    if WebhookEvent.objects.filter(**lookup).update(**changes):
+        return False
+    try:
+        with transaction.atomic():
+            WebhookEvent.objects.create(payload=payload or {}, **lookup)
+        return True
+    except IntegrityError:
+        # Outra requisição criou o evento ao mesmo tempo
+        WebhookEvent.objects.filter(**lookup).update(**changes)
+        return False
+
+
+def schedule_processing():
+    """Dispara o processamento da caixa de entrada depois do commit"""
+    transaction.on_commit(_dispatch)
+
+
+def _dispatch():
+    mode = getattr(settings, 'MERCADOPAGO_WEBHOOK_PROCESSING', 'thread')
+    if mode == 'sync':
+        process_all()
+        return
+    if mode == 'celery':
+        from .tasks import process_webhook_events
+        if try_apply_async(process_webhook_events):
+            return
+    _start_timer()
+
+
+def _start_timer(delay=THREAD_DELAY):
+    global _timer
+    with _timer_lock:
+        if _timer is None:
+            _timer = threading.Timer(delay, _run_timer)
+            _timer.daemon = True
+            _timer.start()
+
+
+def _retry_delay():
+    """
+    Espera até o próximo lote, ou None se a fila esvaziou. Eventos que já
+    falharam esperam em backoff; os que passam de MAX_ATTEMPTS viram
+    'failed' e deixam de rearmar o timer.
+    """
+    attempts = WebhookEvent.objects.filter(status='pending').aggregate(Min('attempts'))['attempts__min']
+    if attempts is None:
+        return None
+    if attempts == 0:
+        return THREAD_DELAY
+    return RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def _run_timer():
+    global _timer
+    with _timer_lock:
+        _timer = None
+    try:
+        process_all()
+        delay = _retry_delay()
+        if delay is not None:
+            _start_timer(delay)
+    except Exception as e:
+        logger.error(f"Erro ao processar webhooks em segundo plano: {e}", exc_info=True)
+    finally:
+        connection.close()
+
+
+def process_all(max_batches=10, batch_size=BATCH_SIZE):
+    """Processa lotes até a fila esvaziar (ou max_batches). Retorna quantos eventos foram pegos."""
+    total = 0
+    for _ in range(max_batches):
+        claimed = process_pending(batch_size)
+        total += claimed
+        if claimed < batch_size:
+            break
+    return total
+
+
+def _claim(batch_size):
+    now = timezone.now()
+    ready = Q(status='pending') | Q(status='processing', updated_at__lt=now - PROCESSING_TIMEOUT)
+    ids = list(
+        WebhookEvent.objects.filter(ready).order_by('updated_at').values_list('id', flat=True)[:batch_size]
+    )
+    if not ids:
+        return None, []
+    token = uuid.uuid4().hex
+    WebhookEvent.objects.filter(ready, pk__in=ids).update(
+        status='processing', claim_token=token, attempts=F('attempts') + 1, updated_at=now
+    )
+    return token, list(WebhookEvent.objects.filter(claim_token=token, status='processing'))
+
+
+def _fetch(resource, resource_id):
+    try:
+        response = resource.get(resource_id)
+    except Exception as e:
+        raise MercadoPagoError(str(e)) from e
+    if not isinstance(response, dict) or response.get('status') not in (200, 201):
+        status = response.get('status') if isinstance(response, dict) else None
+        raise MercadoPagoError(f"MP API status {status}")
+    return response.get('response') or {}
+
+
+def _merchant_order_payment(merchant_order):
+    """Pagamento aprovado da merchant order ou, se não houver, o primeiro"""
+    payments = merchant_order.get('payments') or []
+    for payment in payments:
+        if (payment.get('status') or '').lower() == 'approved':
+            return payment.get('id')
+    return payments[0].get('id') if payments else None
+
+
+def order_status(mp_status):
+    if mp_status == 'approved':
+        return 'paid'
+    if mp_status in ('rejected', 'cancelled', 'charged_back'):
+        return 'failed'
+    return 'pending'
+
+
+def reconcile_orders(payments, pending_refs=()):
+    """
+    payments: {external_reference: (payment_id, status no MP)}.
+    pending_refs: referências de merchant orders ainda sem pagamento.
+    Carrega os pedidos de uma vez e grava só os que mudaram.
+    Retorna o número de pedidos alterados.
+    """
+    refs = set(payments) | set(pending_refs)
+    if not refs:
+        return 0
+    updated = 0
+    for order in Order.objects.filter(external_reference__in=refs):
+        ref = order.external_reference
+        if ref not in payments:
+            if order.mp_status != 'pending':
+                order.mp_status = 'pending'
+                order.save(update_fields=['mp_status'])
+                updated += 1
+            continue
+        payment_id, mp_status = payments[ref]
+        new_status = order_status(mp_status)
+        if (order.mp_payment_id, order.mp_status, order.status) == (payment_id, mp_status, new_status):
+            continue
+        with transaction.atomic():
+            # Trava a linha e relê o status: o cupom só conta uma vez mesmo com workers concorrentes
+            Order.objects.filter(pk=order.pk).update(updated_at=timezone.now())
+            previous = Order.objects.filter(pk=order.pk).values_list('status', flat=True).get()
+            order.mp_payment_id = payment_id
+            order.mp_status = mp_status
+            order.status = new_status
+            order.save(update_fields=['mp_payment_id', 'mp_status', 'status'])
+            if new_status == 'paid' and previous != 'paid' and order.coupon_code:
+                DiscountCode.objects.filter(code__iexact=order.coupon_code).update(
+                    times_used=F('times_used') + 1
+                )
+        updated += 1
+        logger.info(f"Pedido {order.id} atualizado: {mp_status}")
+    return updated
+
+
+def process_pending(batch_size=BATCH_SIZE, sdk=None):
+    """
+    Processa um lote de eventos pendentes. Eventos repetidos no lote (e
+    merchant orders que apontam para o mesmo pagamento) geram uma única
+    consulta ao MP. Retorna quantos eventos foram pegos.
+    """
+    token, events = _claim(batch_size)
+    if not events:
+        return 0
+    sdk = sdk or get_sdk()
+
+    errors = {}
+    event_payment = {}
+    fallback_ref = {}
+    pending_refs = set()
+    for event in events:
+        if event.topic == 'payment':
+            event_payment[event.pk] = event.resource_id
+        elif event.topic == 'merchant_order':
+            try:
+                merchant_order = _fetch(sdk.merchant_order(), event.resource_id)
+            except MercadoPagoError as e:
+                errors[event.pk] = str(e)
+                continue
+            payment_id = _merchant_order_payment(merchant_order)
+            if payment_id:
+                event_payment[event.pk] = str(payment_id)
+                fallback_ref[str(payment_id)] = merchant_order.get('external_reference')
+            elif merchant_order.get('external_reference'):
+                pending_refs.add(merchant_order['external_reference'])
+
+    fetched = {}
+    for payment_id in set(event_payment.values()):
+        try:
+            fetched[payment_id] = _fetch(sdk.payment(), payment_id)
+        except MercadoPagoError as e:
+            fetched[payment_id] = e
+    for event_pk, payment_id in event_payment.items():
+        if isinstance(fetched[payment_id], MercadoPagoError):
+            errors[event_pk] = str(fetched[payment_id])
+
+    # Um pagamento por pedido: o aprovado, senão o mais recente
+    by_ref = {}
+    for payment_id, payment in fetched.items():
+        if isinstance(payment, MercadoPagoError):
+            continue
+        ref = payment.get('external_reference') or fallback_ref.get(payment_id)
+        if not ref:
+            continue
+        mp_status = (payment.get('status') or '').lower()
+        rank = (mp_status == 'approved', int(payment_id) if payment_id.isdigit() else 0)
+        if ref not in by_ref or rank > by_ref[ref][0]:
+            by_ref[ref] = (rank, str(payment.get('id') or payment_id), mp_status)
+    reconcile_orders(
+        {ref: (payment_id, mp_status) for ref, (_, payment_id, mp_status) in by_ref.items()},
+        pending_refs - set(by_ref),
+    )
+
+    now = timezone.now()
+    done = [event for event in events if event.pk not in errors]
+    if done:
+        # received_count diferente = nova notificação chegou durante o processamento: fica pendente
+        matches = Q()
+        for event in done:
+            matches |= Q(pk=event.pk, received_count=event.received_count)
+        WebhookEvent.objects.filter(matches, claim_token=token, status='processing').update(
+            status='done', claim_token='', last_error='', processed_at=now, updated_at=now
+        )
+    for event in events:
+        if event.pk in errors:
+            logger.error(f"Erro ao processar webhook {event.topic} {event.resource_id}: {errors[event.pk]}")
+            WebhookEvent.objects.filter(pk=event.pk, claim_token=token, status='processing').update(
+                status='failed' if event.attempts >= MAX_ATTEMPTS else 'pending',
+                claim_token='',
+                last_error=errors[event.pk],
+                updated_at=now,
+            )
+    return len(events)
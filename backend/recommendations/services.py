@@ -1,8 +1,10 @@
+from django.db import transaction
 from django.db.models import Count, Q, F
-from django.core.cache import cache
+from core.cache import get_or_compute
 from collections import defaultdict
 from .models import ProductView, ProductRecommendation, UserRecommendation
 from catalog.models import Product
+from catalog.sales import SOLD_STATUSES
 from orders.models import Order, OrderItem
 from datetime import timedelta
 from django.utils import timezone
@@ -23,54 +25,54 @@ class RecommendationEngine:
     @staticmethod
     def get_also_bought(product, limit=6):
         """Produtos frequentemente comprados juntos"""
-        cache_key = f'also_bought_{product.id}'
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
-        # Buscar pedidos que contêm este produto
-        orders_with_product = OrderItem.objects.filter(
-            product=product
-        ).values_list('order_id', flat=True)
-        
-        # Buscar outros produtos nesses pedidos
-        related_products = OrderItem.objects.filter(
-            order_id__in=orders_with_product
-        ).exclude(
-            product=product
-        ).values('product').annotate(
-            count=Count('product')
-        ).order_by('-count')[:limit]
-        
-        product_ids = [item['product'] for item in related_products]
-        products = Product.objects.filter(
-            id__in=product_ids,
-            is_active=True,
-            stock__gt=0
-        )
+        def compute():
+            # Pares pré-calculados por generate_recommendations_batch
+            precomputed = ProductRecommendation.objects.filter(
+                product=product,
+                recommendation_type='also_bought',
+                recommended_product__is_active=True
+            ).select_related('recommended_product').order_by('-score')[:limit]
+            if precomputed:
+                return [rec.recommended_product for rec in precomputed]
+            
+            # Buscar pedidos que contêm este produto
+            orders_with_product = OrderItem.objects.filter(
+                variant__product=product
+            ).values_list('order_id', flat=True)
+            
+            # Buscar outros produtos nesses pedidos
+            related_products = OrderItem.objects.filter(
+                order_id__in=orders_with_product,
+                variant__isnull=False
+            ).exclude(
+                variant__product=product
+            ).values('variant__product_id').annotate(
+                count=Count('id')
+            ).order_by('-count')[:limit]
+            
+            product_ids = [item['variant__product_id'] for item in related_products]
+            return list(Product.objects.filter(
+                id__in=product_ids,
+                is_active=True,
+                variants__stock__gt=0
+            ).distinct())
         
         # Cache por 1 hora
-        cache.set(cache_key, list(products), 3600)
-        return products
+        return get_or_compute(f'also_bought_{product.id}', compute, 3600)
     
     @staticmethod
     def get_related_by_category(product, limit=6):
         """Produtos da mesma categoria"""
-        cache_key = f'related_category_{product.id}'
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
-        products = Product.objects.filter(
-            category=product.category,
-            is_active=True,
-            stock__gt=0
-        ).exclude(
-            id=product.id
-        ).order_by('-created_at')[:limit]
+        def compute():
+            return list(Product.objects.filter(
+                category=product.category,
+                is_active=True,
+                variants__stock__gt=0
+            ).exclude(
+                id=product.id
+            ).distinct().order_by('-created_at')[:limit])
         
-        cache.set(cache_key, list(products), 3600)
-        return products
+        return get_or_compute(f'related_category_{product.id}', compute, 3600)
     
     @staticmethod
     def get_user_recommendations(user, limit=10):
@@ -78,111 +80,145 @@ class RecommendationEngine:
         if not user.is_authenticated:
             return Product.objects.none()
         
-        cache_key = f'user_recommendations_{user.id}'
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
-        # Produtos visualizados recentemente (últimos 30 dias)
-        recent_views = ProductView.objects.filter(
-            user=user,
-            viewed_at__gte=timezone.now() - timedelta(days=30)
-        ).values_list('product_id', flat=True)[:20]
-        
-        # Produtos comprados
-        purchased = OrderItem.objects.filter(
-            order__user=user,
-            order__status='completed'
-        ).values_list('product_id', flat=True)
-        
-        # Buscar produtos relacionados aos visualizados
-        recommendations = []
-        for product_id in recent_views:
-            try:
-                product = Product.objects.get(id=product_id)
-                related = RecommendationEngine.get_also_bought(product, limit=3)
-                recommendations.extend(related)
-            except Product.DoesNotExist:
-                continue
-        
-        # Remover duplicatas e produtos já comprados
-        seen = set()
-        unique_recommendations = []
-        for product in recommendations:
-            if product.id not in seen and product.id not in purchased:
-                seen.add(product.id)
-                unique_recommendations.append(product)
-                if len(unique_recommendations) >= limit:
-                    break
-        
-        # Se não houver recomendações suficientes, adicionar best sellers
-        if len(unique_recommendations) < limit:
-            best_sellers = Product.objects.filter(
-                is_active=True,
-                stock__gt=0
-            ).exclude(
-                id__in=[p.id for p in unique_recommendations]
-            ).exclude(
-                id__in=purchased
-            ).order_by('-created_at')[:limit - len(unique_recommendations)]
+        def compute():
+            # Produtos visualizados recentemente (últimos 30 dias)
+            recent_views = ProductView.objects.filter(
+                user=user,
+                viewed_at__gte=timezone.now() - timedelta(days=30)
+            ).values_list('product_id', flat=True)[:20]
+            
+            # Produtos comprados
+            purchased = set(OrderItem.objects.filter(
+                order__user=user,
+                order__status__in=SOLD_STATUSES,
+                variant__isnull=False
+            ).values_list('variant__product_id', flat=True))
+            
+            # Buscar produtos relacionados aos visualizados
+            recommendations = []
+            for product_id in recent_views:
+                try:
+                    product = Product.objects.get(id=product_id)
+                    related = RecommendationEngine.get_also_bought(product, limit=3)
+                    recommendations.extend(related)
+                except Product.DoesNotExist:
+                    continue
             
-            unique_recommendations.extend(best_sellers)
+            # Remover duplicatas e produtos já comprados
+            seen = set()
+            unique_recommendations = []
+            for product in recommendations:
+                if product.id not in seen and product.id not in purchased:
+                    seen.add(product.id)
+                    unique_recommendations.append(product)
+                    if len(unique_recommendations) >= limit:
+                        break
+            
+            # Se não houver recomendações suficientes, adicionar best sellers
+            if len(unique_recommendations) < limit:
+                best_sellers = Product.objects.filter(
+                    is_active=True,
+                    variants__stock__gt=0
+                ).distinct().exclude(
+                    id__in=[p.id for p in unique_recommendations]
+                ).exclude(
+                    id__in=purchased
+                ).order_by('-created_at')[:limit - len(unique_recommendations)]
+                
+                unique_recommendations.extend(best_sellers)
+            
+            return unique_recommendations
         
-        cache.set(cache_key, unique_recommendations, 1800)  # 30 minutos
-        return unique_recommendations
+        return get_or_compute(f'user_recommendations_{user.id}', compute, 1800)  # 30 minutos
     
     @staticmethod
     def get_trending_products(limit=10):
         """Produtos em alta (mais visualizados nos últimos 7 dias)"""
-        cache_key = 'trending_products'
-        cached = cache.get(cache_key)
-        if cached:
-            return cached
-        
-        seven_days_ago = timezone.now() - timedelta(days=7)
-        trending = ProductView.objects.filter(
-            viewed_at__gte=seven_days_ago
-        ).values('product').annotate(
-            view_count=Count('product')
-        ).order_by('-view_count')[:limit]
-        
-        product_ids = [item['product'] for item in trending]
-        products = Product.objects.filter(
-            id__in=product_ids,
-            is_active=True,
-            stock__gt=0
-        )
+        def compute():
+            seven_days_ago = timezone.now() - timedelta(days=7)
+            trending = ProductView.objects.filter(
+                viewed_at__gte=seven_days_ago
+            ).values('product').annotate(
+                view_count=Count('product')
+            ).order_by('-view_count')[:limit]
+            
+            product_ids = [item['product'] for item in trending]
+            return list(Product.objects.filter(
+                id__in=product_ids,
+                is_active=True,
+                variants__stock__gt=0
+            ).distinct())
         
-        cache.set(cache_key, list(products), 1800)
-        return products
+        return get_or_compute('trending_products', compute, 1800)
     
     @staticmethod
-    def generate_recommendations_batch():
-        """Gera recomendações em lote (executar via Celery task)"""
-        products = Product.objects.filter(is_active=True)
+    def generate_recommendations_batch(limit=10, batch_size=1000):
+        """
+        Gera recomendações em lote (executar via Celery task)
+        
+        - "também compraram": contagem de pedidos em comum para todos os pares
+          de produtos em uma única consulta (self-join de OrderItem por pedido)
+        - "relacionados": produtos mais recentes da mesma categoria, a partir de
+          uma única listagem do catálogo
+        As linhas antigas são trocadas pelas novas em uma só transação.
+        """
+        from catalog.models import ProductVariant
+        
+        products = list(
+            Product.objects.filter(is_active=True)
+            .order_by('category_id', '-created_at', '-id')
+            .values_list('id', 'category_id')
+        )
+        active_ids = {pk for pk, _ in products}
+        in_stock = set(
+            ProductVariant.objects.filter(stock__gt=0, product_id__in=active_ids)
+            .values_list('product_id', flat=True).distinct()
+        )
         
-        for product in products:
-            # Limpar recomendações antigas
-            ProductRecommendation.objects.filter(product=product).delete()
-            
-            # Gerar "também compraram"
-            also_bought = RecommendationEngine.get_also_bought(product, limit=10)
-            for idx, rec_product in enumerate(also_bought):
-                ProductRecommendation.objects.create(
-                    product=product,
-                    recommended_product=rec_product,
+        # Pares (produto, outro produto do mesmo pedido) -> pedidos em comum
+        pairs = (
+            OrderItem.objects.filter(
+                order__status__in=SOLD_STATUSES,
+                variant__isnull=False,
+                order__items__variant__isnull=False,
+            )
+            .values(source=F('variant__product_id'), target=F('order__items__variant__product_id'))
+            .annotate(orders=Count('order_id', distinct=True))
+            .order_by()
+        )
+        also_bought = defaultdict(list)
+        for row in pairs.iterator():
+            source, target = row['source'], row['target']
+            if source != target and source in active_ids and target in in_stock:
+                also_bought[source].append((row['orders'], target))
+        
+        by_category = defaultdict(list)
+        for product_id, category_id in products:
+            if product_id in in_stock:
+                by_category[category_id].append(product_id)
+        
+        rows = []
+        for product_id, category_id in products:
+            ranked = sorted(also_bought.get(product_id, ()), key=lambda item: (-item[0], item[1]))[:limit]
+            for orders, target in ranked:
+                rows.append(ProductRecommendation(
+                    product_id=product_id,
+                    recommended_product_id=target,
                     recommendation_type='also_bought',
-                    score=10 - idx  # Score decrescente
-                )
+                    score=float(orders),
+                ))
             
-            # Gerar "relacionados"
-            related = RecommendationEngine.get_related_by_category(product, limit=10)
-            for idx, rec_product in enumerate(related):
-                ProductRecommendation.objects.create(
-                    product=product,
-                    recommended_product=rec_product,
+            related = [pk for pk in by_category[category_id] if pk != product_id][:limit]
+            for idx, target in enumerate(related):
+                rows.append(ProductRecommendation(
+                    product_id=product_id,
+                    recommended_product_id=target,
                     recommendation_type='related',
-                    score=10 - idx
-                )
+                    score=limit - idx,  # Score decrescente
+                ))
+        
+        with transaction.atomic():
+            ProductRecommendation.objects.filter(recommendation_type__in=['also_bought', 'related']).delete()
+            ProductRecommendation.objects.bulk_create(rows, batch_size=batch_size)
         
-        return f"Geradas recomendações para {products.count()} produtos"
+        return f"Geradas recomendações para {len(products)} produtos ({len(rows)} linhas)"
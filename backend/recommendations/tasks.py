@@ -0,0 +1,9 @@
+from celery import shared_task
+
+from .services import RecommendationEngine
+
+
+@shared_task
+def generate_recommendations_batch():
+    """Regenera as recomendações pré-calculadas (ProductRecommendation)"""
+    return RecommendationEngine.generate_recommendations_batch()
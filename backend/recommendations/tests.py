@@ -0,0 +1,82 @@
+import shutil
+import tempfile
+
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+
+from catalog.models import Category, Product, ProductVariant
+from catalog.testing import CatalogTestCase
+from orders.models import Order, OrderItem
+
+from .models import ProductRecommendation
+from .services import RecommendationEngine
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecommendationBatchTests(CatalogTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.shirts = Category.objects.create(name='Camisas', slug='camisas')
+        self.pants = Category.objects.create(name='Calças', slug='calcas')
+        self.social = self.product('Camisa Social', self.shirts)
+        self.polo = self.product('Camisa Polo', self.shirts)
+        self.linen = self.product('Camisa Linho', self.shirts)
+        self.sold_out = self.product('Camisa Esgotada', self.shirts, stock=0)
+        self.chino = self.product('Calça Chino', self.pants)
+
+        self.order('paid', self.social, self.polo)
+        self.order('delivered', self.social, self.polo, self.linen)
+        self.order('pending', self.social, self.linen)  # não vendido: fica de fora
+        self.order('paid', self.social, self.sold_out)  # sem estoque: não é recomendado
+
+    def product(self, name, category, stock=5):
+        product = Product.objects.create(category=category, name=name, slug=name.lower().replace(' ', '-'), base_price='100.00')
+        ProductVariant.objects.create(product=product, sku=f'{product.slug}-M', size='M', stock=stock)
+        return product
+
+    def order(self, status, *products):
+        order = Order.objects.create(status=status)
+        for product in products:
+            OrderItem.objects.create(
+                order=order, variant=product.variants.get(), product_name=product.name, unit_price='100.00',
+            )
+        return order
+
+    def recommended(self, product, kind):
+        return list(
+            ProductRecommendation.objects.filter(product=product, recommendation_type=kind)
+            .order_by('-score', 'recommended_product_id')
+            .values_list('recommended_product_id', 'score')
+        )
+
+    def test_pairs_are_counted_per_sold_order(self):
+        ProductRecommendation.objects.create(
+            product=self.social, recommended_product=self.chino, recommendation_type='also_bought', score=99,
+        )
+        RecommendationEngine.generate_recommendations_batch()
+
+        self.assertEqual(self.recommended(self.social, 'also_bought'), [(self.polo.id, 2.0), (self.linen.id, 1.0)])
+        self.assertEqual(self.recommended(self.linen, 'also_bought'), [(self.social.id, 1.0), (self.polo.id, 1.0)])
+        self.assertEqual(self.recommended(self.chino, 'also_bought'), [])
+        # Relacionados: mesma categoria, com estoque, mais recentes primeiro
+        self.assertEqual(
+            [pk for pk, _ in self.recommended(self.social, 'related')], [self.linen.id, self.polo.id],
+        )
+        self.assertEqual(self.recommended(self.chino, 'related'), [])
+
+    def test_query_count_does_not_grow_with_the_catalog(self):
+        with CaptureQueriesContext(connection) as before:
+            RecommendationEngine.generate_recommendations_batch()
+        for i in range(5):
+            extra = self.product(f'Calça Sarja {i}', self.pants)
+            self.order('paid', extra, self.chino)
+        with CaptureQueriesContext(connection) as after:
+            RecommendationEngine.generate_recommendations_batch()
+        self.assertEqual(len(after), len(before))
+        self.assertEqual(len(self.recommended(self.chino, 'also_bought')), 5)
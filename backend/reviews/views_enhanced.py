@@ -7,7 +7,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.db.models import Count, Avg, Q
 from .models import Review, ReviewVote
-from django.core.cache import cache
+from core.cache import get_or_compute
 
 
 @api_view(['POST'])
@@ -98,59 +98,55 @@ def review_stats(request, product_id):
     """
     Estatísticas de reviews de um produto
     """
-    cache_key = f'review_stats_{product_id}'
-    cached_data = cache.get(cache_key)
-    
-    if cached_data:
-        return Response(cached_data)
-    
-    reviews = Review.objects.filter(
-        product_id=product_id,
-        approved=True
-    )
-    
-    # Calcular estatísticas
-    total_reviews = reviews.count()
-    
-    if total_reviews == 0:
-        stats = {
-            'total_reviews': 0,
-            'average_rating': 0,
-            'rating_distribution': {
-                '5': 0, '4': 0, '3': 0, '2': 0, '1': 0
-            },
-            'percentage_distribution': {
-                '5': 0, '4': 0, '3': 0, '2': 0, '1': 0
+    def compute():
+        reviews = Review.objects.filter(
+            product_id=product_id,
+            approved=True
+        )
+        
+        # Calcular estatísticas
+        total_reviews = reviews.count()
+        
+        if total_reviews == 0:
+            stats = {
+                'total_reviews': 0,
+                'average_rating': 0,
+                'rating_distribution': {
+                    '5': 0, '4': 0, '3': 0, '2': 0, '1': 0
+                },
+                'percentage_distribution': {
+                    '5': 0, '4': 0, '3': 0, '2': 0, '1': 0
+                }
             }
-        }
-    else:
-        avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+        else:
+            avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
         
-        # Distribuição por estrelas
-        rating_counts = reviews.values('rating').annotate(
-            count=Count('rating')
-        ).order_by('-rating')
+            # Distribuição por estrelas
+            rating_counts = reviews.values('rating').annotate(
+                count=Count('rating')
+            ).order_by('-rating')
         
-        distribution = {str(i): 0 for i in range(1, 6)}
-        for item in rating_counts:
-            distribution[str(item['rating'])] = item['count']
+            distribution = {str(i): 0 for i in range(1, 6)}
+            for item in rating_counts:
+                distribution[str(item['rating'])] = item['count']
         
-        # Calcular percentuais
-        percentage_dist = {
-            star: (count / total_reviews * 100) 
-            for star, count in distribution.items()
-        }
+            # Calcular percentuais
+            percentage_dist = {
+                star: (count / total_reviews * 100) 
+                for star, count in distribution.items()
+            }
         
-        stats = {
-            'total_reviews': total_reviews,
-            'average_rating': round(avg_rating, 2),
-            'rating_distribution': distribution,
-            'percentage_distribution': {
-                k: round(v, 1) for k, v in percentage_dist.items()
+            stats = {
+                'total_reviews': total_reviews,
+                'average_rating': round(avg_rating, 2),
+                'rating_distribution': distribution,
+                'percentage_distribution': {
+                    k: round(v, 1) for k, v in percentage_dist.items()
+                }
             }
-        }
+        return stats
     
-    cache.set(cache_key, stats, 300)  # Cache por 5 minutos
+    stats = get_or_compute(f'review_stats_{product_id}', compute, 300)  # Cache por 5 minutos
     return Response(stats)
 
 
@@ -0,0 +1,237 @@
+"""
+Cotações do Melhor Envio com cache
+
+Cotações para a mesma origem, CEP de destino e pacote quase não mudam em
+algumas horas, então a chave do cache é normalizada:
+
+- CEP de destino (só dígitos) — e também o prefixo de 5 dígitos, usado como
+  estimativa enquanto o CEP exato ainda não foi cotado;
+- perfil do pacote: peso arredondado para cima em passos de WEIGHT_STEP_KG,
+  dimensões em passos de DIMENSION_STEP_CM, itens iguais somados. A
+  cotação é feita com o perfil arredondado (nunca abaixo do real), então o
+  valor em cache vale para qualquer carrinho com o mesmo perfil.
+
+Entradas com mais de SHIPPING_QUOTE_REFRESH_AFTER segundos continuam sendo
+servidas e são renovadas em segundo plano; expiram de vez em
+SHIPPING_QUOTE_CACHE_TTL. Onde a renovação roda (SHIPPING_QUOTE_REFRESH):
+'thread' (padrão; o deploy só tem o gunicorn), 'celery' (tarefa
+shipping.tasks.refresh_shipping_quote, com o mesmo plano B de thread se o
+broker estiver fora) ou 'sync'. O preço cacheado é o do Melhor Envio, antes da
+regra de frete grátis (que depende do valor do carrinho).
+
+Contadores de hit/miss em stats().
+"""
+import hashlib
+import json
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from core.celery import try_apply_async
+from core.http import get_client
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'shipping:quote'
+STATS_KEY = 'shipping:quote:stats'
+STATS = ('hit', 'stale', 'prefix', 'miss')
+WEIGHT_STEP_KG = 0.1
+DIMENSION_STEP_CM = 5
+
+
+class QuoteUnavailable(Exception):
+    """Melhor Envio fora do ar, lento ou com o circuito aberto"""
+
+
+class QuoteError(Exception):
+    """Melhor Envio recusou a cotação (4xx)"""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"Melhor Envio {status_code}")
+        self.status_code = status_code
+        self.text = text
+
+
+def normalize_cep(cep: str) -> str:
+    return ''.join(ch for ch in str(cep or '') if ch.isdigit())
+
+
+def _step_up(value, step):
+    return round(math.ceil(round(value / step, 6)) * step, 3)
+
+
+def package_profile(products):
+    """Produtos no formato do Melhor Envio -> perfil arredondado (itens iguais somados)"""
+    totals = {}
+    for product in products:
+        dims = (
+            _step_up(float(product['weight']), WEIGHT_STEP_KG),
+            int(_step_up(product['height'], DIMENSION_STEP_CM)),
+            int(_step_up(product['width'], DIMENSION_STEP_CM)),
+            int(_step_up(product['length'], DIMENSION_STEP_CM)),
+        )
+        totals[dims] = totals.get(dims, 0) + int(product['quantity'])
+    return sorted(dims + (quantity,) for dims, quantity in totals.items())
+
+
+def _keys(origin_zip, dest_zip, profile):
+    digest = hashlib.md5(json.dumps(profile).encode()).hexdigest()
+    origin = normalize_cep(origin_zip)
+    dest = normalize_cep(dest_zip)
+    return f'{KEY_PREFIX}:{origin}:{dest}:{digest}', f'{KEY_PREFIX}:{origin}:p{dest[:5]}:{digest}'
+
+
+def fetch_quotes(origin_zip, dest_zip, profile, token):
+    """Consulta o Melhor Envio com o perfil do pacote e normaliza a resposta"""
+    url = f"{settings.MELHORENVIO_API_BASE}/api/v2/me/shipment/calculate"
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'Accept': 'application/json',
+        'Content-Type': 'application/json',
+    }
+    payload = {
+        'from': {'postal_code': normalize_cep(origin_zip)},
+        'to': {'postal_code': normalize_cep(dest_zip)},
+        'products': [
+            {'id': str(idx), 'weight': weight, 'height': height, 'width': width, 'length': length, 'quantity': quantity}
+            for idx, (weight, height, width, length, quantity) in enumerate(profile, 1)
+        ],
+        'options': {
+            'receipt': False,
+            'own_hand': False,
+            'non_commercial': True,
+            'reverse': False,
+            'insurance_value': 0,
+        },
+        # 'services': ''  # empty = return all available
+    }
+
+    # O cálculo só lê dados: pode ser repetido com segurança
+    try:
+        resp = get_client('melhor_envio').post(url, json=payload, headers=headers, retry=True)
+    except Exception as e:
+        raise QuoteUnavailable(str(e)) from e
+    if resp.status_code >= 500 or resp.status_code == 429:
+        raise QuoteUnavailable(f"Melhor Envio {resp.status_code}")
+    if resp.status_code >= 400:
+        raise QuoteError(resp.status_code, resp.text)
+
+    quotes = []
+    for opt in resp.json():
+        quotes.append({
+            'service_id': opt.get('id'),
+            'service_name': opt.get('name'),
+            'carrier': (opt.get('company') or {}).get('name'),
+            'carrier_logo': (opt.get('company') or {}).get('picture'),
+            'price': float(opt.get('price') or opt.get('custom_price') or 0),
+            'delivery_time': (opt.get('delivery_time') or {}).get('days') or opt.get('delivery_range') or None,
+        })
+    return quotes
+
+
+def _count(stat):
+    key = f'{STATS_KEY}:{stat}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def stats():
+    counts = cache.get_many([f'{STATS_KEY}:{stat}' for stat in STATS])
+    result = {stat: counts.get(f'{STATS_KEY}:{stat}', 0) for stat in STATS}
+    total = sum(result.values())
+    result['hit_rate'] = round((total - result['miss']) / total, 3) if total else None
+    return result
+
+
+def store(origin_zip, dest_zip, profile, quotes):
+    exact_key, prefix_key = _keys(origin_zip, dest_zip, profile)
+    entry = {'quotes': quotes, 'fetched_at': time.time()}
+    ttl = getattr(settings, 'SHIPPING_QUOTE_CACHE_TTL', 6 * 3600)
+    cache.set_many({exact_key: entry, prefix_key: entry}, ttl)
+
+
+def refresh(origin_zip, dest_zip, profile, token=None):
+    """Cota de novo e grava no cache (usado pela tarefa em segundo plano)"""
+    if token is None:
+        from .views import _get_bearer_token
+        token = _get_bearer_token()
+    if not token:
+        return None
+    quotes = fetch_quotes(origin_zip, dest_zip, profile, token)
+    store(origin_zip, dest_zip, profile, quotes)
+    return quotes
+
+
+def refresh_quietly(origin_zip, dest_zip, profile):
+    """refresh() para segundo plano: falhas mantêm a entrada antiga. Retorna True se renovou."""
+    try:
+        return refresh(origin_zip, dest_zip, profile) is not None
+    except (QuoteUnavailable, QuoteError):
+        # A próxima leitura tenta de novo (depois do lock de renovação)
+        return False
+    except Exception as e:
+        logger.warning(f"Shipping quote refresh failed: {e}")
+        return False
+
+
+def _run_thread(origin_zip, dest_zip, profile):
+    try:
+        refresh_quietly(origin_zip, dest_zip, profile)
+    finally:
+        connection.close()
+
+
+def _schedule_refresh(origin_zip, dest_zip, profile):
+    exact_key, _ = _keys(origin_zip, dest_zip, profile)
+    # Uma renovação por chave de cada vez
+    if not cache.add(f'{exact_key}:refreshing', 1, 60):
+        return
+    mode = getattr(settings, 'SHIPPING_QUOTE_REFRESH', 'thread')
+    if mode == 'sync':
+        refresh_quietly(origin_zip, dest_zip, profile)
+        return
+    if mode == 'celery':
+        from .tasks import refresh_shipping_quote
+        if try_apply_async(refresh_shipping_quote, (origin_zip, dest_zip, profile)):
+            return
+    threading.Thread(target=_run_thread, args=(origin_zip, dest_zip, profile), daemon=True).start()
+
+
+def get_quotes(origin_zip, dest_zip, products, token):
+    """
+    Retorna (cotações, estimada). estimada=True quando a resposta veio do
+    prefixo do CEP. Levanta QuoteUnavailable / QuoteError quando não há
+    nada em cache e o Melhor Envio falha.
+    """
+    profile = package_profile(products)
+    exact_key, prefix_key = _keys(origin_zip, dest_zip, profile)
+    entries = cache.get_many([exact_key, prefix_key])
+    refresh_after = getattr(settings, 'SHIPPING_QUOTE_REFRESH_AFTER', 3600)
+
+    entry = entries.get(exact_key)
+    if entry is not None:
+        if time.time() - entry['fetched_at'] > refresh_after:
+            _count('stale')
+            _schedule_refresh(origin_zip, dest_zip, profile)
+        else:
+            _count('hit')
+        return entry['quotes'], False
+
+    entry = entries.get(prefix_key)
+    if entry is not None and getattr(settings, 'SHIPPING_QUOTE_PREFIX_ESTIMATES', True):
+        _count('prefix')
+        _schedule_refresh(origin_zip, dest_zip, profile)
+        return entry['quotes'], True
+
+    _count('miss')
+    quotes = fetch_quotes(origin_zip, dest_zip, profile, token)
+    store(origin_zip, dest_zip, profile, quotes)
+    return quotes, False
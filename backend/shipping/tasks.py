@@ -0,0 +1,10 @@
+from celery import shared_task
+
+from .quotes import refresh_quietly
+
+
+@shared_task(ignore_result=True)
+def refresh_shipping_quote(origin_zip, dest_zip, profile):
+    """Renova em segundo plano uma cotação do cache (shipping.quotes)"""
+    # JSON do broker transforma as tuplas do perfil em listas
+    return refresh_quietly(origin_zip, dest_zip, [tuple(p) for p in profile])
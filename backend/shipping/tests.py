@@ -0,0 +1,145 @@
+import json
+from datetime import timedelta
+from unittest import mock
+
+import requests
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.http import CircuitOpen, OutboundClient, get_client
+from .models import CarrierToken
+from .quotes import package_profile, stats as quote_stats
+
+
+def fake_response(status_code, json_data=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = b'[]' if json_data is None else json.dumps(json_data).encode()
+    return response
+
+
+class OutboundClientTests(TestCase):
+    def make_client(self, **config):
+        return OutboundClient('test', **{'backoff': 0, 'failure_threshold': 2, 'reset_timeout': 60, **config})
+
+    def test_retries_transient_errors_then_succeeds(self):
+        client = self.make_client(retries=2, failure_threshold=3)
+        with mock.patch.object(requests.Session, 'request', side_effect=[
+            requests.ConnectionError('reset'), fake_response(503), fake_response(200),
+        ]) as request:
+            response = client.get('https://example.com/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(request.call_count, 3)
+        stats = client.stats()
+        self.assertEqual((stats['requests'], stats['errors'], stats['retries']), (3, 2, 2))
+        self.assertEqual(stats['circuit'], 'closed')
+
+    def test_post_is_not_retried_unless_asked(self):
+        client = self.make_client(retries=2)
+        with mock.patch.object(requests.Session, 'request', return_value=fake_response(503)) as request:
+            self.assertEqual(client.post('https://example.com/').status_code, 503)
+        self.assertEqual(request.call_count, 1)
+
+    def test_circuit_opens_after_consecutive_failures(self):
+        client = self.make_client(retries=0)
+        with mock.patch.object(requests.Session, 'request', side_effect=requests.Timeout('slow')) as request:
+            for _ in range(2):
+                with self.assertRaises(requests.Timeout):
+                    client.get('https://example.com/')
+            with self.assertRaises(CircuitOpen):
+                client.get('https://example.com/')
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(client.stats()['circuit'], 'open')
+        self.assertEqual(client.stats()['short_circuited'], 1)
+
+        # Passado o reset_timeout, uma chamada de teste bem-sucedida fecha o circuito
+        client.breaker.opened_at -= 60
+        with mock.patch.object(requests.Session, 'request', return_value=fake_response(200)):
+            self.assertEqual(client.get('https://example.com/').status_code, 200)
+        self.assertEqual(client.stats()['circuit'], 'closed')
+
+
+@override_settings(MELHORENVIO_API_TOKEN='token')
+class QuoteFallbackTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.body = {'zip_destination': '88058-001', 'items': [{'id': 1, 'qty': 1, 'price': 100}]}
+
+    def test_unavailable_carrier_falls_back_to_estimates(self):
+        with mock.patch.object(get_client('melhor_envio'), 'request', side_effect=CircuitOpen('open')):
+            response = self.client.post('/api/shipping/quote/', self.body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([q['service_name'] for q in response.data['quotes']], ['PAC', 'SEDEX'])
+        self.assertIn('indisponível', response.data['note'])
+
+    def test_bearer_token_is_cached(self):
+        CarrierToken.objects.create(provider='melhor_envio', access_token='oauth-token')
+        quotes = [{'id': 1, 'name': 'PAC', 'company': {'name': 'Correios'}, 'price': '20.00'}]
+        with mock.patch.object(get_client('melhor_envio'), 'request', return_value=fake_response(200, quotes)) as request:
+            self.client.post('/api/shipping/quote/', self.body, format='json')
+            with self.assertNumQueries(0):
+                response = self.client.post('/api/shipping/quote/', self.body, format='json')
+        self.assertEqual(response.data['quotes'][0]['price'], 20.0)
+        self.assertEqual(request.call_args.kwargs['headers']['Authorization'], 'Bearer oauth-token')
+
+    def test_env_fallback_and_failed_refresh_are_cached(self):
+        from .views import _get_bearer_token
+        self.assertEqual(_get_bearer_token(), 'token')
+        with self.assertNumQueries(0):
+            self.assertEqual(_get_bearer_token(), 'token')
+
+        # Token vencido com refresh recusado: não tenta o refresh a cada cotação
+        cache.clear()
+        CarrierToken.objects.create(
+            provider='melhor_envio', access_token='old', refresh_token='refresh',
+            expires_at=timezone.now() - timedelta(minutes=1),
+        )
+        with mock.patch.object(get_client('melhor_envio'), 'post', return_value=fake_response(401)) as post:
+            self.assertEqual(_get_bearer_token(), 'token')
+            self.assertEqual(_get_bearer_token(), 'token')
+        post.assert_called_once()
+
+    @override_settings(MELHORENVIO_API_TOKEN='')
+    def test_missing_token_is_cached(self):
+        from .views import _get_bearer_token
+        self.assertIsNone(_get_bearer_token())
+        with self.assertNumQueries(0):
+            self.assertIsNone(_get_bearer_token())
+
+    def test_quotes_are_cached_by_cep_and_package_profile(self):
+        quotes = [{'id': 1, 'name': 'PAC', 'company': {'name': 'Correios'}, 'price': '20.00'}]
+        # Mesmo perfil: 300g e 280g arredondam para 0.3kg; o produto não entra na chave
+        other = {'zip_destination': '88058001', 'items': [{'id': 7, 'qty': 1, 'price': 50, 'weight_grams': 280}]}
+        with mock.patch.object(get_client('melhor_envio'), 'request', return_value=fake_response(200, quotes)) as request:
+            first = self.client.post('/api/shipping/quote/', self.body, format='json')
+            second = self.client.post('/api/shipping/quote/', other, format='json')
+            with mock.patch('shipping.quotes.threading.Thread') as refresh:
+                nearby = self.client.post('/api/shipping/quote/', {**self.body, 'zip_destination': '88058-999'}, format='json')
+        self.assertEqual(request.call_count, 1)
+        self.assertEqual(first.data['quotes'], second.data['quotes'])
+        self.assertIn('região', nearby.data['note'])
+        refresh.assert_called_once()
+        self.assertEqual(quote_stats(), {'hit': 1, 'stale': 0, 'prefix': 1, 'miss': 1, 'hit_rate': 0.667})
+
+    @override_settings(SHIPPING_QUOTE_REFRESH='celery', SHIPPING_QUOTE_REFRESH_AFTER=0)
+    def test_stale_quote_refresh_falls_back_to_thread_without_broker(self):
+        quotes = [{'id': 1, 'name': 'PAC', 'company': {'name': 'Correios'}, 'price': '20.00'}]
+        with mock.patch.object(get_client('melhor_envio'), 'request', return_value=fake_response(200, quotes)):
+            self.client.post('/api/shipping/quote/', self.body, format='json')
+        with mock.patch('shipping.quotes.try_apply_async', return_value=False), \
+                mock.patch('shipping.quotes.threading.Thread') as thread:
+            self.client.post('/api/shipping/quote/', self.body, format='json')
+            # Renovação em andamento: não dispara outra
+            self.client.post('/api/shipping/quote/', self.body, format='json')
+        thread.assert_called_once()
+        thread.return_value.start.assert_called_once()
+
+    def test_package_profile_rounds_up(self):
+        profile = package_profile([
+            {'weight': 0.31, 'height': 4, 'width': 20, 'length': 31, 'quantity': 1},
+            {'weight': 0.35, 'height': 5, 'width': 18, 'length': 33, 'quantity': 2},
+        ])
+        self.assertEqual(profile, [(0.4, 5, 20, 35, 3)])
@@ -3,6 +3,7 @@ from . import views
 
 urlpatterns = [
     path('quote/', views.quote, name='shipping_quote'),
+    path('quote/cache-stats/', views.quote_cache_stats, name='shipping_quote_cache_stats'),
     path('oauth/start/', views.oauth_start, name='shipping_oauth_start'),
     path('oauth/callback/', views.oauth_callback, name='shipping_oauth_callback'),
 ]
@@ -1,19 +1,19 @@
+import logging
 import requests
 from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import AllowAny
+from rest_framework.permissions import AllowAny, IsAdminUser
 from rest_framework.response import Response
 from rest_framework import status
 from django.conf import settings
+from django.core.cache import cache
 from django.shortcuts import redirect
 from django.utils import timezone
 from datetime import timedelta
+from core.http import get_client
 from .models import CarrierToken
+from .quotes import QuoteError, QuoteUnavailable, get_quotes, stats as quote_stats
 
-
-def _normalize_cep(cep: str) -> str:
-    if not cep:
-        return ''
-    return cep.replace('-', '').replace('.', '').strip()
+logger = logging.getLogger(__name__)
 
 
 def _item_to_product(item):
@@ -34,6 +34,26 @@ def _item_to_product(item):
     }
 
 
+def _estimated_quotes(items):
+    # Valores estimados quando o Melhor Envio não está configurado ou indisponível
+    total_products_value = sum((float(i.get('price') or 0) * int(i.get('qty') or 1)) for i in items)
+    free = settings.SHIPPING_FREE_THRESHOLD and total_products_value >= settings.SHIPPING_FREE_THRESHOLD
+    return [
+        {
+            'service_name': 'PAC',
+            'carrier': 'Correios',
+            'price': 0.0 if free else 15.00,
+            'delivery_time': 10,
+        },
+        {
+            'service_name': 'SEDEX',
+            'carrier': 'Correios',
+            'price': 0.0 if free else 25.00,
+            'delivery_time': 5,
+        },
+    ]
+
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def quote(request):
@@ -44,45 +64,10 @@ def quote(request):
       "zip_destination": "88058-001",
       "items": [{ id, variantId, qty, weight_grams?, length_cm?, width_cm?, height_cm? }]
     }
+    Quotes are cached by destination CEP and package profile (shipping.quotes).
+    Falls back to estimated quotes when Melhor Envio is not configured, fails
+    or its circuit is open (core.http).
     """
-    token = _get_bearer_token()
-    if not token:
-        # Return fallback shipping options when Melhor Envio is not configured
-        origin_zip = settings.SHIPPING_ORIGIN_ZIP
-        dest_zip = request.data.get('zip_destination')
-        items = request.data.get('items') or []
-        
-        if not dest_zip:
-            return Response({'error': 'zip_destination é obrigatório'}, status=status.HTTP_400_BAD_REQUEST)
-        if not isinstance(items, list) or not items:
-            return Response({'error': 'items deve ser uma lista com ao menos 1 item'}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Calculate total value for free shipping threshold
-        total_products_value = sum((float(i.get('price') or 0) * int(i.get('qty') or 1)) for i in items)
-        
-        # Return fallback shipping options
-        fallback_quotes = [
-            {
-                'service_name': 'PAC',
-                'carrier': 'Correios',
-                'price': 0.0 if settings.SHIPPING_FREE_THRESHOLD and total_products_value >= settings.SHIPPING_FREE_THRESHOLD else 15.00,
-                'delivery_time': 10,
-            },
-            {
-                'service_name': 'SEDEX',
-                'carrier': 'Correios',
-                'price': 0.0 if settings.SHIPPING_FREE_THRESHOLD and total_products_value >= settings.SHIPPING_FREE_THRESHOLD else 25.00,
-                'delivery_time': 5,
-            },
-        ]
-        
-        return Response({
-            'origin_zip': origin_zip,
-            'destination_zip': dest_zip,
-            'quotes': fallback_quotes,
-            'note': 'Melhor Envio não configurado. Usando valores estimados.'
-        })
-
     origin_zip = settings.SHIPPING_ORIGIN_ZIP
     dest_zip = request.data.get('zip_destination')
     items = request.data.get('items') or []
@@ -92,48 +77,35 @@ def quote(request):
     if not isinstance(items, list) or not items:
         return Response({'error': 'items deve ser uma lista com ao menos 1 item'}, status=status.HTTP_400_BAD_REQUEST)
 
-    products = [_item_to_product(i) for i in items]
+    token = _get_bearer_token()
+    if not token:
+        return Response({
+            'origin_zip': origin_zip,
+            'destination_zip': dest_zip,
+            'quotes': _estimated_quotes(items),
+            'note': 'Melhor Envio não configurado. Usando valores estimados.'
+        })
 
-    url = f"{settings.MELHORENVIO_API_BASE}/api/v2/me/shipment/calculate"
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
-    }
-    payload = {
-        'from': { 'postal_code': _normalize_cep(origin_zip) },
-        'to': { 'postal_code': _normalize_cep(dest_zip) },
-        'products': products,
-        'options': {
-            'receipt': False,
-            'own_hand': False,
-            'non_commercial': True,
-            'reverse': False,
-            'insurance_value': 0,
-        },
-        # 'services': ''  # empty = return all available
-    }
+    products = [_item_to_product(i) for i in items]
 
+    note = None
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=20)
-    except requests.RequestException as e:
-        return Response({'error': 'Falha ao consultar Melhor Envio', 'details': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
-
-    if resp.status_code >= 400:
-        return Response({'error': 'Erro na API do Melhor Envio', 'status': resp.status_code, 'response': resp.text}, status=status.HTTP_502_BAD_GATEWAY)
-
-    data = resp.json()
-    # Normalize response
-    quotes = []
-    for opt in data:
-        quotes.append({
-            'service_id': opt.get('id'),
-            'service_name': opt.get('name'),
-            'carrier': (opt.get('company') or {}).get('name'),
-            'carrier_logo': (opt.get('company') or {}).get('picture'),
-            'price': float(opt.get('price') or opt.get('custom_price') or 0),
-            'delivery_time': (opt.get('delivery_time') or {}).get('days') or opt.get('delivery_range') or None,
+        quotes, estimated = get_quotes(origin_zip, dest_zip, products, token)
+        if estimated:
+            note = 'Valores estimados para a região do CEP.'
+    except QuoteUnavailable as e:
+        logger.warning(f"Melhor Envio quote failed, using estimates: {e}")
+        return Response({
+            'origin_zip': origin_zip,
+            'destination_zip': dest_zip,
+            'quotes': _estimated_quotes(items),
+            'note': 'Melhor Envio indisponível. Usando valores estimados.'
         })
+    except QuoteError as e:
+        return Response({'error': 'Erro na API do Melhor Envio', 'status': e.status_code, 'response': e.text}, status=status.HTTP_502_BAD_GATEWAY)
+
+    # Cópias: as cotações podem ter vindo do cache
+    quotes = [dict(q) for q in quotes]
 
     # Apply free shipping threshold if configured
     total_products_value = sum((float(i.get('price') or 0) * int(i.get('qty') or 1)) for i in items)
@@ -141,13 +113,28 @@ def quote(request):
         for q in quotes:
             q['price'] = 0.0
 
-    return Response({'origin_zip': origin_zip, 'destination_zip': dest_zip, 'quotes': quotes})
+    data = {'origin_zip': origin_zip, 'destination_zip': dest_zip, 'quotes': quotes}
+    if note:
+        data['note'] = note
+    return Response(data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def quote_cache_stats(request):
+    """Hits/misses do cache de cotações (shipping.quotes)"""
+    return Response(quote_stats())
 
 
 # ====== OAuth helpers & endpoints ======
+TOKEN_CACHE_KEY = 'shipping:melhor_envio:token'
+TOKEN_CACHE_TIMEOUT = 300
+
+
 def _store_token(token_data: dict):
     expires_in = int(token_data.get('expires_in', 0))
     expires_at = timezone.now() + timedelta(seconds=max(0, expires_in - 60)) if expires_in else None
+    cache.delete(TOKEN_CACHE_KEY)
     CarrierToken.objects.update_or_create(
         provider='melhor_envio',
         defaults={
@@ -161,20 +148,41 @@ def _store_token(token_data: dict):
 
 
 def _get_bearer_token() -> str | None:
+    cached = cache.get(TOKEN_CACHE_KEY)
+    if cached is not None:
+        # '' = nenhum token configurado (também cacheado, para não consultar o banco a cada cotação)
+        return cached or None
+    token, timeout = _resolve_token()
+    if timeout > 0:
+        cache.set(TOKEN_CACHE_KEY, token or '', timeout)
+    return token
+
+
+def _token_timeout(ct: CarrierToken) -> int:
+    """Segundos que o token pode ficar no cache: até expirar, no máximo TOKEN_CACHE_TIMEOUT"""
+    if not ct.expires_at:
+        return TOKEN_CACHE_TIMEOUT
+    return min(TOKEN_CACHE_TIMEOUT, int((ct.expires_at - timezone.now()).total_seconds()))
+
+
+def _resolve_token() -> tuple[str | None, int]:
+    """(token, segundos de cache). Sem token OAuth válido, o fallback do env fica
+    TOKEN_CACHE_TIMEOUT no cache: um refresh que falhou só é tentado de novo depois disso."""
     # Prefer OAuth stored token
     try:
         ct = CarrierToken.objects.filter(provider='melhor_envio').first()
         if ct and not ct.is_expired:
-            return ct.access_token
+            return ct.access_token, _token_timeout(ct)
         if ct and ct.refresh_token:
             refreshed = _refresh_token(ct.refresh_token)
             if refreshed:
-                return refreshed
+                ct.refresh_from_db()
+                return refreshed, _token_timeout(ct)
     except Exception:
         pass
     # Fallback to static token from env for development
     env_token = getattr(settings, 'MELHORENVIO_API_TOKEN', '')
-    return env_token or None
+    return env_token or None, TOKEN_CACHE_TIMEOUT
 
 
 def _refresh_token(refresh_token: str) -> str | None:
@@ -186,7 +194,7 @@ def _refresh_token(refresh_token: str) -> str | None:
         'client_secret': settings.MELHORENVIO_CLIENT_SECRET,
     }
     try:
-        resp = requests.post(token_url, data=payload, headers={'Accept': 'application/json'}, timeout=20)
+        resp = get_client('melhor_envio').post(token_url, data=payload, headers={'Accept': 'application/json'})
         if resp.status_code >= 400:
             return None
         data = resp.json()
@@ -229,7 +237,7 @@ def oauth_callback(request):
         'code': code,
     }
     try:
-        resp = requests.post(token_url, data=payload, headers={'Accept': 'application/json'}, timeout=20)
+        resp = get_client('melhor_envio').post(token_url, data=payload, headers={'Accept': 'application/json'})
     except requests.RequestException as e:
         return Response({'error': 'Falha na troca de token', 'details': str(e)}, status=status.HTTP_502_BAD_GATEWAY)
 